@@ -0,0 +1,50 @@
+import uuid
+from datetime import datetime
+from typing import Any, Dict
+from services.services import update_user_context_vector, write_behind
+from .utils import generate_conversation_title, insert_message
+
+# --- Write-Behind Jobs ---
+# Post-response chat work; each handler is safe to run more than once.
+UPDATE_USER_CONTEXT_JOB = "update_user_context"
+SAVE_MESSAGE_JOB = "save_message"
+TOUCH_CONVERSATION_JOB = "touch_conversation"
+GENERATE_TITLE_JOB = "generate_title"
+
+async def _update_user_context(pool, payload: Dict[str, Any]):
+    await update_user_context_vector(
+        pool, payload['user_id'],
+        payload['user_message'], payload['ai_response'],
+        payload['conversation_id'],
+        raise_errors=True,
+        # Outbox rows written before interaction ids existed have none
+        interaction_id=payload.get('interaction_id')
+    )
+
+async def _save_message(pool, payload: Dict[str, Any]):
+    await insert_message(
+        pool, payload['message_id'], payload['conversation_id'], payload['user_id'],
+        payload['content'], payload['role'], datetime.fromisoformat(payload['timestamp'])
+    )
+
+async def _touch_conversation(pool, payload: Dict[str, Any]):
+    async with pool.acquire() as conn:
+        # GREATEST keeps a replayed or late job from moving the timestamp backwards
+        await conn.execute(
+            "UPDATE conversations SET updated_at = GREATEST(updated_at, $1) WHERE id = $2",
+            datetime.fromisoformat(payload['updated_at']), uuid.UUID(payload['conversation_id'])
+        )
+
+async def _generate_title(pool, payload: Dict[str, Any]):
+    title = await generate_conversation_title(payload['first_message'])
+    async with pool.acquire() as conn:
+        # Only replaces the placeholder, never a title the user has set in the meantime
+        await conn.execute(
+            "UPDATE conversations SET title = $1, title_provisional = FALSE WHERE id = $2 AND title_provisional",
+            title, uuid.UUID(payload['conversation_id'])
+        )
+
+write_behind.register_handler(UPDATE_USER_CONTEXT_JOB, _update_user_context)
+write_behind.register_handler(SAVE_MESSAGE_JOB, _save_message)
+write_behind.register_handler(TOUCH_CONVERSATION_JOB, _touch_conversation)
+write_behind.register_handler(GENERATE_TITLE_JOB, _generate_title)
@@ -1,8 +1,10 @@
+import asyncio
 import random
 import json
+import time
 import uuid
 from datetime import datetime
-from typing import List
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple, TypeVar
 from fastapi import Request, HTTPException
 from fastapi.concurrency import run_in_threadpool
 from services.services import (
@@ -11,155 +13,287 @@ from services.services import (
     construct_enhanced_prompt, 
     get_user_memories_vector,
     store_user_memory_vector,
-    update_user_context_vector,
-    call_ai_model_with_fallback
+    call_ai_model_with_fallback,
+    stream_ai_model_with_fallback,
+    scan_text,
+    CHAT_FALLBACK_EMOTIONS,
+    llm_user,
+    write_behind
 )
+from services.metrics import LatencySummary, register_metrics_source
 from auth import User
-from .models import ChatRequest, ChatResponse
+from .models import ChatMessage, ChatRequest, ChatResponse
+from .background_jobs import GENERATE_TITLE_JOB, SAVE_MESSAGE_JOB, TOUCH_CONVERSATION_JOB, UPDATE_USER_CONTEXT_JOB
 from .utils import (
     get_conversation, create_conversation, save_message, 
-    get_conversation_messages, post_process_response
+    get_conversation_messages, post_process_response, IncrementalPostProcessor
 )
 from .config import logger
 
+T = TypeVar("T")
+
+GREETING_MESSAGES = {
+    'hello', 'hi', 'hey', 'hello clario', 'hi clario', 'hey there',
+    'good morning', 'good afternoon', 'good evening'
+}
+
+async def _timed(timings: Dict[str, float], stage: str, awaitable: Awaitable[T]) -> T:
+    """Await one pipeline stage, recording its wall time in milliseconds."""
+    started = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        timings[stage] = round((time.perf_counter() - started) * 1000, 1)
+
+def _stage_error(group: ExceptionGroup) -> Exception:
+    """
+    The error a failed stage group stands for: the HTTPException a stage raised
+    (e.g. the conversation's 404) if there is one, else the first error.
+    """
+    http_errors, _ = group.split(HTTPException)
+    error = http_errors or group
+    while isinstance(error, ExceptionGroup):
+        error = error.exceptions[0]
+    return error
+
+async def _load_conversation(
+    request: Request, 
+    conversation_id: Optional[str], 
+    user_id: str, 
+    first_message: str
+) -> Tuple[str, List[ChatMessage]]:
+    """Stage: resolve (or create) the conversation and load its recent history."""
+    if not conversation_id:
+        # Created under a provisional title; the LLM title is a background job
+        conversation_id, _ = await create_conversation(request, user_id, first_message)
+        return conversation_id, []
+    # The history query is scoped to the user, so it can run alongside the ownership check
+    conversation, chat_history = await asyncio.gather(
+        get_conversation(request, conversation_id, user_id),
+        get_conversation_messages(request, conversation_id, user_id)
+    )
+    if not conversation: 
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    return conversation_id, chat_history
+
+async def _extract_and_store(
+    pool, 
+    user_id: str, 
+    message: str, 
+    conversation: "asyncio.Task[Tuple[str, List[ChatMessage]]]"
+):
+    """Stage: LLM extraction, then the memory write once the conversation row exists."""
+    try:
+        extracted_info = await extract_user_information(message)
+        logger.info(f"Extracted info: {extracted_info}")
+        
+        # Store meaningful information in vector memory
+        if extracted_info.get('has_meaningful_content'):
+            conversation_id, _ = await conversation
+            await store_user_memory_vector(
+                pool, user_id, 
+                message, extracted_info, 
+                conversation_id
+            )
+            logger.info("Stored user information in vector memory")
+    except Exception as extraction_error:
+        logger.error(f"Error in information extraction/storage: {extraction_error}")
+
+async def _retrieve_memories(pool, user_id: str, message: str) -> List[Dict[str, Any]]:
+    """Stage: memories relevant to the message (independent of this turn's extraction)."""
+    try:
+        relevant_memories = await get_user_memories_vector(pool, user_id, message, limit=8)
+        logger.info(f"Retrieved {len(relevant_memories)} relevant memories")
+        return relevant_memories
+    except Exception as retrieval_error:
+        logger.error(f"Error retrieving memories: {retrieval_error}")
+        return []
+
+async def _analyze_sentiment(message: str) -> str:
+    try:
+        return await run_in_threadpool(get_sentiment, message)
+    except Exception as sentiment_error:
+        logger.error(f"Error analyzing sentiment: {sentiment_error}")
+        return "NEUTRAL"
+
+async def _stream_response(
+    prompt: str, 
+    chat_history: List[ChatMessage], 
+    on_delta: Callable[[str], None]
+) -> str:
+    """Stage: stream generation through the incremental post-processor; returns the final text."""
+    processor = IncrementalPostProcessor(chat_history)
+    stream = stream_ai_model_with_fallback(prompt)
+    try:
+        async for chunk in stream:
+            delta = processor.feed(chunk)
+            if delta:
+                on_delta(delta)
+            if processor.complete:
+                # The length rule has already cut the reply; stop paying for tokens
+                break
+    finally:
+        await stream.aclose()
+    delta = processor.finish()
+    if delta:
+        on_delta(delta)
+    return processor.final
+
+def _fallback_response(message: str) -> str:
+    """Contextual canned reply used when generation fails."""
+    scan = scan_text(message)
+    
+    if scan.has("apologize") and scan.has("friend"):
+        return "That sounds tough. What happened between you and your friend? Sometimes it helps to think about both perspectives before deciding whether to apologize."
+    elif scan.has("fight", "argument"):
+        return "Arguments can be really draining. How are you feeling about what happened? Do you want to talk through what led to the conflict?"
+    elif scan.has("friend"):
+        return "Friendship situations can be complicated. What's been going on with your friend that's bothering you?"
+    elif scan.has("work", "job"):
+        return "Work can be stressful. What's happening at your job that's on your mind?"
+    elif scan.has(*CHAT_FALLBACK_EMOTIONS):
+        return "I can hear that you're going through a tough time. What's been weighing on your mind lately?"
+    return "I'm having some technical difficulties right now, but I'm here to listen. Can you tell me more about what's going on?"
+
 async def process_chat_message(
     chat_request: ChatRequest, 
     request: Request, 
-    current_user: User
+    current_user: User,
+    on_delta: Optional[Callable[[str], None]] = None
 ) -> ChatResponse:
+    """
+    Run one chat turn as a stage graph:
+
+        conversation ──> history ──> save user message
+             └──────────────────────> memory store <── extraction
+        history, retrieval, sentiment ──> generation
+
+    Stages that do not depend on each other run concurrently in a TaskGroup,
+    so the turn takes as long as its critical path. With `on_delta`, the reply
+    is streamed and each post-processed piece is passed to it as it is ready.
+    """
+    timings: Dict[str, float] = {}
+    request.state.stage_timings = timings
     try:
         pool = request.app.state.db_pool
-        conversation_id = chat_request.conversation_id
-        chat_history = []
-
-        # Get or create conversation
-        if not conversation_id:
-            conversation_id, _ = await create_conversation(request, current_user['email'], chat_request.message)
-        else:
-            conversation = await get_conversation(request, conversation_id, current_user['email'])
-            if not conversation: 
-                raise HTTPException(status_code=404, detail="Conversation not found")
-            chat_history = await get_conversation_messages(request, conversation_id, current_user['email'])
+        user_id = current_user['email']
+        # Provider rate limits queue this turn's LLM calls (and its tasks') per user
+        llm_user.set(user_id)
+        message = chat_request.message
+        background_jobs = []
 
         # Get user profile
         user_profile_json = current_user.get('user_profile', '{}')
         user_profile = json.loads(user_profile_json) if user_profile_json and user_profile_json.startswith('{') else {}
 
-        # Save user message first
-        await save_message(request, conversation_id, current_user['email'], chat_request.message, "user")
-        
-        # Check if this is a simple greeting with no prior context
-        is_simple_greeting = (
-            len(chat_history) == 0 and 
-            chat_request.message.lower().strip() in [
-                'hello', 'hi', 'hey', 'hello clario', 'hi clario', 'hey there',
-                'good morning', 'good afternoon', 'good evening'
-            ]
-        )
+        # Get or create conversation (and its history)
+        conversation = asyncio.create_task(_timed(
+            timings, "conversation", _load_conversation(request, chat_request.conversation_id, user_id, message)
+        ))
         
-        if is_simple_greeting:
-            greetings = [
-                "Hi! How's it going?",
-                "Hey! What's up?",
-                "Hello! What's on your mind today?",
-                "Hi there! How are you doing?",
-                "Hey! Good to hear from you."
-            ]
-            ai_response = random.choice(greetings)
-        else:
-            # Full processing for substantive messages
-            logger.info(f"Processing message: {chat_request.message}")
-            
-            # Extract and store user information using vector approach
-            try:
-                extracted_info = await extract_user_information(chat_request.message)
-                logger.info(f"Extracted info: {extracted_info}")
-                
-                # Store meaningful information in vector memory
-                if extracted_info.get('has_meaningful_content'):
-                    await store_user_memory_vector(
-                        pool, current_user['email'], 
-                        chat_request.message, extracted_info, 
-                        conversation_id
+        try:
+            async with asyncio.TaskGroup() as stages:
+                def start_message_stages():
+                    return (
+                        stages.create_task(_timed(timings, "extract_and_store", _extract_and_store(pool, user_id, message, conversation))),
+                        stages.create_task(_timed(timings, "retrieval", _retrieve_memories(pool, user_id, message))),
+                        stages.create_task(_timed(timings, "sentiment", _analyze_sentiment(message)))
                     )
-                    logger.info("Stored user information in vector memory")
-                
-                # Retrieve relevant memories using vector similarity
-                relevant_memories = await get_user_memories_vector(
-                    pool, current_user['email'], 
-                    chat_request.message, limit=8
-                )
-                logger.info(f"Retrieved {len(relevant_memories)} relevant memories")
-                
-            except Exception as extraction_error:
-                logger.error(f"Error in information extraction/storage: {extraction_error}")
-                extracted_info = {"has_meaningful_content": False}
-                relevant_memories = []
             
-            # Build conversation context
-            conversation_context = ""
-            if chat_history:
-                conversation_context = "RECENT CONVERSATION:\n"
-                for msg in chat_history[-4:]:
-                    role_label = "You" if msg.role == "user" else "Clario"
-                    conversation_context += f"{role_label}: {msg.content}\n"
+                # A greeting only skips the pipeline in a new conversation, so start it
+                # speculatively for everything else while the conversation loads
+                maybe_greeting = message.lower().strip() in GREETING_MESSAGES
+                message_stages = None if maybe_greeting else start_message_stages()
             
-            # Generate response with enhanced context
-            try:
-                sentiment = await run_in_threadpool(get_sentiment, chat_request.message)
-                
-                final_prompt = construct_enhanced_prompt(
-                    chat_request.message, 
-                    sentiment, 
-                    relevant_memories, 
-                    user_profile, 
-                    chat_history,
-                    has_memories=len(relevant_memories) > 0
-                )
-                
-                # Generate AI response with fallback
-                ai_response = await call_ai_model_with_fallback(final_prompt)
-                
-                # Post-process the response
-                ai_response = post_process_response(ai_response, chat_history)
-                
-            except Exception as ai_error:
-                logger.error(f"Error generating AI response: {ai_error}")
-                # Better contextual fallback responses
-                message_lower = chat_request.message.lower()
-                
-                if "apologize" in message_lower and "friend" in message_lower:
-                    ai_response = "That sounds tough. What happened between you and your friend? Sometimes it helps to think about both perspectives before deciding whether to apologize."
-                elif "fight" in message_lower or "argument" in message_lower:
-                    ai_response = "Arguments can be really draining. How are you feeling about what happened? Do you want to talk through what led to the conflict?"
-                elif "friend" in message_lower:
-                    ai_response = "Friendship situations can be complicated. What's been going on with your friend that's bothering you?"
-                elif "work" in message_lower or "job" in message_lower:
-                    ai_response = "Work can be stressful. What's happening at your job that's on your mind?"
-                elif any(emotion in message_lower for emotion in ["sad", "angry", "frustrated", "upset", "worried"]):
-                    ai_response = "I can hear that you're going through a tough time. What's been weighing on your mind lately?"
+                conversation_id, chat_history = await conversation
+            
+                # Save user message (after the history read, so it is not part of it)
+                stages.create_task(_timed(
+                    timings, "save_user_message", save_message(request, conversation_id, user_id, message, "user")
+                ))
+            
+                # Check if this is a simple greeting with no prior context
+                is_simple_greeting = maybe_greeting and len(chat_history) == 0
+            
+                if is_simple_greeting:
+                    greetings = [
+                        "Hi! How's it going?",
+                        "Hey! What's up?",
+                        "Hello! What's on your mind today?",
+                        "Hi there! How are you doing?",
+                        "Hey! Good to hear from you."
+                    ]
+                    ai_response = random.choice(greetings)
                 else:
-                    ai_response = "I'm having some technical difficulties right now, but I'm here to listen. Can you tell me more about what's going on?"
-
-            # Update user context with the interaction
-            try:
-                await update_user_context_vector(
-                    pool, current_user['email'], 
-                    chat_request.message, ai_response, 
-                    conversation_id
-                )
-            except Exception as context_error:
-                logger.error(f"Error updating user context: {context_error}")
-
-        # Save AI response
-        ai_message_id = await save_message(request, conversation_id, current_user['email'], ai_response, "assistant")
-        
-        # Update conversation timestamp
-        async with pool.acquire() as conn:
-            await conn.execute(
-                "UPDATE conversations SET updated_at = $1 WHERE id = $2", 
-                datetime.utcnow(), uuid.UUID(conversation_id)
-            )
+                    # Full processing for substantive messages
+                    logger.info(f"Processing message: {message}")
+                    _, retrieval, sentiment_task = message_stages or start_message_stages()
+                    relevant_memories = await retrieval
+                    sentiment = await sentiment_task
+                
+                    # Generate response with enhanced context
+                    try:
+                        final_prompt = construct_enhanced_prompt(
+                            message, 
+                            sentiment, 
+                            relevant_memories, 
+                            user_profile, 
+                            chat_history,
+                            has_memories=len(relevant_memories) > 0
+                        )
+                    
+                        if on_delta is not None:
+                            ai_response = await _timed(
+                                timings, "generation", _stream_response(final_prompt, chat_history, on_delta)
+                            )
+                        else:
+                            # Generate AI response with fallback
+                            ai_response = await _timed(timings, "generation", call_ai_model_with_fallback(final_prompt))
+                        
+                            # Post-process the response
+                            ai_response = post_process_response(ai_response, chat_history)
+                    
+                    except Exception as ai_error:
+                        logger.error(f"Error generating AI response: {ai_error}")
+                        ai_response = _fallback_response(message)
+
+                    # Update user context with the interaction (after the response is sent)
+                    background_jobs.append((UPDATE_USER_CONTEXT_JOB, {
+                        'user_id': user_id,
+                        'user_message': message,
+                        'ai_response': ai_response,
+                        'conversation_id': conversation_id,
+                        # Replays of this job find the interaction already recorded
+                        'interaction_id': str(uuid.uuid4())
+                    }))
+                # Leaving the group waits for the user message save and the memory store
+        except ExceptionGroup as group:
+            # Stage errors come back wrapped; re-raise the stage's own exception
+            # so the handlers below map it to the same status as before
+            raise _stage_error(group) from None
+
+        # Save AI response and update the conversation timestamp after the response is sent;
+        # the outbox row makes them durable, the pre-assigned id makes replays no-ops
+        ai_message_id = str(uuid.uuid4())
+        responded_at = datetime.utcnow().isoformat()
+        background_jobs.append((SAVE_MESSAGE_JOB, {
+            'message_id': ai_message_id,
+            'conversation_id': conversation_id,
+            'user_id': user_id,
+            'content': ai_response,
+            'role': "assistant",
+            'timestamp': responded_at
+        }))
+        background_jobs.append((TOUCH_CONVERSATION_JOB, {
+            'conversation_id': conversation_id,
+            'updated_at': responded_at
+        }))
+        if not chat_request.conversation_id:
+            background_jobs.append((GENERATE_TITLE_JOB, {
+                'conversation_id': conversation_id,
+                'first_message': message
+            }))
+        await _timed(timings, "enqueue_background", write_behind.enqueue(pool, background_jobs))
 
         return ChatResponse(
             message=ai_response, 
@@ -167,6 +301,61 @@ async def process_chat_message(
             message_id=ai_message_id
         )
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error processing message: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"Error processing message: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error processing message: {str(e)}")
+
+# --- Streaming ---
+# Request start to the first piece of reply text sent to the client
+_stream_ttft = LatencySummary()
+register_metrics_source("chat_streaming", lambda: {"ttft": _stream_ttft.stats()})
+
+# Turns keep running after a client disconnects so the reply is still saved
+_detached_turns: Set[asyncio.Task] = set()
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def stream_chat_message(
+    chat_request: ChatRequest, 
+    request: Request, 
+    current_user: User
+) -> AsyncIterator[str]:
+    """
+    Server-sent events for one chat turn: `delta` events carry reply text as
+    it is generated, then `done` carries the ChatResponse, whose message is
+    the authoritative final text (or `error` with status and detail).
+    """
+    started = time.perf_counter()
+    events: asyncio.Queue = asyncio.Queue()
+
+    async def run_turn():
+        try:
+            response = await process_chat_message(
+                chat_request, request, current_user,
+                on_delta=lambda text: events.put_nowait(("delta", {"text": text}))
+            )
+            events.put_nowait(("done", response.model_dump()))
+        except HTTPException as e:
+            events.put_nowait(("error", {"status": e.status_code, "detail": e.detail}))
+        except Exception as e:
+            logger.error(f"Error streaming message: {e}", exc_info=True)
+            events.put_nowait(("error", {"status": 500, "detail": f"Error processing message: {str(e)}"}))
+
+    turn = asyncio.create_task(run_turn())
+    _detached_turns.add(turn)
+    turn.add_done_callback(_detached_turns.discard)
+
+    first_delta = True
+    while True:
+        event, data = await events.get()
+        if event == "delta" and first_delta:
+            first_delta = False
+            ttft = time.perf_counter() - started
+            _stream_ttft.record(ttft)
+            request.state.stage_timings["first_token"] = round(ttft * 1000, 1)
+        yield _sse(event, data)
+        if event != "delta":
+            break
@@ -10,14 +10,37 @@ async def get_conversations_service(request: Request, current_user: User) -> Lis
     pool = request.app.state.db_pool
     async with pool.acquire() as conn:
         conversations = await conn.fetch(
-            "SELECT id, user_id, title, created_at, updated_at FROM conversations WHERE user_id = $1 ORDER BY updated_at DESC",
+            """SELECT id, user_id, title, title_provisional, created_at, updated_at 
+               FROM conversations WHERE user_id = $1 ORDER BY updated_at DESC""",
             current_user['email']
         )
     return [Conversation(
         id=str(conv['id']), user_id=conv['user_id'], title=conv['title'],
+        title_provisional=conv['title_provisional'],
         created_at=conv['created_at'], updated_at=conv['updated_at']
     ) for conv in conversations]
 
+async def get_conversation_title_service(
+    conversation_id: str,
+    request: Request,
+    current_user: User
+):
+    """Single-row lookup clients can poll while a conversation's title is provisional."""
+    try:
+        conversation_uuid = uuid.UUID(conversation_id)
+    except ValueError:
+        # A malformed id can never match a conversation
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    pool = request.app.state.db_pool
+    async with pool.acquire() as conn:
+        row = await conn.fetchrow(
+            "SELECT title, title_provisional FROM conversations WHERE id = $1 AND user_id = $2",
+            conversation_uuid, current_user['email']
+        )
+    if not row:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    return {"conversation_id": conversation_id, "title": row['title'], "provisional": row['title_provisional']}
+
 async def get_conversation_history_service(
     conversation_id: str,
     request: Request,
@@ -54,7 +77,7 @@ async def update_conversation_title_service(
     pool = request.app.state.db_pool
     async with pool.acquire() as conn:
         await conn.execute(
-            "UPDATE conversations SET title = $1, updated_at = $2 WHERE id = $3",
+            "UPDATE conversations SET title = $1, title_provisional = FALSE, updated_at = $2 WHERE id = $3",
             title, datetime.utcnow(), uuid.UUID(conversation_id)
         )
     return {"message": "Title updated successfully"}
\ No newline at end of file
@@ -1,7 +1,7 @@
 import uuid
 from typing import List
 from fastapi import Request, HTTPException, status
-from services.services import get_user_memories_vector
+from services.services import get_user_memories_vector, memory_cache
 from auth import User
 from .models import MemoryEntry
 
@@ -44,12 +44,15 @@ async def delete_memory_service(
 ):
     pool = request.app.state.db_pool
     async with pool.acquire() as conn:
-        result = await conn.execute(
-            "DELETE FROM user_memories WHERE user_id = $1 AND metadata->>'temp_id' = $2",
+        deleted = await conn.fetch(
+            """DELETE FROM user_memories WHERE user_id = $1
+               AND (metadata->>'temp_id' = $2 OR metadata @> jsonb_build_object('merged_temp_ids', jsonb_build_array($2::text)))
+               RETURNING id""",
             current_user['email'], memory_id
         )
-        if result.strip() == "DELETE 0":
+        if not deleted:
             raise HTTPException(
                 status_code=404, 
                 detail="Memory not found or you don't have permission to delete it."
-            )
\ No newline at end of file
+            )
+    memory_cache.remove(current_user['email'], [row['id'] for row in deleted])
\ No newline at end of file
@@ -1,17 +1,19 @@
 from fastapi import APIRouter, HTTPException, Depends, status, Request
+from fastapi.responses import StreamingResponse
 from typing import List
 from auth import get_current_user, User
 from .models import (
     ChatRequest, ChatResponse, Conversation, ConversationHistory,
     MemoryEntry, FollowUp, UserProfileUpdateRequest
 )
-from .chat_service import process_chat_message
+from .chat_service import process_chat_message, stream_chat_message
 from .memory_service import (
     get_memories_service, get_memories_by_category_service, delete_memory_service
 )
 from .conversation_service import (
     get_conversations_service, get_conversation_history_service,
-    delete_conversation_service, update_conversation_title_service
+    delete_conversation_service, update_conversation_title_service,
+    get_conversation_title_service
 )
 from .user_context_service import (
     get_user_relationships_service, get_person_details_service,
@@ -31,6 +33,19 @@ async def send_message(
 ):
     return await process_chat_message(chat_request, request, current_user)
 
+@router.post("/chat/stream")
+async def stream_message(
+    chat_request: ChatRequest, 
+    request: Request, 
+    current_user: User = Depends(get_current_user)
+):
+    return StreamingResponse(
+        stream_chat_message(chat_request, request, current_user),
+        media_type="text/event-stream",
+        # Keep proxies from buffering the event stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # --- Memory Management Endpoints ---
 @router.get("/user/memories", response_model=List[MemoryEntry])
 async def get_user_memories(request: Request, current_user: User = Depends(get_current_user)):
@@ -102,6 +117,14 @@ async def delete_conversation(
 ):
     return await delete_conversation_service(conversation_id, request, current_user)
 
+@router.get("/chat/conversations/{conversation_id}/title")
+async def get_conversation_title(
+    conversation_id: str,
+    request: Request,
+    current_user: User = Depends(get_current_user)
+):
+    return await get_conversation_title_service(conversation_id, request, current_user)
+
 @router.post("/chat/conversations/{conversation_id}/title")
 async def update_conversation_title(
     conversation_id: str,
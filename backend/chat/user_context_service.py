@@ -3,7 +3,7 @@ import json
 from datetime import datetime
 from typing import List
 from fastapi import Request, HTTPException
-from services.services import get_user_memories_vector
+from services.services import get_user_memories_vector, get_user_memories_hybrid, memory_cache
 from auth import User
 from .models import FollowUp
 from .config import logger
@@ -31,9 +31,11 @@ async def get_person_details_service(
     current_user: User
 ):
     pool = request.app.state.db_pool
-    memories = await get_user_memories_vector(
+    # Full-text hits on the name, ordered by both keyword and semantic rank
+    memories = await get_user_memories_hybrid(
         pool, current_user['email'], 
-        person_name, limit=15
+        person_name, limit=15,
+        require_text_match=True
     )
     
     person_data = {
@@ -43,15 +45,14 @@ async def get_person_details_service(
     }
     
     for memory in memories:
-        if person_name.lower() in memory['content'].lower():
-            person_data['interactions'].append({
-                "content": memory['content'],
-                "metadata": memory['metadata'],
-                "date": memory['created_at'].isoformat()
-            })
-            
-            if 'conversation_id' in memory['metadata']:
-                person_data['conversations_mentioned'].append(memory['metadata']['conversation_id'])
+        person_data['interactions'].append({
+            "content": memory['content'],
+            "metadata": memory['metadata'],
+            "date": memory['created_at'].isoformat()
+        })
+        
+        if 'conversation_id' in memory['metadata']:
+            person_data['conversations_mentioned'].append(memory['metadata']['conversation_id'])
     
     person_data['conversations_mentioned'] = list(set(person_data['conversations_mentioned']))
     return person_data
@@ -153,6 +154,7 @@ async def reset_user_data_service(
             async with conn.transaction():
                 await conn.execute("DELETE FROM follow_ups WHERE user_id = $1", current_user['email'])
                 await conn.execute("DELETE FROM user_memories WHERE user_id = $1", current_user['email'])
+                await conn.execute("DELETE FROM interaction_ring WHERE user_id = $1", current_user['email'])
                 await conn.execute("DELETE FROM messages WHERE user_id = $1", current_user['email'])
                 await conn.execute("DELETE FROM conversations WHERE user_id = $1", current_user['email'])
                 
@@ -165,6 +167,8 @@ async def reset_user_data_service(
                 
                 logger.info(f"Successfully reset all data for user: {current_user['email']}")
         
+        memory_cache.invalidate(current_user['email'])
+        
         return {"message": "All user data reset successfully. Starting fresh."}
     
     except Exception as e:
@@ -4,8 +4,7 @@ from datetime import datetime
 from typing import List
 from fastapi import Request
 from .models import Conversation, ChatMessage
-import google.generativeai as genai
-import os
+from services.services import scan_text, DRAMATIC_PHRASES, providers, GEMINI_MODEL_NAME
 
 # --- Helper Functions ---
 async def get_conversation(request: Request, conversation_id: str, user_id: str):
@@ -21,36 +20,51 @@ async def get_conversation(request: Request, conversation_id: str, user_id: str)
             return Conversation(**conversation_dict)
         return None
 
-async def create_conversation(request: Request, user_id: str, first_message: str):
-    model = genai.GenerativeModel(os.getenv("GEMINI_MODEL_NAME", "gemini-2.5-flash"))
-    print(os.getenv("GEMINI_MODEL_NAME"))
+def provisional_title(first_message: str) -> str:
+    """Placeholder title from the first few words, used until the generated title lands."""
+    words = first_message.split()[:3]
+    return " ".join(words).title()[:50] or "New Conversation"
+
+async def generate_conversation_title(first_message: str) -> str:
+    model = providers.gemini_model(GEMINI_MODEL_NAME)
     prompt = f"Generate a short, concise title (3-4 words max) for a conversation that starts with: \"{first_message[:100]}\""
-    
-    try:
+    async with providers.track("gemini"):
         response = await model.generate_content_async(prompt)
-        title = response.text.strip().replace('"', '')[:50]
-    except:
-        words = first_message.split()[:3]
-        title = " ".join(words).title()
-    
+    title = response.text.strip().replace('"', '')[:50]
+    if not title:
+        raise ValueError("Empty title from model")
+    return title
+
+async def create_conversation(request: Request, user_id: str, first_message: str):
+    """Create the conversation under a provisional title; the generated title is patched in later."""
+    title = provisional_title(first_message)
     conversation_id = str(uuid.uuid4())
     pool = request.app.state.db_pool
     async with pool.acquire() as conn:
         await conn.execute(
-            "INSERT INTO conversations (id, user_id, title, created_at, updated_at) VALUES ($1, $2, $3, $4, $4)", 
+            """INSERT INTO conversations (id, user_id, title, title_provisional, created_at, updated_at) 
+               VALUES ($1, $2, $3, TRUE, $4, $4)""", 
             uuid.UUID(conversation_id), user_id, title, datetime.utcnow()
         )
     return conversation_id, title
 
 async def save_message(request: Request, conversation_id: str, user_id: str, content: str, role: str):
     message_id = str(uuid.uuid4())
-    pool = request.app.state.db_pool
+    await insert_message(
+        request.app.state.db_pool, message_id, conversation_id, user_id, content, role, datetime.utcnow()
+    )
+    return message_id
+
+async def insert_message(
+    pool, message_id: str, conversation_id: str, user_id: str, content: str, role: str, timestamp: datetime
+):
+    """Insert a message with a pre-assigned id; replays of the same id are no-ops."""
     async with pool.acquire() as conn:
         await conn.execute(
-            "INSERT INTO messages (id, conversation_id, user_id, content, role, timestamp) VALUES ($1, $2, $3, $4, $5, $6)", 
-            uuid.UUID(message_id), uuid.UUID(conversation_id), user_id, content, role, datetime.utcnow()
+            """INSERT INTO messages (id, conversation_id, user_id, content, role, timestamp) 
+               VALUES ($1, $2, $3, $4, $5, $6) ON CONFLICT (id) DO NOTHING""", 
+            uuid.UUID(message_id), uuid.UUID(conversation_id), user_id, content, role, timestamp
         )
-    return message_id
 
 async def get_conversation_messages(request: Request, conversation_id: str, user_id: str, limit: int = 8):
     """Get recent messages for short-term context"""
@@ -76,26 +90,24 @@ async def get_conversation_messages(request: Request, conversation_id: str, user
         timestamp=msg['timestamp']
     ) for msg in messages_raw]
 
+# Case-insensitive removal patterns for the dramatic phrases that are dropped outright
+_DRAMATIC_PHRASE_RES = {phrase: re.compile(re.escape(phrase), re.IGNORECASE) for phrase in DRAMATIC_PHRASES}
+_WHITESPACE_RE = re.compile(r'\s+')
+
 def post_process_response(response: str, chat_history: List[ChatMessage]) -> str:
     """Post-process response to ensure appropriate tone and avoid repetition"""
     
     # Remove overly dramatic phrases
-    dramatic_phrases = [
-        "let's grab coffee", "let's brainstorm", "that's absolutely", "i totally understand",
-        "that sounds incredibly", "wow, that's really", "oh my goodness", "that's so tough",
-        "i can only imagine", "that must be so hard"
-    ]
-    
-    response_lower = response.lower()
-    for phrase in dramatic_phrases:
-        if phrase in response_lower:
+    scan = scan_text(response)
+    for phrase in DRAMATIC_PHRASES:
+        if scan.has(phrase):
             if "grab coffee" in phrase:
                 response = response.replace(phrase, "talk about it")
             elif "brainstorm" in phrase:
                 response = response.replace(phrase, "think through it")
             else:
-                response = re.sub(re.escape(phrase), "", response, flags=re.IGNORECASE)
-                response = re.sub(r'\s+', ' ', response).strip()
+                response = _DRAMATIC_PHRASE_RES[phrase].sub("", response)
+                response = _WHITESPACE_RE.sub(' ', response).strip()
     
     # Avoid repetitive conversation starters
     if chat_history and len(chat_history) > 2:
@@ -118,5 +130,58 @@ def post_process_response(response: str, chat_history: List[ChatMessage]) -> str
     if len(sentences) > 3:
         response = '. '.join(sentences[:2]) + '.'
     
-    response = re.sub(r'\s+', ' ', response).strip()
-    return response
\ No newline at end of file
+    response = _WHITESPACE_RE.sub(' ', response).strip()
+    return response
+
+class IncrementalPostProcessor:
+    """
+    Applies post_process_response to a reply while it streams in.
+
+    Every chunk re-runs the rules over the text so far and releases only the
+    part later text cannot change: nothing until the first word is complete
+    (starter rule), never the last few characters (a dramatic phrase may
+    still be arriving), and nothing past the second sentence until the
+    length rule is settled. `final` always equals post_process_response on
+    the whole reply; in the rare case it does not extend what was released,
+    release stops and callers send `final` as the authoritative text.
+    """
+
+    HOLDBACK = max(len(phrase) for phrase in DRAMATIC_PHRASES)
+
+    def __init__(self, chat_history: List[ChatMessage]):
+        self.chat_history = chat_history
+        self.raw = ""
+        self.emitted = ""
+        self.final = ""
+        # Set once the length rule has cut the reply; the rest of the stream can be dropped
+        self.complete = False
+
+    def feed(self, chunk: str) -> str:
+        """Add a chunk; returns the newly releasable text (possibly empty)."""
+        self.raw += chunk
+        processed = post_process_response(self.raw, self.chat_history)
+        if len(self.raw.split('.')) > 3:
+            self.complete = True
+            self.final = processed
+            return self._release(processed, len(processed))
+        
+        if ' ' not in processed:
+            return ""
+        stable = len(processed) - self.HOLDBACK
+        if processed.count('.') >= 2:
+            second_period = processed.index('.', processed.index('.') + 1)
+            stable = min(stable, second_period + 1)
+        return self._release(processed, stable)
+
+    def finish(self) -> str:
+        """End of stream; returns whatever is left to release."""
+        if not self.complete:
+            self.final = post_process_response(self.raw, self.chat_history)
+        return self._release(self.final, len(self.final))
+
+    def _release(self, processed: str, end: int) -> str:
+        if end <= len(self.emitted) or not processed.startswith(self.emitted):
+            return ""
+        delta = processed[len(self.emitted):end]
+        self.emitted += delta
+        return delta
@@ -36,6 +36,9 @@ class AppConfig:
     # API Keys
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
     
+    # Admin endpoints are disabled unless a token is configured
+    ADMIN_API_TOKEN = os.getenv("ADMIN_API_TOKEN")
+    
     @classmethod
     def get_logger(cls, name: str = __name__) -> logging.Logger:
         """Get a configured logger instance."""
@@ -56,6 +56,10 @@ async def setup_database_schema(pool: asyncpg.Pool):
                 updated_at TIMESTAMPTZ NOT NULL
             );
         """)
+        # Set while the title is still the local placeholder awaiting the generated one
+        await conn.execute("""
+            ALTER TABLE conversations ADD COLUMN IF NOT EXISTS title_provisional BOOLEAN NOT NULL DEFAULT FALSE;
+        """)
 
         # Messages table
         await conn.execute("""
@@ -85,31 +89,30 @@ async def setup_database_schema(pool: asyncpg.Pool):
                 );
             """)
             logger.info("User memories table with vector support created.")
-
-            # Create vector index for user_memories
-            await conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_user_memories_embedding 
-                ON user_memories USING ivfflat (embedding vector_cosine_ops)
-                WITH (lists = 100);
-            """)
-            logger.info("Vector index for user_memories created successfully.")
+            # The ANN index is created and maintained by services.vector_index
 
         except Exception as e:
             logger.warning(f"Vector extension not available: {e}")
-            # Fallback to storing embeddings as JSON text
+            # Fallback to storing embeddings as raw float32/float16 bytes
             await conn.execute("""
                 CREATE TABLE IF NOT EXISTS user_memories (
                     id UUID PRIMARY KEY,
                     user_id TEXT REFERENCES users(email) ON DELETE CASCADE,
                     conversation_id UUID REFERENCES conversations(id) ON DELETE SET NULL,
                     content TEXT NOT NULL,
-                    embedding TEXT,
+                    embedding BYTEA,
                     metadata JSONB,
                     created_at TIMESTAMPTZ NOT NULL,
                     updated_at TIMESTAMPTZ NOT NULL
                 );
             """)
-            logger.info("User memories table with text embedding fallback created.")
+            logger.info("User memories table with binary embedding fallback created.")
+
+        # Full-text column for hybrid (keyword + vector) retrieval; 'simple' keeps names unstemmed
+        await conn.execute("""
+            ALTER TABLE user_memories ADD COLUMN IF NOT EXISTS content_tsv TSVECTOR
+            GENERATED ALWAYS AS (to_tsvector('simple', content)) STORED;
+        """)
 
         # Enhanced structured memories table
         try:
@@ -127,12 +130,6 @@ async def setup_database_schema(pool: asyncpg.Pool):
                 );
             """)
 
-            await conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_structured_memories_embedding 
-                ON structured_memories USING ivfflat (embedding vector_cosine_ops)
-                WITH (lists = 100);
-            """)
-
         except Exception as e:
             logger.warning(f"Structured memories with vector not available: {e}")
             await conn.execute("""
@@ -143,7 +140,7 @@ async def setup_database_schema(pool: asyncpg.Pool):
                     category TEXT NOT NULL,
                     content TEXT NOT NULL,
                     structured_data JSONB,
-                    embedding TEXT,
+                    embedding BYTEA,
                     created_at TIMESTAMPTZ NOT NULL,
                     updated_at TIMESTAMPTZ NOT NULL
                 );
@@ -173,6 +170,59 @@ async def setup_database_schema(pool: asyncpg.Pool):
                 );
             """)
 
+        # Persistent tier of the text-keyed embedding cache
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS embedding_cache (
+                text_hash TEXT PRIMARY KEY,
+                embedding BYTEA NOT NULL,
+                created_at TIMESTAMPTZ NOT NULL
+            );
+        """)
+
+        # Persistent tier of the LLM JSON result cache
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_result_cache (
+                cache_key TEXT PRIMARY KEY,
+                result JSONB NOT NULL,
+                cost_usd DOUBLE PRECISION NOT NULL DEFAULT 0,
+                expires_at TIMESTAMPTZ NOT NULL,
+                created_at TIMESTAMPTZ NOT NULL
+            );
+        """)
+
+        # Head of each user's interaction ring buffer (slot = position % INTERACTION_RING_SIZE)
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS interaction_ring (
+                user_id TEXT PRIMARY KEY REFERENCES users(email) ON DELETE CASCADE,
+                position BIGINT NOT NULL
+            );
+        """)
+
+        # Durable outbox of the write-behind queue (post-response chat work)
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS chat_outbox (
+                id UUID PRIMARY KEY,
+                kind TEXT NOT NULL,
+                payload JSONB NOT NULL,
+                attempts INT NOT NULL DEFAULT 0,
+                available_at TIMESTAMPTZ NOT NULL,
+                created_at TIMESTAMPTZ NOT NULL,
+                last_error TEXT
+            );
+        """)
+
+        # Vector index manager bookkeeping (what each ANN index was built for)
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS vector_index_state (
+                table_name TEXT PRIMARY KEY,
+                index_name TEXT NOT NULL,
+                method TEXT NOT NULL,
+                params JSONB,
+                build_rows BIGINT NOT NULL,
+                built_at TIMESTAMPTZ NOT NULL
+            );
+        """)
+
         # Follow-ups table
         await conn.execute("""
             CREATE TABLE IF NOT EXISTS follow_ups (
@@ -220,6 +270,27 @@ async def _create_indexes(conn):
         """CREATE INDEX IF NOT EXISTS idx_user_memories_user_updated 
            ON user_memories(user_id, updated_at DESC);""",
         
+        # Metadata containment filters (metadata @> '{"type": ...}')
+        """CREATE INDEX IF NOT EXISTS idx_user_memories_metadata 
+           ON user_memories USING gin (metadata jsonb_path_ops);""",
+        
+        # Full-text side of hybrid retrieval
+        """CREATE INDEX IF NOT EXISTS idx_user_memories_content_tsv 
+           ON user_memories USING gin (content_tsv);""",
+        
+        # Hot metadata keys looked up by equality (interaction pruning, deletes)
+        """CREATE INDEX IF NOT EXISTS idx_user_memories_user_type 
+           ON user_memories(user_id, (metadata->>'type'), created_at DESC);""",
+        
+        """CREATE INDEX IF NOT EXISTS idx_user_memories_user_temp_id 
+           ON user_memories(user_id, (metadata->>'temp_id'));""",
+        
+        """CREATE INDEX IF NOT EXISTS idx_user_memories_conversation_id 
+           ON user_memories((metadata->>'conversation_id'));""",
+        
+        """CREATE INDEX IF NOT EXISTS idx_chat_outbox_available 
+           ON chat_outbox(available_at, created_at);""",
+        
         """CREATE INDEX IF NOT EXISTS idx_messages_user_timestamp 
            ON messages(user_id, timestamp DESC);""",
         
@@ -5,6 +5,16 @@ from fastapi import FastAPI
 from config.database import create_database_pool, setup_database_schema
 from config.app import config
 from services.services import _load_sentiment_model, embedding_model
+from services.embeddings import configure_embedding_cache
+from services.llm_cache import configure_llm_cache
+from services.providers import providers
+from services.embedding_batcher import embedding_batcher
+from services.vector_index import vector_index_manager
+from services.memory_consolidation import memory_consolidator
+from services.write_behind import write_behind
+from services.embedding_storage import (
+    detect_embedding_column_types, migrate_text_embeddings_to_binary
+)
 
 logger = config.get_logger(__name__)
 
@@ -23,6 +33,18 @@ async def lifespan(app: FastAPI):
         # Setup database schema
         await setup_database_schema(pool)
         
+        # Convert legacy JSON-text embeddings to the binary format
+        await migrate_text_embeddings_to_binary(pool)
+        await detect_embedding_column_types(pool)
+        
+        # Shared tier of the LLM result cache (if enabled)
+        configure_llm_cache(pool)
+        
+        # Build or re-plan ANN indexes in the background
+        vector_index_manager.start(pool)
+        # Merge near-duplicate memories already stored (if MEMORY_DEDUP_SWEEP_ENABLED)
+        memory_consolidator.start(pool)
+        
     except Exception as e:
         logger.critical(f"Failed during database setup: {e}", exc_info=True)
         raise
@@ -36,6 +58,19 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logger.warning(f"Failed to pre-load ML models: {e}")
 
+    # Embedding requests are served through the batcher, so it must run even if a model failed to pre-load
+    embedding_batcher.start()
+    try:
+        await configure_embedding_cache(app.state.db_pool)
+    except Exception as e:
+        logger.warning(f"Failed to configure the embedding cache: {e}")
+
+    # Long-lived LLM clients with pooled connections
+    providers.start()
+    
+    # Post-response chat work, including anything left in the outbox by the last run
+    write_behind.start(app.state.db_pool)
+
     logger.info("Application startup complete.")
     
     yield
@@ -43,6 +78,14 @@ async def lifespan(app: FastAPI):
     # --- SHUTDOWN ---
     logger.info("Application shutdown: Closing resources...")
     
+    # Drain post-response work first; its handlers need the embedding service and the pool
+    await write_behind.stop()
+    # After the drain, which may still be generating titles
+    await providers.stop()
+    await embedding_batcher.stop()
+    await vector_index_manager.stop()
+    await memory_consolidator.stop()
+    
     if hasattr(app.state, 'db_pool') and app.state.db_pool:
         await app.state.db_pool.close()
         logger.info("Database pool closed.")
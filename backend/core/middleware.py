@@ -1,7 +1,10 @@
-from fastapi import FastAPI
+import time
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from config.app import config
 
+logger = config.get_logger(__name__)
+
 def setup_middleware(app: FastAPI) -> None:
     """Configure all middleware for the application."""
     
@@ -14,5 +17,30 @@ def setup_middleware(app: FastAPI) -> None:
         allow_headers=["*"],
     )
     
+    # Request log with per-stage timings for handlers that record them
+    @app.middleware("http")
+    async def log_stage_timings(request: Request, call_next):
+        started = time.perf_counter()
+        response = await call_next(request)
+        body_iterator = response.body_iterator
+
+        # Logged once the body has been sent: streamed (SSE) replies record their
+        # generation and post-processing stages while the body streams
+        async def log_after_body():
+            try:
+                async for chunk in body_iterator:
+                    yield chunk
+            finally:
+                stage_timings = getattr(request.state, "stage_timings", None)
+                if stage_timings:
+                    elapsed_ms = (time.perf_counter() - started) * 1000
+                    logger.info(
+                        f"{request.method} {request.url.path} {response.status_code} "
+                        f"{elapsed_ms:.1f} ms stages(ms)={stage_timings}"
+                    )
+
+        response.body_iterator = log_after_body()
+        return response
+    
     # Add other middleware here as needed
     # Example: Authentication middleware, rate limiting, etc.
\ No newline at end of file
@@ -1,8 +1,21 @@
-from fastapi import FastAPI
+import secrets
+from typing import Optional
+from fastapi import FastAPI, Header, HTTPException
+
+from config.app import config
 
 # Import routers
 from auth import router as auth_router
 from chat import router as chat_router
+from services.services import collect_metrics
+from services.vector_index import EMBEDDING_TABLES, vector_index_manager
+
+def _require_admin(x_admin_token: Optional[str]) -> None:
+    """Reject admin calls unless ADMIN_API_TOKEN is configured and matches."""
+    if not config.ADMIN_API_TOKEN:
+        raise HTTPException(status_code=404, detail="Not found")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, config.ADMIN_API_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
 
 def setup_routes(app: FastAPI) -> None:
     """Configure all routes for the application."""
@@ -27,5 +40,25 @@ def setup_routes(app: FastAPI) -> None:
             "status": "healthy", 
             "service": "clario-api"
         }
+
+    @app.get("/metrics", tags=["Health"])
+    async def metrics():
+        """In-process performance metrics (caches, queues, providers)."""
+        return collect_metrics()
+
+    @app.get("/admin/vector-indexes", tags=["Admin"])
+    async def vector_index_health(x_admin_token: Optional[str] = Header(None)):
+        """ANN index health per embedding table."""
+        _require_admin(x_admin_token)
+        return await vector_index_manager.health()
+
+    @app.post("/admin/vector-indexes/{table}/rebuild", tags=["Admin"])
+    async def rebuild_vector_index(table: str, x_admin_token: Optional[str] = Header(None)):
+        """Rebuild one table's ANN index concurrently in the background."""
+        _require_admin(x_admin_token)
+        if table not in EMBEDDING_TABLES:
+            raise HTTPException(status_code=404, detail=f"Unknown embedding table: {table}")
+        vector_index_manager.schedule_rebuild(table)
+        return {"status": "scheduled", "table": table}
     
     # Add other route configurations here as needed
\ No newline at end of file
@@ -1,10 +1,16 @@
 # Import all functions for easy access
 from .config import *
 from .sentiment_analysis import *
+from .providers import providers
+from .rate_limiter import llm_user
 from .ai_model_utils import *
 from .fallback_utils import *
+from .text_scanner import scan_text, DRAMATIC_PHRASES, CHAT_FALLBACK_EMOTIONS
 from .information_extraction import *
 from .vector_memory import *
+from .memory_cache import memory_cache
+from .metrics import collect_metrics
+from .write_behind import write_behind
 from .prompt_utils import *
 from .health_check import *
 
@@ -22,14 +28,22 @@ __all__ = [
     'get_sentiment',
     
     # AI Model Utils
+    'providers',
+    'llm_user',
     'call_ai_model_with_fallback',
     'call_ai_for_json_with_fallback',
+    'stream_ai_model_with_fallback',
     
     # Fallback Utils
     'generate_contextual_fallback',
     'create_pattern_based_fallback',
     'create_fallback_structure',
     
+    # Text Scanning
+    'scan_text',
+    'DRAMATIC_PHRASES',
+    'CHAT_FALLBACK_EMOTIONS',
+    
     # Information Extraction
     'extract_user_information',
     'extract_people_from_text_enhanced',
@@ -37,7 +51,15 @@ __all__ = [
     # Vector Memory
     'store_user_memory_vector',
     'get_user_memories_vector',
+    'get_user_memories_hybrid',
     'update_user_context_vector',
+    'memory_cache',
+    
+    # Metrics
+    'collect_metrics',
+    
+    # Write-Behind Queue
+    'write_behind',
     
     # Prompt Utils
     'construct_enhanced_prompt',
@@ -1,212 +1,346 @@
-import logging
-import google.generativeai as genai
+import copy
 import json
 import asyncio
-from typing import Dict, Any
-from .config import logger, openai_client
+import time
+from typing import Dict, Any, AsyncIterator, Awaitable, Callable, Optional, Tuple, TypeVar
+from .config import logger, GEMINI_MODEL_NAME, OPENAI_FALLBACK_MODEL_NAME
 from .fallback_utils import generate_contextual_fallback, create_pattern_based_fallback
-import os
-
-safety_settings = [
-    {
-        "category": "HARM_CATEGORY_HARASSMENT",
-        "threshold": "BLOCK_NONE"
-    },
-    {
-        "category": "HARM_CATEGORY_HATE_SPEECH",
-        "threshold": "BLOCK_NONE"
-    },
-    {
-        "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
-        "threshold": "BLOCK_NONE"
-    },
-    {
-        "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
-        "threshold": "BLOCK_NONE"
+from .llm_cache import llm_cache, llm_cache_key
+from .metrics import LatencySummary, register_metrics_source
+from .providers import providers
+from .provider_router import provider_router, hedge_policy, classify_error, RATE_LIMITED, SWITCH_PROVIDER_ERRORS
+from .rate_limiter import rate_limiters, estimate_tokens, RateLimitExceeded
+from .single_flight import SingleFlight
+
+T = TypeVar("T")
+
+# Error class for an attempt the provider's breaker refused
+UNAVAILABLE = "unavailable"
+
+# Model used for structured (JSON) calls; part of the result cache key
+JSON_MODEL_NAME = "gemini-2.5-flash"
+
+CHAT_SYSTEM_PROMPT = "You are Clario, a helpful and empathetic AI companion. Respond naturally and supportively."
+JSON_SYSTEM_PROMPT = "You are a helpful assistant that responds with valid JSON only. Do not include any text outside the JSON structure."
+
+# --- Provider Calls ---
+def _provider_configured(provider: str) -> bool:
+    return provider != "openai" or providers.openai is not None
+
+async def _gemini_complete(prompt: str, model_name: str, profile: str) -> Optional[str]:
+    model = providers.gemini_model(model_name, profile)
+    async with providers.track("gemini"):
+        response = await model.generate_content_async(prompt)
+    if not response.parts:
+        logger.warning(f"Gemini returned empty response. Finish reason: {response.prompt_feedback}")
+        return None
+    return response.text.strip()
+
+async def _openai_complete(prompt: str, system_prompt: str, max_tokens: int, temperature: float) -> Optional[str]:
+    async with providers.track("openai"):
+        response = await providers.openai.chat.completions.create(
+            model=OPENAI_FALLBACK_MODEL_NAME,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=max_tokens,
+            temperature=temperature,
+            timeout=30.0
+        )
+    if response.choices and response.choices[0].message.content:
+        return response.choices[0].message.content.strip()
+    logger.warning("OpenAI returned empty response")
+    return None
+
+def _chat_completion(provider: str, prompt: str) -> Awaitable[Optional[str]]:
+    if provider == "gemini":
+        return _gemini_complete(prompt, GEMINI_MODEL_NAME, "chat")
+    return _openai_complete(prompt, CHAT_SYSTEM_PROMPT, 500, 0.7)
+
+def _json_completion(provider: str, prompt: str) -> Awaitable[Optional[str]]:
+    if provider == "gemini":
+        return _gemini_complete(prompt, JSON_MODEL_NAME, "json")
+    return _openai_complete(prompt, JSON_SYSTEM_PROMPT, 1000, 0.3)
+
+# Model and output cap of each kind of call, per provider: the rate limiter's key and TPM estimate
+_CALL_LIMITS = {
+    "chat": ({"gemini": GEMINI_MODEL_NAME, "openai": OPENAI_FALLBACK_MODEL_NAME}, 500),
+    "JSON": ({"gemini": JSON_MODEL_NAME, "openai": OPENAI_FALLBACK_MODEL_NAME}, 1000)
+}
+
+async def _admit(provider: str, label: str, prompt: str) -> bool:
+    """Wait for room under the provider/model rate limits; False if the call was turned away."""
+    models, max_output_tokens = _CALL_LIMITS[label]
+    try:
+        await rate_limiters.get(provider, models[provider]).acquire(estimate_tokens(prompt, max_output_tokens))
+        return True
+    except RateLimitExceeded as e:
+        logger.warning(f"{provider} {label} call not sent: {e}")
+        return False
+
+def _parse_json(text: str) -> Optional[Dict[str, Any]]:
+    cleaned_response = text
+    # Clean up the response
+    if "```json" in cleaned_response:
+        cleaned_response = cleaned_response.split("```json")[1].split("```")[0]
+    elif "```" in cleaned_response:
+        cleaned_response = cleaned_response.split("```")[1].split("```")[0]
+    cleaned_response = cleaned_response.strip()
+    try:
+        return json.loads(cleaned_response)
+    except json.JSONDecodeError as json_error:
+        logger.error(f"JSON decode error: {json_error}")
+        logger.error(f"Raw response was: {cleaned_response[:200]}")
+        return None
+
+async def _attempt(
+    provider: str,
+    label: str,
+    prompt: str,
+    completion: Callable[[str, str], Awaitable[Optional[str]]],
+    parse: Callable[[str], Optional[T]],
+    attempt: int
+) -> Tuple[Optional[T], Optional[str]]:
+    """
+    One call to `provider` through its rate limiter and breaker. Returns the
+    parsed result (None if unusable) and the error class: UNAVAILABLE if the
+    breaker refused the call, RATE_LIMITED if the rate limiter did.
+    """
+    breaker = provider_router.breaker(provider)
+    if not breaker.available():
+        return None, UNAVAILABLE
+    # Over the client-side limit: treated like a 429, without counting against the breaker
+    if not await _admit(provider, label, prompt):
+        return None, RATE_LIMITED
+    if not breaker.acquire():
+        return None, UNAVAILABLE
+    logger.info(f"Attempting {provider} {label} call (attempt {attempt + 1})")
+    started = time.perf_counter()
+    try:
+        text = await completion(provider, prompt)
+    except asyncio.CancelledError:
+        breaker.release()
+        raise
+    except Exception as e:
+        error_class = classify_error(e)
+        breaker.record_failure(error_class, time.perf_counter() - started)
+        logger.warning(f"{provider} {label} attempt {attempt + 1} failed ({error_class}): {e}")
+        return None, error_class
+    # The provider answered; whether the answer is usable is not a health signal
+    breaker.record_success(time.perf_counter() - started)
+    result = parse(text) if text else None
+    if result is not None:
+        logger.info(f"{provider} {label} call successful")
+    return result, None
+
+async def _hedged(
+    primary: str,
+    secondary: str,
+    label: str,
+    prompt: str,
+    completion: Callable[[str, str], Awaitable[Optional[str]]],
+    parse: Callable[[str], Optional[T]],
+    outcomes: Dict[str, Optional[str]]
+) -> Optional[T]:
+    """
+    First attempt on `primary`; if it has not answered within its recent latency
+    percentile (and the hedge budget allows), the same prompt also goes to
+    `secondary`. The first usable answer wins and the other call is cancelled.
+    Each provider's error class (None for an unusable answer) goes into `outcomes`.
+    """
+    tasks: Dict[asyncio.Task, str] = {
+        asyncio.create_task(_attempt(primary, label, prompt, completion, parse, 0)): primary
     }
-]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=hedge_policy.delay(provider_router.breaker(primary)))
+        if not done and provider_router.breaker(secondary).available() and hedge_policy.try_spend():
+            logger.info(f"{primary} {label} call is slow; hedging to {secondary}")
+            tasks[asyncio.create_task(_attempt(secondary, label, prompt, completion, parse, 0))] = secondary
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                result, error_class = task.result()
+                outcomes[tasks[task]] = error_class
+                if result is not None:
+                    if tasks[task] == secondary:
+                        hedge_policy.hedge_wins += 1
+                    return result
+        return None
+    finally:
+        # The loser is cancelled, not awaited; its breaker slot is released on cancellation
+        for task in tasks:
+            if not task.done():
+                task.cancel()
 
-# --- AI Model Utilities with Fallback ---
-async def call_ai_model_with_fallback(prompt: str, max_retries: int = 2) -> str:
-    """Calls Gemini first, then falls back to OpenAI with better error handling."""
-    
-    # Try Gemini first with better error handling
-    for attempt in range(max_retries):
-        try:
-            logger.info(f"Attempting Gemini call (attempt {attempt + 1})")
-            model = genai.GenerativeModel(os.getenv("GEMINI_MODEL_NAME", "gemini-2.5-flash"))
-            
-            # Configure generation to be more reliable
-            generation_config = genai.types.GenerationConfig(
-                temperature=0.7,
-                max_output_tokens=500,
-                top_p=0.8,
-                top_k=40
-            )
-            
-            response = await model.generate_content_async(
-                prompt, 
-                generation_config=generation_config,
-                safety_settings=safety_settings
-            )
-            
-            # Better response validation
-            if response.parts:
-                logger.info("Gemini call successful")
-                return response.text.strip()
-            else:
-                logger.warning(f"Gemini returned empty response on attempt {attempt + 1}. Finish reason: {response.prompt_feedback}")
-                if attempt < max_retries - 1:
-                    await asyncio.sleep(2 ** attempt)  # Exponential backoff
-                    continue
-                else:
-                    break
-                    
-        except Exception as e:
-            logger.warning(f"Gemini attempt {attempt + 1} failed: {e}")
-            
-            error_str = str(e).lower()
-            rate_limit_indicators = [
-                'rate limit', 'quota exceeded', 'too many requests', 
-                'resource_exhausted', '429', 'quota', 'limit exceeded',
-                'internal error', '500'
-            ]
-            
-            if any(indicator in error_str for indicator in rate_limit_indicators):
-                logger.warning("Rate limit or server error detected, switching to OpenAI immediately")
+async def _route(
+    label: str,
+    prompt: str,
+    completion: Callable[[str, str], Awaitable[Optional[str]]],
+    parse: Callable[[str], Optional[T]],
+    max_retries: int,
+    hedge: bool = False
+) -> Optional[T]:
+    """
+    Try providers in the router's order. Provider-health errors move straight
+    on to the next provider; empty or unparsable answers and unrecognized
+    errors are retried on the same provider up to `max_retries` times.
+    With `hedge`, the first attempt may race the first two providers.
+    Returns None when no provider produced a usable answer.
+    """
+    candidates = provider_router.candidates(_provider_configured)
+    # Error class of each provider's hedged attempt, which counts as its first attempt
+    outcomes: Dict[str, Optional[str]] = {}
+    if hedge and len(candidates) > 1 and max_retries > 0:
+        result = await _hedged(candidates[0], candidates[1], label, prompt, completion, parse, outcomes)
+        if result is not None:
+            return result
+
+    for provider in candidates:
+        if provider in outcomes and outcomes[provider] in SWITCH_PROVIDER_ERRORS + (UNAVAILABLE,):
+            continue
+        for attempt in range(1 if provider in outcomes else 0, max_retries):
+            result, error_class = await _attempt(provider, label, prompt, completion, parse, attempt)
+            if result is not None:
+                return result
+            if error_class in SWITCH_PROVIDER_ERRORS + (UNAVAILABLE,):
                 break
-            
-            if attempt < max_retries - 1:
-                await asyncio.sleep(2 ** attempt)  # Exponential backoff
-    
-    # Fallback to OpenAI with better error handling
-    if openai_client:
-        try:
-            logger.info("Falling back to OpenAI")
-            response = await openai_client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "You are Clario, a helpful and empathetic AI companion. Respond naturally and supportively."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=500,
-                temperature=0.7,
-                timeout=30.0
-            )
-            
-            if response.choices and response.choices[0].message.content:
-                logger.info("OpenAI call successful")
-                return response.choices[0].message.content.strip()
-            else:
-                logger.error("OpenAI returned empty response")
-                return generate_contextual_fallback(prompt)
-                
-        except Exception as openai_error:
-            logger.error(f"OpenAI fallback also failed: {openai_error}")
-            return generate_contextual_fallback(prompt)
-    else:
-        logger.error("No OpenAI client available for fallback")
+    return None
+
+# --- AI Model Utilities with Fallback ---
+# Concurrent identical calls (retries, double submits) share one provider call
+_chat_flight = SingleFlight("llm_chat")
+_json_flight = SingleFlight("llm_json")
+
+async def _call_chat(prompt: str, max_retries: int) -> str:
+    response = await _route("chat", prompt, _chat_completion, lambda text: text, max_retries, hedge=hedge_policy.enabled)
+    if response is None:
+        logger.error("No provider produced a response; using contextual fallback")
         return generate_contextual_fallback(prompt)
+    return response
+
+async def call_ai_model_with_fallback(prompt: str, max_retries: int = 2) -> str:
+    """
+    Calls the healthiest preferred provider (Gemini, then OpenAI), then a canned reply.
+    With LLM_HEDGING_ENABLED, a slow first attempt is hedged to the next provider.
+    """
+    key = (llm_cache_key(prompt, GEMINI_MODEL_NAME), max_retries)
+    return await _chat_flight.do(key, lambda: _call_chat(prompt, max_retries))
+
+async def _call_json(prompt: str, max_retries: int, cache_key: str) -> Dict[str, Any]:
+    cached = await llm_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    result = await _route("JSON", prompt, _json_completion, _parse_json, max_retries)
+    if result is None:
+        # Pattern-based fallbacks are not cached, so the next call tries the providers again
+        logger.error("No provider produced valid JSON; using pattern-based fallback")
+        return create_pattern_based_fallback(prompt)
+    llm_cache.put(cache_key, prompt, result)
+    return result
 
 async def call_ai_for_json_with_fallback(prompt: str, max_retries: int = 2) -> Dict[str, Any]:
-    """Specialized function for JSON responses with better fallback."""
-    
-    # Try Gemini first
-    for attempt in range(max_retries):
-        try:
-            logger.info(f"Attempting Gemini JSON call (attempt {attempt + 1})")
-            model = genai.GenerativeModel("gemini-2.5-flash")
-            
-            # Configure for JSON responses
-            generation_config = genai.types.GenerationConfig(
-                temperature=0.3,
-                max_output_tokens=1000,
-                top_p=0.8,
-            )
-            
-            response = await model.generate_content_async(
-                prompt, 
-                generation_config=generation_config,
-                safety_settings=safety_settings
-            )
-            
-            if not response.parts:
-                logger.warning(f"Gemini returned empty response on JSON attempt {attempt + 1}. Finish reason: {response.prompt_feedback}")
-                if attempt < max_retries - 1:
-                    await asyncio.sleep(1)
-                    continue
-                else:
-                    break
-            
-            cleaned_response = response.text.strip()
-            
-            # Clean up the response
-            if "```json" in cleaned_response:
-                cleaned_response = cleaned_response.split("```json")[1].split("```")[0]
-            elif "```" in cleaned_response:
-                cleaned_response = cleaned_response.split("```")[1].split("```")[0]
-            
-            cleaned_response = cleaned_response.strip()
-            
+    """Specialized function for JSON responses with better fallback, served from the result cache when possible."""
+    cache_key = llm_cache_key(prompt, JSON_MODEL_NAME)
+    result = await _json_flight.do((cache_key, max_retries), lambda: _call_json(prompt, max_retries, cache_key))
+    # Coalesced callers share one result; each gets its own copy
+    return copy.deepcopy(result)
+
+# --- Streaming ---
+# Time from the call to the first chunk, and which provider produced each stream
+_streaming_ttft = LatencySummary()
+_streaming_counts = {"streams": 0, "gemini": 0, "openai": 0, "canned": 0, "interrupted": 0}
+
+def _streaming_stats() -> Dict[str, Any]:
+    return {**_streaming_counts, "ttft": _streaming_ttft.stats()}
+
+register_metrics_source("llm_streaming", _streaming_stats)
+
+def _record_first_chunk(provider: str, started: float):
+    _streaming_counts[provider] += 1
+    _streaming_ttft.record(time.perf_counter() - started)
+
+async def _gemini_stream(prompt: str) -> AsyncIterator[str]:
+    model = providers.gemini_model(GEMINI_MODEL_NAME, "chat")
+    async with providers.track("gemini"):
+        response = await model.generate_content_async(prompt, stream=True)
+        async for chunk in response:
+            # Blocked or empty chunks have no parts, and .text raises on them
+            if chunk.parts and chunk.text:
+                yield chunk.text
+
+async def _openai_stream(prompt: str) -> AsyncIterator[str]:
+    async with providers.track("openai"):
+        stream = await providers.openai.chat.completions.create(
+            model=OPENAI_FALLBACK_MODEL_NAME,
+            messages=[
+                {"role": "system", "content": CHAT_SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=500,
+            temperature=0.7,
+            timeout=30.0,
+            stream=True
+        )
+        async for event in stream:
+            text = event.choices[0].delta.content if event.choices else None
+            if text:
+                yield text
+
+async def stream_ai_model_with_fallback(prompt: str, max_retries: int = 2) -> AsyncIterator[str]:
+    """
+    Streaming counterpart of call_ai_model_with_fallback: yields text chunks as
+    the provider produces them. Providers are only switched before the first
+    chunk; a stream that breaks off later simply ends early.
+    """
+    started = time.perf_counter()
+    _streaming_counts["streams"] += 1
+
+    for provider in provider_router.candidates(_provider_configured):
+        breaker = provider_router.breaker(provider)
+        for attempt in range(max_retries):
+            if not breaker.available() or not await _admit(provider, "chat", prompt) or not breaker.acquire():
+                break
+            logger.info(f"Attempting {provider} stream (attempt {attempt + 1})")
+            attempt_started = time.perf_counter()
+            yielded = False
+            stream = _gemini_stream(prompt) if provider == "gemini" else _openai_stream(prompt)
             try:
-                result = json.loads(cleaned_response)
-                logger.info("Gemini JSON call successful")
-                return result
-            except json.JSONDecodeError as json_error:
-                logger.error(f"JSON decode error from Gemini: {json_error}")
-                logger.error(f"Raw response was: {cleaned_response[:200]}")
-                if attempt == max_retries - 1:
+                async for text in stream:
+                    if not yielded:
+                        # Health is judged on time to first token
+                        breaker.record_success(time.perf_counter() - attempt_started)
+                        _record_first_chunk(provider, started)
+                        yielded = True
+                    yield text
+            except GeneratorExit:
+                if not yielded:
+                    breaker.release()
+                raise
+            except asyncio.CancelledError:
+                if not yielded:
+                    breaker.release()
+                raise
+            except Exception as e:
+                error_class = classify_error(e)
+                breaker.record_failure(error_class, time.perf_counter() - attempt_started)
+                if yielded:
+                    logger.warning(f"{provider} stream broke off mid-response ({error_class}): {e}")
+                    _streaming_counts["interrupted"] += 1
+                    return
+                logger.warning(f"{provider} stream attempt {attempt + 1} failed ({error_class}): {e}")
+                if error_class in SWITCH_PROVIDER_ERRORS:
                     break
                 continue
-                
-        except Exception as e:
-            logger.warning(f"Gemini JSON attempt {attempt + 1} failed: {e}")
-            
-            error_str = str(e).lower()
-            rate_limit_indicators = [
-                'rate limit', 'quota exceeded', 'too many requests', 
-                'resource_exhausted', '429', 'quota', 'limit exceeded',
-                'internal error', '500'
-            ]
-            
-            if any(indicator in error_str for indicator in rate_limit_indicators):
-                logger.warning("Rate limit detected in JSON call, switching to OpenAI")
-                break
-            
-            if attempt < max_retries - 1:
-                await asyncio.sleep(1)
-    
-    # Fallback to OpenAI for JSON
-    if openai_client:
-        try:
-            logger.info("Falling back to OpenAI for JSON response")
-            response = await openai_client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "You are a helpful assistant that responds with valid JSON only. Do not include any text outside the JSON structure."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=1000,
-                temperature=0.3,
-                timeout=30.0
-            )
-            
-            if response.choices and response.choices[0].message.content:
-                try:
-                    result = json.loads(response.choices[0].message.content.strip())
-                    logger.info("OpenAI JSON call successful")
-                    return result
-                except json.JSONDecodeError as json_error:
-                    logger.error(f"JSON decode error from OpenAI: {json_error}")
-                    logger.error(f"Raw OpenAI response: {response.choices[0].message.content[:200]}")
-                    return create_pattern_based_fallback(prompt)
-            else:
-                logger.error("OpenAI returned empty JSON response")
-                return create_pattern_based_fallback(prompt)
-                
-        except Exception as openai_error:
-            logger.error(f"OpenAI JSON fallback failed: {openai_error}")
-            return create_pattern_based_fallback(prompt)
-    else:
-        logger.error("No OpenAI client available for JSON fallback")
-        return create_pattern_based_fallback(prompt)
\ No newline at end of file
+            finally:
+                await stream.aclose()
+            if yielded:
+                return
+            breaker.record_success(time.perf_counter() - attempt_started)
+            logger.warning(f"{provider} stream returned no text on attempt {attempt + 1}")
+
+    logger.error("No provider streamed a response; using contextual fallback")
+    _record_first_chunk("canned", started)
+    yield generate_contextual_fallback(prompt)
@@ -8,7 +8,8 @@ import os
 
 # --- Configuration ---
 logger = logging.getLogger(__name__)
-embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
+embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME)
 sentiment_tokenizer = None
 sentiment_model = None
 device = None
@@ -16,4 +17,144 @@ device = None
 # Initialize OpenAI client
 openai_client = None
 if os.getenv("OPENAI_API_KEY"):
-    openai_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
\ No newline at end of file
+    openai_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+# --- Memory Cache ---
+# Per-process LRU of each user's decoded memory matrix (see memory_cache.py)
+MEMORY_CACHE_MAX_BYTES = int(os.getenv("MEMORY_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+MEMORY_CACHE_MAX_ENTRY_BYTES = int(os.getenv("MEMORY_CACHE_MAX_ENTRY_BYTES", str(32 * 1024 * 1024)))
+# Bounds how stale a cached set can get when another worker writes to the same user
+MEMORY_CACHE_TTL_SECONDS = float(os.getenv("MEMORY_CACHE_TTL_SECONDS", "300"))
+# Users with more memories than this are not loaded in the background after a pgvector
+# search; pgvector keeps serving their top-k
+MEMORY_CACHE_WARMUP_MAX_ROWS = int(os.getenv("MEMORY_CACHE_WARMUP_MAX_ROWS", "500"))
+
+# --- Embedding Storage ---
+# Element type for BYTEA embeddings on the non-pgvector schema: float32 or float16
+EMBEDDING_STORAGE_DTYPE = os.getenv("EMBEDDING_STORAGE_DTYPE", "float32")
+EMBEDDING_MIGRATION_BATCH_SIZE = int(os.getenv("EMBEDDING_MIGRATION_BATCH_SIZE", "500"))
+
+# --- Embedding Cache ---
+# Text-keyed cache in front of embedding_model.encode (see embeddings.py)
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "10000"))
+# Optional shared tier in the embedding_cache table, for short texts only
+EMBEDDING_CACHE_PERSISTENT = os.getenv("EMBEDDING_CACHE_PERSISTENT", "false").lower() == "true"
+EMBEDDING_CACHE_PERSIST_MAX_CHARS = int(os.getenv("EMBEDDING_CACHE_PERSIST_MAX_CHARS", "500"))
+
+# --- Embedding Batcher ---
+# Concurrent encode requests are coalesced into one forward pass (see embedding_batcher.py)
+EMBEDDING_BATCH_MAX_SIZE = int(os.getenv("EMBEDDING_BATCH_MAX_SIZE", "32"))
+EMBEDDING_BATCH_MAX_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_MAX_WAIT_MS", "5"))
+EMBEDDING_QUEUE_MAX_DEPTH = int(os.getenv("EMBEDDING_QUEUE_MAX_DEPTH", "1024"))
+
+# --- Vector Indexes ---
+# Below this many rows an exact scan beats any ANN index, so none is kept
+VECTOR_INDEX_MIN_ROWS = int(os.getenv("VECTOR_INDEX_MIN_ROWS", "5000"))
+# HNSW up to this size, IVFFlat (cheaper to build) beyond it
+VECTOR_INDEX_HNSW_MAX_ROWS = int(os.getenv("VECTOR_INDEX_HNSW_MAX_ROWS", "2000000"))
+VECTOR_INDEX_HNSW_M = int(os.getenv("VECTOR_INDEX_HNSW_M", "16"))
+VECTOR_INDEX_HNSW_EF_CONSTRUCTION = int(os.getenv("VECTOR_INDEX_HNSW_EF_CONSTRUCTION", "64"))
+# Rebuild an IVFFlat index once the table has grown/shrunk by this factor since it was trained
+VECTOR_INDEX_REBUILD_GROWTH = float(os.getenv("VECTOR_INDEX_REBUILD_GROWTH", "2.0"))
+# Reindex an HNSW graph once this fraction of the table is dead tuples
+VECTOR_INDEX_MAX_DEAD_FRACTION = float(os.getenv("VECTOR_INDEX_MAX_DEAD_FRACTION", "0.2"))
+VECTOR_INDEX_CHECK_INTERVAL_SECONDS = float(os.getenv("VECTOR_INDEX_CHECK_INTERVAL_SECONDS", "3600"))
+VECTOR_SEARCH_RECALL_TARGET = float(os.getenv("VECTOR_SEARCH_RECALL_TARGET", "0.95"))
+VECTOR_SEARCH_LATENCY_TARGET_MS = float(os.getenv("VECTOR_SEARCH_LATENCY_TARGET_MS", "50"))
+
+# --- Memory Consolidation ---
+# Cosine similarity above which a new memory of the same type is merged into an existing one
+MEMORY_DEDUP_THRESHOLD = float(os.getenv("MEMORY_DEDUP_THRESHOLD", "0.9"))
+# The stored-memory sweep deletes rows merged by similarity alone, so it is opt-in
+MEMORY_DEDUP_SWEEP_ENABLED = os.getenv("MEMORY_DEDUP_SWEEP_ENABLED", "false").lower() == "true"
+MEMORY_DEDUP_SWEEP_INTERVAL_SECONDS = float(os.getenv("MEMORY_DEDUP_SWEEP_INTERVAL_SECONDS", "86400"))
+
+# --- Interaction Ring Buffer ---
+# Interaction memories kept per user; the oldest slot is overwritten in place
+INTERACTION_RING_SIZE = int(os.getenv("INTERACTION_RING_SIZE", "20"))
+
+# --- Write-Behind Queue ---
+WRITE_BEHIND_CONCURRENCY = int(os.getenv("WRITE_BEHIND_CONCURRENCY", "4"))
+WRITE_BEHIND_QUEUE_MAX_DEPTH = int(os.getenv("WRITE_BEHIND_QUEUE_MAX_DEPTH", "1000"))
+WRITE_BEHIND_MAX_ATTEMPTS = int(os.getenv("WRITE_BEHIND_MAX_ATTEMPTS", "5"))
+WRITE_BEHIND_RETRY_BASE_SECONDS = float(os.getenv("WRITE_BEHIND_RETRY_BASE_SECONDS", "2"))
+# How long a claimed outbox row stays invisible to other workers/processes
+WRITE_BEHIND_LEASE_SECONDS = float(os.getenv("WRITE_BEHIND_LEASE_SECONDS", "60"))
+WRITE_BEHIND_POLL_INTERVAL_SECONDS = float(os.getenv("WRITE_BEHIND_POLL_INTERVAL_SECONDS", "5"))
+WRITE_BEHIND_DRAIN_TIMEOUT_SECONDS = float(os.getenv("WRITE_BEHIND_DRAIN_TIMEOUT_SECONDS", "10"))
+
+# --- LLM Result Cache ---
+# Results of call_ai_for_json_with_fallback keyed by normalized prompt and model (see llm_cache.py)
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", "86400"))
+# Optional shared tier in the llm_result_cache table
+LLM_CACHE_PERSISTENT = os.getenv("LLM_CACHE_PERSISTENT", "false").lower() == "true"
+# Provider list prices (USD per 1K tokens) used to estimate the spend a hit saves
+LLM_COST_PER_1K_INPUT_TOKENS = float(os.getenv("LLM_COST_PER_1K_INPUT_TOKENS", "0.0003"))
+LLM_COST_PER_1K_OUTPUT_TOKENS = float(os.getenv("LLM_COST_PER_1K_OUTPUT_TOKENS", "0.0025"))
+
+# --- Extraction Gate ---
+# Local pre-check that skips the LLM extraction call for low-value messages (see extraction_gate.py)
+EXTRACTION_GATE_ENABLED = os.getenv("EXTRACTION_GATE_ENABLED", "true").lower() == "true"
+# Keyword score at or above which extraction runs without consulting the classifier
+EXTRACTION_GATE_KEYWORD_PASS_SCORE = float(os.getenv("EXTRACTION_GATE_KEYWORD_PASS_SCORE", "4"))
+# Keyword score at or below which extraction is skipped without consulting the classifier
+EXTRACTION_GATE_KEYWORD_SKIP_SCORE = float(os.getenv("EXTRACTION_GATE_KEYWORD_SKIP_SCORE", "0"))
+# Minimum (informative - low-value) prototype similarity margin for the classifier to pass a message
+EXTRACTION_GATE_CLASSIFIER_MARGIN = float(os.getenv("EXTRACTION_GATE_CLASSIFIER_MARGIN", "0.0"))
+
+# --- LLM Providers ---
+# Long-lived provider clients created at startup (see providers.py)
+GEMINI_MODEL_NAME = os.getenv("GEMINI_MODEL_NAME", "gemini-2.5-flash")
+OPENAI_FALLBACK_MODEL_NAME = os.getenv("OPENAI_FALLBACK_MODEL_NAME", "gpt-3.5-turbo")
+# Keep-alive HTTP pool shared by all OpenAI calls
+LLM_HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "20"))
+LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS", "10"))
+LLM_HTTP_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY_SECONDS", "60"))
+LLM_HTTP_TIMEOUT_SECONDS = float(os.getenv("LLM_HTTP_TIMEOUT_SECONDS", "30"))
+
+# --- LLM Provider Router ---
+# Preference order; providers with an open circuit breaker are skipped (see provider_router.py)
+LLM_PROVIDER_ORDER = [p.strip() for p in os.getenv("LLM_PROVIDER_ORDER", "gemini,openai").split(",") if p.strip()]
+LLM_BREAKER_WINDOW_SECONDS = float(os.getenv("LLM_BREAKER_WINDOW_SECONDS", "60"))
+# Opens when the window holds at least MIN_REQUESTS calls and ERROR_RATE of them failed,
+# or after CONSECUTIVE_FAILURES failures in a row
+LLM_BREAKER_MIN_REQUESTS = int(os.getenv("LLM_BREAKER_MIN_REQUESTS", "5"))
+LLM_BREAKER_ERROR_RATE = float(os.getenv("LLM_BREAKER_ERROR_RATE", "0.5"))
+LLM_BREAKER_CONSECUTIVE_FAILURES = int(os.getenv("LLM_BREAKER_CONSECUTIVE_FAILURES", "3"))
+# Time before an open breaker lets a probe through; doubles on each failed probe up to the max
+LLM_BREAKER_COOLDOWN_SECONDS = float(os.getenv("LLM_BREAKER_COOLDOWN_SECONDS", "30"))
+LLM_BREAKER_MAX_COOLDOWN_SECONDS = float(os.getenv("LLM_BREAKER_MAX_COOLDOWN_SECONDS", "300"))
+
+# --- LLM Request Hedging ---
+# Opt-in: when the primary provider is slower than its recent latency percentile, the same
+# chat prompt also goes to the next provider and the first valid answer wins
+LLM_HEDGING_ENABLED = os.getenv("LLM_HEDGING_ENABLED", "false").lower() == "true"
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0.95"))
+# Delay used until the primary has latency history, and the floor for the percentile delay
+LLM_HEDGE_DEFAULT_DELAY_SECONDS = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY_SECONDS", "3"))
+LLM_HEDGE_MIN_DELAY_SECONDS = float(os.getenv("LLM_HEDGE_MIN_DELAY_SECONDS", "0.5"))
+# Caps the extra provider spend: at most this many hedged requests per minute
+LLM_HEDGE_BUDGET_PER_MINUTE = float(os.getenv("LLM_HEDGE_BUDGET_PER_MINUTE", "30"))
+
+# --- Prompt Budget ---
+# Token budget for the chat prompt, counted with the local embedding tokenizer; filled by
+# priority: instructions, the current message, memories by relevance, then recent history
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "1500"))
+# The current message is truncated past this so memories and history still get room
+PROMPT_MESSAGE_MAX_TOKENS = int(os.getenv("PROMPT_MESSAGE_MAX_TOKENS", "600"))
+PROMPT_MAX_MEMORIES = int(os.getenv("PROMPT_MAX_MEMORIES", "5"))
+PROMPT_MAX_HISTORY_MESSAGES = int(os.getenv("PROMPT_MAX_HISTORY_MESSAGES", "4"))
+# A section is only truncated to fit if at least this many tokens of it would remain
+PROMPT_MIN_SECTION_TOKENS = int(os.getenv("PROMPT_MIN_SECTION_TOKENS", "16"))
+
+# --- LLM Rate Limits ---
+# Client-side token buckets per provider and model, in requests and tokens per minute
+# (0 disables a limit); calls over the limit wait in a per-user round-robin queue
+GEMINI_RPM_LIMIT = int(os.getenv("GEMINI_RPM_LIMIT", "1000"))
+GEMINI_TPM_LIMIT = int(os.getenv("GEMINI_TPM_LIMIT", "1000000"))
+OPENAI_RPM_LIMIT = int(os.getenv("OPENAI_RPM_LIMIT", "500"))
+OPENAI_TPM_LIMIT = int(os.getenv("OPENAI_TPM_LIMIT", "200000"))
+# A queued call gives up (and the router moves to the next provider) after this long
+LLM_RATE_LIMIT_MAX_WAIT_SECONDS = float(os.getenv("LLM_RATE_LIMIT_MAX_WAIT_SECONDS", "10"))
+LLM_RATE_LIMIT_MAX_QUEUE = int(os.getenv("LLM_RATE_LIMIT_MAX_QUEUE", "200"))
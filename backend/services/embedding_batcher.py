@@ -0,0 +1,155 @@
+import asyncio
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from .config import (
+    logger,
+    embedding_model,
+    EMBEDDING_BATCH_MAX_SIZE,
+    EMBEDDING_BATCH_MAX_WAIT_MS,
+    EMBEDDING_QUEUE_MAX_DEPTH
+)
+from .metrics import register_metrics_source
+
+class EmbeddingBatcher:
+    """
+    Coalesces concurrent encode requests into batched forward passes.
+
+    Callers enqueue texts and await their own vectors. A single worker task
+    drains the queue into batches of at most `max_batch_size` texts, waiting
+    at most `max_wait_ms` for a batch to fill, and runs the model on a
+    dedicated one-thread executor so the event loop never blocks on it.
+    """
+
+    def __init__(self, max_batch_size: int, max_wait_ms: float, max_queue_depth: int):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue_depth = max_queue_depth
+        self._queue: Optional[asyncio.Queue] = None
+        self._items_available: Optional[asyncio.Event] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._worker: Optional[asyncio.Task] = None
+        # Taken off the queue but not yet answered; stop() fails these too
+        self._in_flight: List[Tuple[str, asyncio.Future]] = []
+        self.batches = 0
+        self.texts_encoded = 0
+        self.last_batch_size = 0
+        self.max_batch_seen = 0
+        self.max_queue_depth_seen = 0
+        self.failures = 0
+
+    @property
+    def running(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue_depth)
+        self._items_available = asyncio.Event()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embedding")
+        self._worker = asyncio.create_task(self._run())
+        logger.info(
+            f"Embedding batcher started (max batch {self.max_batch_size}, max wait {self.max_wait * 1000:.0f} ms)"
+        )
+
+    async def stop(self):
+        """Stop the worker and fail whatever is still queued."""
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+        pending = self._in_flight
+        self._in_flight = []
+        while not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+        for _, future in pending:
+            if not future.done():
+                future.set_exception(RuntimeError("Embedding service is shutting down"))
+        self._executor.shutdown(wait=False)
+        logger.info("Embedding batcher stopped.")
+
+    async def encode(self, texts: Sequence[str]) -> np.ndarray:
+        """Queue texts for the next batches and wait for their embeddings."""
+        loop = asyncio.get_running_loop()
+        futures = []
+        for text in texts:
+            future = loop.create_future()
+            # Blocks (applying backpressure) once the queue is full
+            await self._queue.put((text, future))
+            futures.append(future)
+        self._items_available.set()
+        self.max_queue_depth_seen = max(self.max_queue_depth_seen, self._queue.qsize())
+        return np.stack(await asyncio.gather(*futures))
+
+    async def _collect_batch(self) -> List[Tuple[str, asyncio.Future]]:
+        loop = asyncio.get_running_loop()
+        batch = self._in_flight = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            # Wait on an event rather than queue.get() so a timeout can never drop an item
+            self._items_available.clear()
+            try:
+                await asyncio.wait_for(self._items_available.wait(), remaining)
+            except asyncio.TimeoutError:
+                break
+        # Callers that gave up (cancelled requests) do not cost a forward pass
+        return [(text, future) for text, future in batch if not future.done()]
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect_batch()
+            if not batch:
+                continue
+            try:
+                vectors = await loop.run_in_executor(
+                    self._executor, embedding_model.encode, [text for text, _ in batch]
+                )
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"Embedding batch of {len(batch)} failed: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.texts_encoded += len(batch)
+            self.last_batch_size = len(batch)
+            self.max_batch_seen = max(self.max_batch_seen, len(batch))
+            for (_, future), vector in zip(batch, vectors):
+                if not future.done():
+                    future.set_result(vector)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue_depth": self.max_queue_depth,
+            "max_queue_depth_seen": self.max_queue_depth_seen,
+            "batches": self.batches,
+            "texts_encoded": self.texts_encoded,
+            "avg_batch_size": round(self.texts_encoded / self.batches, 2) if self.batches else 0.0,
+            "last_batch_size": self.last_batch_size,
+            "max_batch_size_seen": self.max_batch_seen,
+            "max_batch_size": self.max_batch_size,
+            "failures": self.failures
+        }
+
+embedding_batcher = EmbeddingBatcher(
+    max_batch_size=EMBEDDING_BATCH_MAX_SIZE,
+    max_wait_ms=EMBEDDING_BATCH_MAX_WAIT_MS,
+    max_queue_depth=EMBEDDING_QUEUE_MAX_DEPTH
+)
+register_metrics_source("embedding_batcher", embedding_batcher.stats)
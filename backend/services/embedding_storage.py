@@ -0,0 +1,139 @@
+import asyncpg
+import json
+import numpy as np
+from typing import Any, Dict, List, Optional, Tuple
+from .config import logger, EMBEDDING_STORAGE_DTYPE, EMBEDDING_MIGRATION_BATCH_SIZE
+from .memory_scoring import decode_embedding, encode_embedding_binary
+
+# Column types created by config.database.setup_database_schema
+PGVECTOR_COLUMN_TYPE = "vector(384)"
+BINARY_COLUMN_TYPE = "bytea"
+TEXT_COLUMN_TYPE = "text"
+
+# Tables whose embedding column may use the binary format
+EMBEDDING_TABLES = ("user_memories", "structured_memories")
+
+_column_types: Dict[str, str] = {}
+
+async def fetch_embedding_column_type(conn: asyncpg.Connection, table: str) -> str:
+    """Read the current SQL type of <table>.embedding from the catalog."""
+    column_type = await conn.fetchval(
+        """SELECT format_type(atttypid, atttypmod)
+           FROM pg_attribute
+           WHERE attrelid = $1::regclass
+           AND attname = 'embedding' AND NOT attisdropped""",
+        table
+    )
+    return (column_type or TEXT_COLUMN_TYPE).lower()
+
+async def get_embedding_column_type(conn: asyncpg.Connection, table: str = "user_memories") -> str:
+    """Return the SQL type of <table>.embedding, detected once per process."""
+    if table not in _column_types:
+        _column_types[table] = await fetch_embedding_column_type(conn, table)
+        logger.info(f"{table}.embedding column type: {_column_types[table]}")
+    return _column_types[table]
+
+async def detect_embedding_column_types(pool: asyncpg.Pool):
+    """Detect every embedding column type once at startup so writes never probe per row."""
+    async with pool.acquire() as conn:
+        for table in EMBEDDING_TABLES:
+            _column_types[table] = await fetch_embedding_column_type(conn, table)
+            logger.info(f"{table}.embedding column type: {_column_types[table]}")
+
+def encode_embedding_for_column(embedding: Any, column_type: str) -> Any:
+    """Convert an embedding into the parameter value its column expects."""
+    if column_type == BINARY_COLUMN_TYPE:
+        return encode_embedding_binary(embedding, EMBEDDING_STORAGE_DTYPE)
+    # pgvector and legacy TEXT columns both accept the "[x, y, ...]" text form
+    return json.dumps(np.asarray(embedding).tolist())
+
+async def _convert_batch(conn: asyncpg.Connection, table: str, rows) -> Tuple[int, List[Any]]:
+    """Fill embedding_bin for `rows`; returns the number converted and the ids that could not be decoded."""
+    ids, blobs, undecodable = [], [], []
+    for row in rows:
+        vector = decode_embedding(row['embedding'])
+        if vector is not None:
+            ids.append(row['id'])
+            blobs.append(encode_embedding_binary(vector, EMBEDDING_STORAGE_DTYPE))
+        else:
+            undecodable.append(row['id'])
+    if ids:
+        await conn.execute(
+            f"""UPDATE {table} AS t SET embedding_bin = v.embedding
+                FROM unnest($1::uuid[], $2::bytea[]) AS v(id, embedding)
+                WHERE t.id = v.id""",
+            ids, blobs
+        )
+    if undecodable:
+        logger.warning(
+            f"{len(undecodable)} {table} embeddings could not be decoded and were not converted: "
+            f"{[str(row_id) for row_id in undecodable]}"
+        )
+    return len(ids), undecodable
+
+async def _migrate_table(pool: asyncpg.Pool, table: str, batch_size: int) -> Optional[int]:
+    async with pool.acquire() as conn:
+        # One migration per table across every app process; the others wait, then find it done
+        lock_key = f"embedding_migration:{table}"
+        await conn.execute("SELECT pg_advisory_lock(hashtext($1))", lock_key)
+        try:
+            column_type = await fetch_embedding_column_type(conn, table)
+            if column_type != TEXT_COLUMN_TYPE:
+                return None
+
+            logger.info(f"Converting {table}.embedding from JSON text to {EMBEDDING_STORAGE_DTYPE} BYTEA...")
+            await conn.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS embedding_bin BYTEA")
+
+            # Keyset pagination over id, so undecodable rows are skipped rather than retried
+            converted = 0
+            last_id = None
+            while True:
+                rows = await conn.fetch(
+                    f"""SELECT id, embedding FROM {table}
+                        WHERE embedding_bin IS NULL AND embedding IS NOT NULL
+                        AND ($1::uuid IS NULL OR id > $1)
+                        ORDER BY id
+                        LIMIT $2""",
+                    last_id, batch_size
+                )
+                if not rows:
+                    break
+                count, _ = await _convert_batch(conn, table, rows)
+                converted += count
+                last_id = rows[-1]['id']
+
+            # Swap columns under a lock, picking up rows written while the batches ran
+            async with conn.transaction():
+                await conn.execute(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE")
+                rows = await conn.fetch(
+                    f"SELECT id, embedding FROM {table} WHERE embedding_bin IS NULL AND embedding IS NOT NULL"
+                )
+                count, undecodable = await _convert_batch(conn, table, rows)
+                converted += count
+                if undecodable:
+                    # Dropping the text column would lose these embeddings; keep both until they are fixed
+                    logger.error(
+                        f"Not swapping {table}.embedding to BYTEA: {len(undecodable)} rows could not be decoded. "
+                        f"The text column is kept; fix or clear them and restart to finish the migration."
+                    )
+                    return converted
+                await conn.execute(f"ALTER TABLE {table} DROP COLUMN embedding")
+                await conn.execute(f"ALTER TABLE {table} RENAME COLUMN embedding_bin TO embedding")
+
+            _column_types.pop(table, None)
+            return converted
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock(hashtext($1))", lock_key)
+
+async def migrate_text_embeddings_to_binary(
+    pool: asyncpg.Pool,
+    batch_size: int = EMBEDDING_MIGRATION_BATCH_SIZE
+):
+    """Convert legacy JSON-text embedding columns to BYTEA in batches (no-op once done)."""
+    for table in EMBEDDING_TABLES:
+        try:
+            converted = await _migrate_table(pool, table, batch_size)
+            if converted is not None:
+                logger.info(f"Converted {converted} {table} embeddings to BYTEA.")
+        except Exception as e:
+            logger.error(f"Failed to migrate {table} embeddings to BYTEA: {e}", exc_info=True)
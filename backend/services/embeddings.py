@@ -0,0 +1,195 @@
+import asyncio
+import asyncpg
+import hashlib
+import numpy as np
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Set
+from .config import (
+    logger,
+    embedding_model,
+    EMBEDDING_MODEL_NAME,
+    EMBEDDING_CACHE_MAX_ENTRIES,
+    EMBEDDING_CACHE_PERSISTENT,
+    EMBEDDING_CACHE_PERSIST_MAX_CHARS
+)
+from .embedding_batcher import embedding_batcher
+from .memory_scoring import EMBEDDING_DIMENSION, decode_embedding, encode_embedding_binary
+from .metrics import register_metrics_source
+from .single_flight import SingleFlight
+
+# Fixed query strings used by chat/user_context_service plus the memory types
+# the category endpoints are called with; embedded once at startup.
+PRESEED_TEXTS = (
+    "relationships friends family",
+    "situation ongoing current",
+    "people",
+    "fact",
+    "preference",
+    "emotion",
+    "situation",
+    "relationship",
+    "interaction",
+)
+
+def embedding_cache_key(text: str) -> str:
+    """Content hash of a text, scoped to the embedding model that produced the vector."""
+    return hashlib.sha256(f"{EMBEDDING_MODEL_NAME}\0{text}".encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    """In-process LRU of embeddings keyed by content hash, with an optional Postgres tier."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._pool: Optional[asyncpg.Pool] = None
+        self._persist_tasks: Set[asyncio.Task] = set()
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+
+    def enable_persistent_tier(self, pool: asyncpg.Pool):
+        self._pool = pool
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        vector = self._entries.get(key)
+        if vector is not None:
+            self._entries.move_to_end(key)
+        return vector
+
+    def put(self, key: str, vector: np.ndarray):
+        vector = np.array(vector, dtype=np.float32)
+        vector.setflags(write=False)
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def fetch_persistent(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        """Look keys up in the embedding_cache table and promote hits into the LRU."""
+        if self._pool is None or not keys:
+            return {}
+        try:
+            async with self._pool.acquire() as conn:
+                rows = await conn.fetch(
+                    "SELECT text_hash, embedding FROM embedding_cache WHERE text_hash = ANY($1::text[])",
+                    keys
+                )
+        except Exception as e:
+            logger.warning(f"Embedding cache lookup failed: {e}")
+            return {}
+        found = {}
+        for row in rows:
+            vector = decode_embedding(row['embedding'])
+            if vector is not None:
+                self.put(row['text_hash'], vector)
+                found[row['text_hash']] = self._entries[row['text_hash']]
+        return found
+
+    def persist(self, texts_by_key: Dict[str, str]):
+        """Write short texts' embeddings to the shared tier in the background."""
+        if self._pool is None:
+            return
+        records = [
+            (key, encode_embedding_binary(self._entries[key]), datetime.utcnow())
+            for key, text in texts_by_key.items()
+            if len(text) <= EMBEDDING_CACHE_PERSIST_MAX_CHARS and key in self._entries
+        ]
+        if records:
+            task = asyncio.create_task(self._write_persistent(records))
+            self._persist_tasks.add(task)
+            task.add_done_callback(self._persist_tasks.discard)
+
+    async def _write_persistent(self, records):
+        try:
+            async with self._pool.acquire() as conn:
+                await conn.executemany(
+                    """INSERT INTO embedding_cache (text_hash, embedding, created_at)
+                       VALUES ($1, $2, $3) ON CONFLICT (text_hash) DO NOTHING""",
+                    records
+                )
+        except Exception as e:
+            logger.warning(f"Failed to persist embeddings: {e}")
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.persistent_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "persistent_hits": self.persistent_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.persistent_hits) / lookups, 4) if lookups else 0.0,
+            "persistent_tier": self._pool is not None
+        }
+
+embedding_cache = EmbeddingCache(EMBEDDING_CACHE_MAX_ENTRIES)
+register_metrics_source("embedding_cache", embedding_cache.stats)
+
+# --- Embedding Helpers ---
+async def _encode_batch(texts: List[str]) -> np.ndarray:
+    """Encode through the micro-batching service, or a worker thread before it starts."""
+    if embedding_batcher.running:
+        return await embedding_batcher.encode(texts)
+    return await asyncio.to_thread(embedding_model.encode, texts)
+
+# Concurrent requests to encode the same missing texts share one encode
+_encode_flight = SingleFlight("embedding_encode")
+
+async def _encode_and_cache(missing: Dict[str, str]) -> Dict[str, np.ndarray]:
+    """Encode texts missing from both tiers and add them to the cache."""
+    embedding_cache.misses += len(missing)
+    encoded = await _encode_batch(list(missing.values()))
+    vectors = {}
+    for key, vector in zip(missing, encoded):
+        embedding_cache.put(key, vector)
+        vectors[key] = embedding_cache.get(key)
+    embedding_cache.persist(missing)
+    return vectors
+
+async def embed_texts(texts: Sequence[str]) -> np.ndarray:
+    """
+    Encode several texts, serving repeats from the embedding cache.
+
+    Only texts missing from both cache tiers reach the model, in one batch;
+    concurrent calls missing the same texts share that batch.
+    """
+    if not texts:
+        return np.zeros((0, EMBEDDING_DIMENSION), dtype=np.float32)
+
+    keys = [embedding_cache_key(text) for text in texts]
+    vectors: Dict[str, np.ndarray] = {}
+    missing: Dict[str, str] = {}
+    for key, text in zip(keys, texts):
+        if key in vectors or key in missing:
+            continue
+        vector = embedding_cache.get(key)
+        if vector is not None:
+            embedding_cache.hits += 1
+            vectors[key] = vector
+        else:
+            missing[key] = text
+
+    if missing:
+        found = await embedding_cache.fetch_persistent(list(missing))
+        embedding_cache.persistent_hits += len(found)
+        vectors.update(found)
+        for key in found:
+            del missing[key]
+
+    if missing:
+        vectors.update(await _encode_flight.do(tuple(missing), lambda: _encode_and_cache(missing)))
+
+    return np.stack([vectors[key] for key in keys])
+
+async def embed_text(text: str) -> np.ndarray:
+    """Encode a single text (see embed_texts)."""
+    embeddings = await embed_texts([text])
+    return embeddings[0]
+
+async def configure_embedding_cache(pool: asyncpg.Pool):
+    """Attach the persistent tier (if enabled) and pre-seed the fixed query strings."""
+    if EMBEDDING_CACHE_PERSISTENT:
+        embedding_cache.enable_persistent_tier(pool)
+    await embed_texts(PRESEED_TEXTS)
+    logger.info(f"Pre-seeded embedding cache with {len(PRESEED_TEXTS)} fixed query strings.")
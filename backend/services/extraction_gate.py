@@ -0,0 +1,134 @@
+import re
+import numpy as np
+from typing import Any, Dict, Optional, Tuple
+from .config import (
+    logger,
+    EXTRACTION_GATE_ENABLED,
+    EXTRACTION_GATE_KEYWORD_PASS_SCORE,
+    EXTRACTION_GATE_KEYWORD_SKIP_SCORE,
+    EXTRACTION_GATE_CLASSIFIER_MARGIN
+)
+from .embeddings import embed_text, embed_texts
+from .memory_scoring import normalize_rows, normalize_vector
+from .metrics import register_metrics_source
+
+# Words that carry no memorable information on their own
+FILLER_WORDS = frozenset({
+    "ok", "okay", "k", "kk", "lol", "lmao", "haha", "hahaha", "hehe", "thanks", "thank", "thx", "ty",
+    "yes", "yeah", "yep", "yup", "no", "nope", "nah", "sure", "cool", "nice", "great", "good", "fine",
+    "alright", "right", "hmm", "hm", "oh", "ah", "wow", "bye", "night", "goodnight", "hi", "hello",
+    "hey", "sup", "np", "same", "true", "agreed", "exactly", "idk", "ikr", "omg", "got", "it", "makes",
+    "sense", "sounds", "see"
+})
+STOP_WORDS = frozenset({
+    "the", "a", "an", "is", "are", "was", "were", "be", "to", "and", "or", "but", "that", "this",
+    "of", "in", "on", "for", "with", "so", "just", "too", "very", "really", "do", "does", "what",
+    "how", "why", "you", "u", "your", "me", "can", "could", "would", "will", "about", "there", "then"
+})
+PERSONAL_WORDS = frozenset({"i", "i'm", "im", "i've", "ive", "i'd", "i'll", "my", "mine", "myself", "we", "our", "us"})
+
+# Few-shot prototypes for the embedding classifier
+LOW_VALUE_PROTOTYPES = (
+    "ok", "thanks", "lol that's funny", "yes", "no", "cool", "got it", "sounds good",
+    "what do you mean?", "can you say that again?", "hello", "good night", "haha nice",
+    "i don't know", "sure, go on"
+)
+INFORMATIVE_PROTOTYPES = (
+    "my sister is getting married next month", "i just started a new job as a nurse",
+    "i've been feeling anxious about my exams", "my best friend and i had a fight",
+    "i love hiking on weekends", "i'm moving to a new city", "my dad is in the hospital",
+    "i hate public speaking", "i broke up with my partner", "i'm training for a marathon",
+    "we adopted a puppy", "i'm worried about money"
+)
+
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+# A capitalized word after the first one, e.g. a name or a place
+_PROPER_NOUN_RE = re.compile(r"\s[A-Z][a-z]+")
+
+def keyword_score(message: str) -> float:
+    """Cheap informativeness score: content words, first-person words, numbers and names."""
+    tokens = _TOKEN_RE.findall(message.lower())
+    content = [t for t in tokens if t not in FILLER_WORDS and t not in STOP_WORDS and t not in PERSONAL_WORDS]
+    personal = any(t in PERSONAL_WORDS for t in tokens)
+    if not content:
+        return 0.0
+    score = min(len(content), 3)
+    if personal:
+        score += 2
+    if any(t.isdigit() for t in content):
+        score += 1
+    if _PROPER_NOUN_RE.search(message):
+        score += 2
+    return float(score)
+
+class ExtractionGate:
+    """
+    Decides whether a message is worth an LLM extraction call.
+
+    Messages the regex pass already found meaningful always go through. The
+    rest are scored by keywords; clear cases are decided there, and the
+    ambiguous middle goes to a prototype classifier on the message's MiniLM
+    embedding (which retrieval then reuses from the embedding cache).
+    """
+
+    def __init__(self):
+        self._centroids: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        self.calls = 0
+        self.skipped = 0
+        self.reasons: Dict[str, int] = {}
+
+    async def _prototype_centroids(self) -> Tuple[np.ndarray, np.ndarray]:
+        if self._centroids is None:
+            embeddings = normalize_rows(np.array(
+                await embed_texts(LOW_VALUE_PROTOTYPES + INFORMATIVE_PROTOTYPES), dtype=np.float32
+            ))
+            low = embeddings[:len(LOW_VALUE_PROTOTYPES)].mean(axis=0)
+            informative = embeddings[len(LOW_VALUE_PROTOTYPES):].mean(axis=0)
+            self._centroids = (normalize_vector(low), normalize_vector(informative))
+        return self._centroids
+
+    async def classifier_margin(self, message: str) -> float:
+        """Similarity to the informative centroid minus similarity to the low-value one."""
+        low, informative = await self._prototype_centroids()
+        vector = normalize_vector(await embed_text(message))
+        return float(vector @ informative - vector @ low)
+
+    async def should_extract(self, message: str, pattern_meaningful: bool) -> bool:
+        self.calls += 1
+        extract, reason = await self._decide(message, pattern_meaningful)
+        self.reasons[reason] = self.reasons.get(reason, 0) + 1
+        if not extract:
+            self.skipped += 1
+        return extract
+
+    async def _decide(self, message: str, pattern_meaningful: bool) -> Tuple[bool, str]:
+        if not EXTRACTION_GATE_ENABLED:
+            return True, "disabled"
+        if pattern_meaningful:
+            return True, "pattern"
+        score = keyword_score(message)
+        if score >= EXTRACTION_GATE_KEYWORD_PASS_SCORE:
+            return True, "keyword_pass"
+        if score <= EXTRACTION_GATE_KEYWORD_SKIP_SCORE:
+            return False, "keyword_skip"
+        try:
+            margin = await self.classifier_margin(message)
+        except Exception as e:
+            # Fail open: a missed memory costs more than one extraction call
+            logger.warning(f"Extraction gate classifier failed: {e}")
+            return True, "classifier_error"
+        if margin >= EXTRACTION_GATE_CLASSIFIER_MARGIN:
+            return True, "classifier_pass"
+        return False, "classifier_skip"
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": EXTRACTION_GATE_ENABLED,
+            "calls": self.calls,
+            "skipped": self.skipped,
+            "skipped_fraction": round(self.skipped / self.calls, 4) if self.calls else 0.0,
+            "reasons": dict(self.reasons)
+        }
+
+extraction_gate = ExtractionGate()
+register_metrics_source("extraction_gate", extraction_gate.stats)
@@ -1,20 +1,27 @@
 from typing import Dict, Any
+from .text_scanner import (
+    scan_text,
+    CONTEXTUAL_FALLBACK_EMOTIONS,
+    PATTERN_FALLBACK_EMOTIONS,
+    RELATIONSHIP_WORDS,
+    CONFLICT_WORDS
+)
 
 def generate_contextual_fallback(prompt: str) -> str:
     """Generate contextual fallback responses based on the prompt content."""
-    prompt_lower = prompt.lower()
+    scan = scan_text(prompt)
     
-    if "apologize" in prompt_lower and "friend" in prompt_lower:
+    if scan.has("apologize") and scan.has("friend"):
         return "It sounds like you're dealing with a difficult situation with your friend. What happened that's making you consider apologizing?"
-    elif "fight" in prompt_lower or "argument" in prompt_lower:
+    elif scan.has("fight", "argument"):
         return "Arguments can be really tough. How are you feeling about what happened? Sometimes talking through it helps."
-    elif "friend" in prompt_lower and ("best" in prompt_lower or "close" in prompt_lower):
+    elif scan.has("friend") and scan.has("best", "close"):
         return "Best friend situations can be especially hard when there's conflict. What's been going on between you two?"
-    elif any(emotion in prompt_lower for emotion in ["sad", "angry", "frustrated", "upset", "low", "down"]):
+    elif scan.has(*CONTEXTUAL_FALLBACK_EMOTIONS):
         return "I can hear that you're going through a tough time. What's been weighing on your mind?"
-    elif "relationship" in prompt_lower:
+    elif scan.has("relationship"):
         return "Relationships can be complicated. What's happening that's concerning you?"
-    elif "work" in prompt_lower or "job" in prompt_lower:
+    elif scan.has("work", "job"):
         return "Work situations can be stressful. What's going on at work that you'd like to talk about?"
     else:
         return "I'm here to listen and support you. Can you tell me more about what's happening?"
@@ -41,26 +48,24 @@ def create_pattern_based_fallback(prompt: str) -> Dict[str, Any]:
     }
     
     if message_content:
-        message_lower = message_content.lower()
+        scan = scan_text(message_content)
         
         # Check for relationships
-        if any(word in message_lower for word in ["friend", "best friend", "buddy", "colleague", "family"]):
+        if scan.has(*RELATIONSHIP_WORDS):
             has_meaningful = True
-            if "best friend" in message_lower:
+            if scan.has("best friend"):
                 extracted_info["people"].append("User mentioned their best friend")
-            elif "friend" in message_lower:
+            elif scan.has("friend"):
                 extracted_info["people"].append("User mentioned a friend")
         
         # Check for emotions
-        emotions = ["sad", "angry", "frustrated", "upset", "happy", "excited", "worried", "anxious", "low", "down"]
-        for emotion in emotions:
-            if emotion in message_lower:
-                has_meaningful = True
-                extracted_info["emotions"].append(f"User is feeling {emotion}")
-                break
+        emotion = scan.first(PATTERN_FALLBACK_EMOTIONS)
+        if emotion:
+            has_meaningful = True
+            extracted_info["emotions"].append(f"User is feeling {emotion}")
         
         # Check for situations
-        if any(word in message_lower for word in ["fight", "argument", "conflict", "problem", "issue"]):
+        if scan.has(*CONFLICT_WORDS):
             has_meaningful = True
             extracted_info["situations"].append("User is dealing with a conflict situation")
     
@@ -1,7 +1,6 @@
-import google.generativeai as genai
 from typing import Dict, Any
-from .config import logger, openai_client
-import os
+from .config import logger, GEMINI_MODEL_NAME, OPENAI_FALLBACK_MODEL_NAME
+from .providers import providers
 
 # --- Health Check Functions ---
 async def check_ai_services_health() -> Dict[str, Any]:
@@ -13,8 +12,9 @@ async def check_ai_services_health() -> Dict[str, Any]:
     
     # Test Gemini
     try:
-        model = genai.GenerativeModel(os.getenv("GEMINI_MODEL_NAME", "gemini-2.5-flash"))
-        response = await model.generate_content_async("Test")
+        model = providers.gemini_model(GEMINI_MODEL_NAME)
+        async with providers.track("gemini"):
+            response = await model.generate_content_async("Test")
         health_status["gemini"]["available"] = True
         logger.info("Gemini service is healthy")
     except Exception as e:
@@ -22,13 +22,15 @@ async def check_ai_services_health() -> Dict[str, Any]:
         logger.warning(f"Gemini service unavailable: {e}")
     
     # Test OpenAI
+    openai_client = providers.openai
     if openai_client:
         try:
-            response = await openai_client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": "Test"}],
-                max_tokens=5
-            )
+            async with providers.track("openai"):
+                response = await openai_client.chat.completions.create(
+                    model=OPENAI_FALLBACK_MODEL_NAME,
+                    messages=[{"role": "user", "content": "Test"}],
+                    max_tokens=5
+                )
             health_status["openai"]["available"] = True
             logger.info("OpenAI service is healthy")
         except Exception as e:
@@ -3,13 +3,25 @@ from typing import List, Dict, Any
 from .config import logger
 from .ai_model_utils import call_ai_for_json_with_fallback
 from .fallback_utils import create_fallback_structure
+from .extraction_gate import extraction_gate
+from .text_scanner import scan_text
 
 # --- Vector-Based Memory Functions ---
+def _pattern_result(user_message: str, has_meaningful: bool, extracted_info: Dict[str, List[str]]) -> Dict[str, Any]:
+    """Extraction result built from the regex pass alone."""
+    return {
+        "has_meaningful_content": has_meaningful,
+        "information_type": "relationship" if extracted_info["people"] else "emotion" if extracted_info["emotions"] else "other",
+        "extracted_info": extracted_info,
+        "key_entities": [],
+        "summary": user_message[:100],
+        "priority": "medium" if has_meaningful else "low"
+    }
+
 async def extract_user_information(user_message: str) -> Dict[str, Any]:
     """Extract meaningful information from user messages with fallback logic."""
     try:
         # Simple pattern-based extraction as fallback
-        has_meaningful = False
         extracted_info = {
             "people": [],
             "facts": [],
@@ -18,49 +30,26 @@ async def extract_user_information(user_message: str) -> Dict[str, Any]:
             "situations": []
         }
         
-        message_lower = user_message.lower()
+        scan = scan_text(user_message)
         
         # Check for meaningful content patterns
-        meaningful_patterns = [
-            r'\b(friend|best friend|buddy|colleague|coworker|boss|manager|brother|sister|mom|dad|mother|father)\b',
-            r'\b(love|hate|like|dislike|prefer|enjoy|feel|emotion)\b',
-            r'\b(work|job|school|university|college)\b',
-            r'\b(today|yesterday|tomorrow|next week|last week)\b'
-        ]
-        
-        for pattern in meaningful_patterns:
-            if re.search(pattern, message_lower):
-                has_meaningful = True
-                break
+        has_meaningful = scan.matches_any("meaningful")
         
         # Extract relationships
-        relationship_patterns = [
-            (r'my\s+(friend|best friend|buddy)\s+(\w+)', 'friend'),
-            (r'(\w+)\s+is\s+my\s+(friend|buddy)', 'friend'),
-            (r'my\s+(colleague|coworker|boss)\s+(\w+)', 'colleague'),
-            (r'my\s+(brother|sister|mom|dad)\s*(\w*)', 'family')
-        ]
-        
-        for pattern, rel_type in relationship_patterns:
-            matches = re.finditer(pattern, message_lower)
-            for match in matches:
-                if len(match.groups()) >= 2 and match.group(2).isalpha():
-                    extracted_info["people"].append(f"{match.group(2).capitalize()} is user's {rel_type}")
+        for rel_type in ('friend', 'colleague', 'family'):
+            for match in scan.matches(f"relationship:{rel_type}"):
+                if match.groups[1].isalpha():
+                    extracted_info["people"].append(f"{match.groups[1].capitalize()} is user's {rel_type}")
                     has_meaningful = True
         
         # Extract emotions
-        emotion_patterns = [
-            r'feel\s+(sad|happy|angry|frustrated|excited|anxious|worried|stressed)',
-            r'(sad|happy|angry|frustrated|excited|anxious|worried|stressed)\s+about',
-            r'i\s+am\s+(sad|happy|angry|frustrated|excited|anxious|worried|stressed)'
-        ]
+        for match in scan.matches("emotion"):
+            extracted_info["emotions"].append(f"User is feeling {match.groups[0]}")
+            has_meaningful = True
         
-        for pattern in emotion_patterns:
-            matches = re.finditer(pattern, message_lower)
-            for match in matches:
-                emotion = match.group(1) if len(match.groups()) >= 1 else "emotional"
-                extracted_info["emotions"].append(f"User is feeling {emotion}")
-                has_meaningful = True
+        # Skip the LLM call for messages with nothing worth remembering
+        if not await extraction_gate.should_extract(user_message, has_meaningful):
+            return _pattern_result(user_message, has_meaningful, extracted_info)
         
         # Try AI extraction with fallback
         prompt = f"""
@@ -105,14 +94,7 @@ async def extract_user_information(user_message: str) -> Dict[str, Any]:
             logger.warning(f"AI extraction failed, using pattern-based results: {ai_error}")
         
         # Return pattern-based results
-        return {
-            "has_meaningful_content": has_meaningful,
-            "information_type": "relationship" if extracted_info["people"] else "emotion" if extracted_info["emotions"] else "other",
-            "extracted_info": extracted_info,
-            "key_entities": [],
-            "summary": user_message[:100],
-            "priority": "medium" if has_meaningful else "low"
-        }
+        return _pattern_result(user_message, has_meaningful, extracted_info)
             
     except Exception as e:
         logger.error(f"Information extraction failed: {e}")
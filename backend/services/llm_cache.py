@@ -0,0 +1,157 @@
+import asyncio
+import asyncpg
+import copy
+import hashlib
+import json
+import re
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional, Set, Tuple
+from .config import (
+    logger,
+    LLM_CACHE_MAX_ENTRIES,
+    LLM_CACHE_TTL_SECONDS,
+    LLM_CACHE_PERSISTENT,
+    LLM_COST_PER_1K_INPUT_TOKENS,
+    LLM_COST_PER_1K_OUTPUT_TOKENS
+)
+from .metrics import register_metrics_source
+
+# Expired rows are purged from the shared tier once every this many writes
+_PURGE_EVERY_WRITES = 200
+
+# Bumped when the key scheme changes, so entries cached under the old one are not reused
+_KEY_VERSION = 2
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    Whitespace differences do not change what the extraction returns; case
+    does (names, person_name), so it is kept.
+    """
+    return re.sub(r'\s+', ' ', prompt).strip()
+
+def llm_cache_key(prompt: str, model: str) -> str:
+    return hashlib.sha256(f"v{_KEY_VERSION}\0{model}\0{normalize_prompt(prompt)}".encode("utf-8")).hexdigest()
+
+def estimate_call_cost(prompt: str, result: Dict[str, Any]) -> float:
+    """Rough provider cost of one call, at ~4 characters per token."""
+    input_tokens = len(prompt) / 4
+    output_tokens = len(json.dumps(result)) / 4
+    return (input_tokens * LLM_COST_PER_1K_INPUT_TOKENS + output_tokens * LLM_COST_PER_1K_OUTPUT_TOKENS) / 1000
+
+class LLMResultCache:
+    """In-process LRU of LLM JSON results with a TTL, and an optional Postgres tier."""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # key -> (expires_at epoch seconds, result, estimated cost of the call)
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any], float]]" = OrderedDict()
+        self._pool: Optional[asyncpg.Pool] = None
+        self._persist_tasks: Set[asyncio.Task] = set()
+        self._writes = 0
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.saved_cost_usd = 0.0
+
+    def enable_persistent_tier(self, pool: asyncpg.Pool):
+        self._pool = pool
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Cached result for `key` (a copy), checking the shared tier on a local miss."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, result, cost = entry
+            if expires_at > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                self.saved_cost_usd += cost
+                return copy.deepcopy(result)
+            del self._entries[key]
+            self.expired += 1
+
+        found = await self._fetch_persistent(key)
+        if found is not None:
+            expires_at, result, cost = found
+            self._store(key, expires_at, result, cost)
+            self.persistent_hits += 1
+            self.saved_cost_usd += cost
+            return copy.deepcopy(result)
+
+        self.misses += 1
+        return None
+
+    def put(self, key: str, prompt: str, result: Dict[str, Any]):
+        cost = estimate_call_cost(prompt, result)
+        expires_at = time.time() + self.ttl_seconds
+        self._store(key, expires_at, copy.deepcopy(result), cost)
+        if self._pool is not None:
+            task = asyncio.create_task(self._write_persistent(key, result, cost, expires_at))
+            self._persist_tasks.add(task)
+            task.add_done_callback(self._persist_tasks.discard)
+
+    def _store(self, key: str, expires_at: float, result: Dict[str, Any], cost: float):
+        self._entries[key] = (expires_at, result, cost)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def _fetch_persistent(self, key: str) -> Optional[Tuple[float, Dict[str, Any], float]]:
+        if self._pool is None:
+            return None
+        try:
+            async with self._pool.acquire() as conn:
+                row = await conn.fetchrow(
+                    """SELECT result, cost_usd, expires_at FROM llm_result_cache
+                       WHERE cache_key = $1 AND expires_at > $2""",
+                    key, datetime.utcnow()
+                )
+        except Exception as e:
+            logger.warning(f"LLM result cache lookup failed: {e}")
+            return None
+        if row is None:
+            return None
+        return row['expires_at'].timestamp(), json.loads(row['result']), row['cost_usd']
+
+    async def _write_persistent(self, key: str, result: Dict[str, Any], cost: float, expires_at: float):
+        self._writes += 1
+        try:
+            async with self._pool.acquire() as conn:
+                await conn.execute(
+                    """INSERT INTO llm_result_cache (cache_key, result, cost_usd, expires_at, created_at)
+                       VALUES ($1, $2, $3, $4, $5)
+                       ON CONFLICT (cache_key) DO UPDATE
+                       SET result = EXCLUDED.result, cost_usd = EXCLUDED.cost_usd, expires_at = EXCLUDED.expires_at""",
+                    key, json.dumps(result), cost, datetime.utcfromtimestamp(expires_at), datetime.utcnow()
+                )
+                if self._writes % _PURGE_EVERY_WRITES == 0:
+                    await conn.execute("DELETE FROM llm_result_cache WHERE expires_at <= $1", datetime.utcnow())
+        except Exception as e:
+            logger.warning(f"Failed to persist LLM result: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.persistent_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "persistent_hits": self.persistent_hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "hit_rate": round((self.hits + self.persistent_hits) / lookups, 4) if lookups else 0.0,
+            "saved_cost_usd": round(self.saved_cost_usd, 6),
+            "persistent_tier": self._pool is not None
+        }
+
+llm_cache = LLMResultCache(LLM_CACHE_MAX_ENTRIES, LLM_CACHE_TTL_SECONDS)
+register_metrics_source("llm_cache", llm_cache.stats)
+
+def configure_llm_cache(pool: asyncpg.Pool):
+    """Attach the persistent tier if enabled."""
+    if LLM_CACHE_PERSISTENT:
+        llm_cache.enable_persistent_tier(pool)
+        logger.info("LLM result cache persistent tier enabled.")
@@ -0,0 +1,312 @@
+import json
+import time
+import numpy as np
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from .config import (
+    logger,
+    MEMORY_CACHE_MAX_BYTES,
+    MEMORY_CACHE_MAX_ENTRY_BYTES,
+    MEMORY_CACHE_TTL_SECONDS
+)
+from .memory_scoring import (
+    EMBEDDING_DIMENSION,
+    build_embedding_matrix,
+    normalize_rows,
+    normalize_vector,
+    top_k_similarities
+)
+from .metrics import register_metrics_source
+
+# Rough size of the Python objects kept next to each embedding row
+_ROW_OVERHEAD_BYTES = 256
+_INITIAL_CAPACITY = 16
+
+class UserMemorySet:
+    """One user's memories: a normalized float32 matrix plus the row data needed to answer queries."""
+
+    def __init__(self, capacity: int = _INITIAL_CAPACITY):
+        self.matrix = np.zeros((capacity, EMBEDDING_DIMENSION), dtype=np.float32)
+        self.valid = np.zeros(capacity, dtype=bool)
+        self.ids: List[Any] = []
+        self.contents: List[str] = []
+        self.metadata: List[Dict[str, Any]] = []
+        self.created_at: List[datetime] = []
+        self.updated_at: List[datetime] = []
+        self.row_bytes = 0
+        self.loaded_at = time.monotonic()
+
+    @classmethod
+    def from_rows(cls, rows: Sequence[Any]) -> "UserMemorySet":
+        """Build a set from user_memories rows (id, content, embedding, metadata, created_at, updated_at)."""
+        memory_set = cls(capacity=max(len(rows), _INITIAL_CAPACITY))
+        matrix, valid = build_embedding_matrix([row['embedding'] for row in rows])
+        normalize_rows(matrix)
+        memory_set.matrix[:len(rows)] = matrix
+        memory_set.valid[:len(rows)] = valid
+        for row in rows:
+            try:
+                metadata = json.loads(row['metadata']) if row['metadata'] else {}
+            except (TypeError, ValueError):
+                metadata = {}
+            memory_set._append_row(
+                row['id'], row['content'], metadata, row['created_at'], row['updated_at']
+            )
+        return memory_set
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def nbytes(self) -> int:
+        return self.matrix.nbytes + self.valid.nbytes + self.row_bytes
+
+    def _append_row(self, memory_id, content, metadata, created_at, updated_at) -> None:
+        self.ids.append(memory_id)
+        self.contents.append(content)
+        self.metadata.append(metadata)
+        self.created_at.append(created_at)
+        self.updated_at.append(updated_at or created_at)
+        self.row_bytes += len(content) + _ROW_OVERHEAD_BYTES
+
+    def append(
+        self,
+        memory_id: Any,
+        embedding: Optional[np.ndarray],
+        content: str,
+        metadata: Dict[str, Any],
+        created_at: datetime,
+        updated_at: Optional[datetime] = None
+    ) -> None:
+        """Append one memory, growing the matrix geometrically when full."""
+        row = len(self.ids)
+        if row == self.matrix.shape[0]:
+            self._grow()
+        if embedding is not None:
+            self.matrix[row] = normalize_vector(embedding)
+            self.valid[row] = True
+        self._append_row(memory_id, content, metadata, created_at, updated_at)
+
+    def _grow(self) -> None:
+        size = len(self.ids)
+        capacity = max(_INITIAL_CAPACITY, self.matrix.shape[0] * 2)
+        matrix = np.zeros((capacity, EMBEDDING_DIMENSION), dtype=np.float32)
+        valid = np.zeros(capacity, dtype=bool)
+        matrix[:size] = self.matrix[:size]
+        valid[:size] = self.valid[:size]
+        self.matrix, self.valid = matrix, valid
+
+    def remove(self, memory_ids: Iterable[Any]) -> int:
+        """Drop rows by id, compacting the matrix in place. Returns the number removed."""
+        doomed = set(memory_ids)
+        keep = [row for row, memory_id in enumerate(self.ids) if memory_id not in doomed]
+        size = len(self.ids)
+        if len(keep) == size:
+            return 0
+
+        kept = len(keep)
+        rows = np.asarray(keep, dtype=np.intp)
+        self.matrix[:kept] = self.matrix[rows]
+        self.valid[:kept] = self.valid[rows]
+        self.matrix[kept:size] = 0
+        self.valid[kept:size] = False
+
+        self.ids = [self.ids[row] for row in keep]
+        self.contents = [self.contents[row] for row in keep]
+        self.metadata = [self.metadata[row] for row in keep]
+        self.created_at = [self.created_at[row] for row in keep]
+        self.updated_at = [self.updated_at[row] for row in keep]
+        self.row_bytes = sum(len(content) + _ROW_OVERHEAD_BYTES for content in self.contents)
+        return size - kept
+
+    def update(self, memory_id: Any, metadata: Dict[str, Any], updated_at: datetime) -> bool:
+        """Replace one row's metadata and updated_at (a consolidated duplicate)."""
+        try:
+            row = self.ids.index(memory_id)
+        except ValueError:
+            return False
+        self.metadata[row] = metadata
+        self.updated_at[row] = updated_at
+        return True
+
+    def search(
+        self,
+        query_embedding: np.ndarray,
+        limit: int,
+        filter_metadata: Optional[Dict[str, Any]] = None
+    ) -> List[Tuple[int, float]]:
+        """Rank rows by cosine similarity to the query; returns (row, similarity) pairs."""
+        size = len(self.ids)
+        if filter_metadata:
+            rows = np.asarray(self._matching_rows(filter_metadata), dtype=np.intp)
+            if not rows.size:
+                return []
+            ranked = top_k_similarities(
+                self.matrix[rows], normalize_vector(query_embedding), limit, self.valid[rows]
+            )
+            return [(int(rows[index]), similarity) for index, similarity in ranked]
+
+        return top_k_similarities(
+            self.matrix[:size], normalize_vector(query_embedding), limit, self.valid[:size]
+        )
+
+    def _matching_rows(self, filter_metadata: Dict[str, Any]) -> List[int]:
+        """Rows whose metadata contains every filter key/value (the `metadata @>` predicate)."""
+        return [
+            row for row, metadata in enumerate(self.metadata)
+            if all(metadata.get(k) == v for k, v in filter_metadata.items())
+        ]
+
+    def recent(self, limit: int, filter_metadata: Optional[Dict[str, Any]] = None) -> List[Tuple[int, float]]:
+        """Most recently updated rows first, mirroring the ORDER BY updated_at DESC query."""
+        rows = self._matching_rows(filter_metadata) if filter_metadata else range(len(self.ids))
+        rows = sorted(rows, key=lambda row: self.updated_at[row], reverse=True)
+        return [(row, 0.0) for row in rows[:limit]]
+
+    def to_memory(self, row: int, similarity: float) -> Dict[str, Any]:
+        """Format one row like get_user_memories_vector results."""
+        return {
+            'content': self.contents[row],
+            'metadata': dict(self.metadata[row]),
+            'created_at': self.created_at[row],
+            'updated_at': self.updated_at[row],
+            'relevance_score': similarity
+        }
+
+class UserMemoryCache:
+    """
+    Bounded LRU of UserMemorySet by user id.
+
+    Writers append to or remove from a cached set instead of invalidating it.
+    A load that races with a write for the same user is discarded (see
+    begin_load/finish_load) so a stale snapshot never replaces fresher data.
+    """
+
+    def __init__(self, max_bytes: int, max_entry_bytes: int, ttl_seconds: float):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = min(max_entry_bytes, max_bytes)
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, UserMemorySet]" = OrderedDict()
+        self._pending_loads: Dict[str, object] = {}
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, user_id: str) -> Optional[UserMemorySet]:
+        entry = self._entries.get(user_id)
+        if entry is not None and time.monotonic() - entry.loaded_at > self.ttl_seconds:
+            self._drop(user_id)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        return entry
+
+    def begin_load(self, user_id: str) -> object:
+        """Mark a load as in flight; writes for the user until finish_load void it."""
+        token = object()
+        self._pending_loads[user_id] = token
+        return token
+
+    def finish_load(self, user_id: str, token: object, memory_set: UserMemorySet) -> bool:
+        """Cache a freshly loaded set unless a write raced with it or it is over budget."""
+        if self._pending_loads.get(user_id) is not token:
+            return False
+        del self._pending_loads[user_id]
+        if memory_set.nbytes > self.max_entry_bytes:
+            logger.info(f"Memory set for {user_id} ({memory_set.nbytes} bytes) exceeds cache entry budget")
+            return False
+        self._drop(user_id)
+        self._entries[user_id] = memory_set
+        self.total_bytes += memory_set.nbytes
+        self._evict_over_budget()
+        return True
+
+    def append(
+        self,
+        user_id: str,
+        memory_id: Any,
+        embedding: Optional[np.ndarray],
+        content: str,
+        metadata: Dict[str, Any],
+        created_at: datetime,
+        updated_at: Optional[datetime] = None
+    ) -> None:
+        """Apply a newly written memory to the user's cached set, if any."""
+        entry = self._entries.get(user_id)
+        if entry is None:
+            self._pending_loads.pop(user_id, None)
+            return
+        before = entry.nbytes
+        entry.append(memory_id, embedding, content, metadata, created_at, updated_at)
+        self._account(user_id, entry, before)
+
+    def remove(self, user_id: str, memory_ids: Iterable[Any]) -> None:
+        """Apply deleted memories to the user's cached set, if any."""
+        entry = self._entries.get(user_id)
+        if entry is None:
+            self._pending_loads.pop(user_id, None)
+            return
+        before = entry.nbytes
+        entry.remove(memory_ids)
+        self._account(user_id, entry, before)
+
+    def update(self, user_id: str, memory_id: Any, metadata: Dict[str, Any], updated_at: datetime) -> None:
+        """Apply a metadata/updated_at change to the user's cached set, if any."""
+        entry = self._entries.get(user_id)
+        if entry is None:
+            self._pending_loads.pop(user_id, None)
+            return
+        entry.update(memory_id, metadata, updated_at)
+
+    def invalidate(self, user_id: str) -> None:
+        """Forget everything cached (or being loaded) for a user."""
+        self._pending_loads.pop(user_id, None)
+        if self._drop(user_id):
+            self.invalidations += 1
+
+    def _account(self, user_id: str, entry: UserMemorySet, before: int) -> None:
+        self.total_bytes += entry.nbytes - before
+        if entry.nbytes > self.max_entry_bytes:
+            self._drop(user_id)
+            self.evictions += 1
+        self._evict_over_budget()
+
+    def _drop(self, user_id: str) -> bool:
+        entry = self._entries.pop(user_id, None)
+        if entry is None:
+            return False
+        self.total_bytes -= entry.nbytes
+        return True
+
+    def _evict_over_budget(self) -> None:
+        while self.total_bytes > self.max_bytes and self._entries:
+            _, entry = self._entries.popitem(last=False)
+            self.total_bytes -= entry.nbytes
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "users": len(self._entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "loads_in_flight": len(self._pending_loads)
+        }
+
+memory_cache = UserMemoryCache(
+    max_bytes=MEMORY_CACHE_MAX_BYTES,
+    max_entry_bytes=MEMORY_CACHE_MAX_ENTRY_BYTES,
+    ttl_seconds=MEMORY_CACHE_TTL_SECONDS
+)
+register_metrics_source("memory_cache", memory_cache.stats)
@@ -0,0 +1,228 @@
+import asyncio
+import asyncpg
+import json
+import numpy as np
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from .config import (
+    logger,
+    MEMORY_DEDUP_THRESHOLD,
+    MEMORY_DEDUP_SWEEP_ENABLED,
+    MEMORY_DEDUP_SWEEP_INTERVAL_SECONDS
+)
+from .embedding_storage import PGVECTOR_COLUMN_TYPE, get_embedding_column_type
+from .memory_cache import memory_cache
+from .memory_scoring import build_embedding_matrix, normalize_rows
+from .metrics import register_metrics_source
+
+# Interactions are a rolling window pruned by update_user_context_vector, not facts
+UNCONSOLIDATED_TYPES = ('interaction',)
+
+_PRIORITY_ORDER = {'low': 0, 'medium': 1, 'high': 2}
+
+def merge_memory_metadata(existing: Dict[str, Any], incoming: Dict[str, Any]) -> Dict[str, Any]:
+    """Fold a duplicate's metadata into the memory that is kept."""
+    merged = dict(existing)
+    for key, value in incoming.items():
+        merged.setdefault(key, value)
+    merged['mention_count'] = int(existing.get('mention_count', 1)) + int(incoming.get('mention_count', 1))
+
+    entities = list(existing.get('key_entities') or [])
+    entities += [entity for entity in incoming.get('key_entities') or [] if entity not in entities]
+    merged['key_entities'] = entities
+
+    if _PRIORITY_ORDER.get(incoming.get('priority'), -1) > _PRIORITY_ORDER.get(existing.get('priority'), -1):
+        merged['priority'] = incoming['priority']
+    if incoming.get('conversation_id'):
+        merged['last_conversation_id'] = incoming['conversation_id']
+
+    # The frontend may still hold the duplicate's temp_id; deleting by it reaches this row
+    aliases = list(existing.get('merged_temp_ids') or [])
+    for alias in [incoming.get('temp_id'), *(incoming.get('merged_temp_ids') or [])]:
+        if alias and alias != existing.get('temp_id') and alias not in aliases:
+            aliases.append(alias)
+    if aliases:
+        merged['merged_temp_ids'] = aliases
+    return merged
+
+def find_duplicate_groups(
+    normalized_matrix: np.ndarray,
+    types: Sequence[Optional[str]],
+    threshold: float = MEMORY_DEDUP_THRESHOLD,
+    valid: Optional[np.ndarray] = None
+) -> List[Tuple[int, List[int]]]:
+    """
+    Group rows of the same type whose cosine similarity reaches `threshold`.
+
+    Greedy and order-preserving: each group is kept at its earliest row, so
+    callers pass rows oldest-first. Returns (kept_row, duplicate_rows) pairs.
+    """
+    types = np.asarray(types, dtype=object)
+    usable = np.ones(len(types), dtype=bool) if valid is None else valid.astype(bool)
+    groups = []
+    for memory_type in set(types[usable]):
+        if memory_type in UNCONSOLIDATED_TYPES:
+            continue
+        rows = np.flatnonzero((types == memory_type) & usable)
+        vectors = normalized_matrix[rows]
+        absorbed = np.zeros(len(rows), dtype=bool)
+        for position in range(len(rows) - 1):
+            if absorbed[position]:
+                continue
+            similarities = vectors[position + 1:] @ vectors[position]
+            duplicates = np.flatnonzero((similarities >= threshold) & ~absorbed[position + 1:]) + position + 1
+            if duplicates.size:
+                absorbed[duplicates] = True
+                groups.append((int(rows[position]), rows[duplicates].tolist()))
+    return sorted(groups)
+
+def _parse_metadata(raw: Optional[str]) -> Dict[str, Any]:
+    try:
+        return json.loads(raw) if raw else {}
+    except (TypeError, ValueError):
+        return {}
+
+async def consolidate_user_memories(pool: asyncpg.Pool, user_id: str) -> int:
+    """Merge one user's stored near-duplicates; returns the number of rows removed."""
+    async with pool.acquire() as conn:
+        column_type = await get_embedding_column_type(conn)
+        embedding_column = "embedding::text" if column_type == PGVECTOR_COLUMN_TYPE else "embedding"
+        rows = await conn.fetch(
+            f"""SELECT id, {embedding_column} AS embedding, metadata, updated_at
+               FROM user_memories
+               WHERE user_id = $1 AND embedding IS NOT NULL
+               AND COALESCE(metadata->>'type', '') <> ALL($2::text[])
+               ORDER BY created_at""",
+            user_id, list(UNCONSOLIDATED_TYPES)
+        )
+        if len(rows) < 2:
+            return 0
+
+        metadata = [_parse_metadata(row['metadata']) for row in rows]
+
+        def group_rows():
+            matrix, valid = build_embedding_matrix([row['embedding'] for row in rows])
+            normalize_rows(matrix)
+            return find_duplicate_groups(matrix, [m.get('type') for m in metadata], valid=valid)
+
+        # Pairwise scoring is quadratic per type, so keep it off the event loop
+        groups = await asyncio.to_thread(group_rows)
+        if not groups:
+            return 0
+
+        updates, doomed = [], []
+        async with conn.transaction():
+            # Grouping ran on a snapshot; lock the rows and skip any group that a
+            # write-time merge, edit or delete has touched since (the next sweep retries it)
+            involved = [rows[index]['id'] for kept, duplicates in groups for index in [kept, *duplicates]]
+            current = {
+                row['id']: row for row in await conn.fetch(
+                    "SELECT id, metadata, updated_at FROM user_memories WHERE id = ANY($1::uuid[]) FOR UPDATE",
+                    involved
+                )
+            }
+            skipped = 0
+            for kept, duplicates in groups:
+                members = [rows[index] for index in [kept, *duplicates]]
+                if any(
+                    member['id'] not in current
+                    or current[member['id']]['updated_at'] != member['updated_at']
+                    or current[member['id']]['metadata'] != member['metadata']
+                    for member in members
+                ):
+                    skipped += 1
+                    continue
+                merged, updated_at = metadata[kept], rows[kept]['updated_at']
+                for duplicate in duplicates:
+                    merged = merge_memory_metadata(merged, metadata[duplicate])
+                    updated_at = max(updated_at, rows[duplicate]['updated_at'])
+                    doomed.append(rows[duplicate]['id'])
+                updates.append((rows[kept]['id'], json.dumps(merged), updated_at))
+
+            if updates:
+                await conn.executemany(
+                    "UPDATE user_memories SET metadata = $2, updated_at = $3 WHERE id = $1", updates
+                )
+                await conn.execute("DELETE FROM user_memories WHERE id = ANY($1::uuid[])", doomed)
+        if skipped:
+            logger.info(f"Skipped {skipped} duplicate groups for {user_id} that changed during consolidation.")
+
+    if doomed:
+        memory_cache.invalidate(user_id)
+    return len(doomed)
+
+class MemoryConsolidator:
+    """Counts write-time merges and runs the periodic backlog sweep."""
+
+    def __init__(self):
+        self._pool: Optional[asyncpg.Pool] = None
+        self._worker: Optional[asyncio.Task] = None
+        self.merged_on_write = 0
+        self.merged_by_sweep = 0
+        self.sweeps = 0
+        self.users_swept = 0
+        self.failures = 0
+
+    def start(self, pool: asyncpg.Pool):
+        if not MEMORY_DEDUP_SWEEP_ENABLED:
+            logger.info("Memory consolidation sweep disabled; duplicates are only merged on write.")
+            return
+        if self._worker is not None and not self._worker.done():
+            return
+        self._pool = pool
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.sweep()
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"Memory consolidation sweep failed: {e}", exc_info=True)
+            await asyncio.sleep(MEMORY_DEDUP_SWEEP_INTERVAL_SECONDS)
+
+    async def sweep(self):
+        """Consolidate every user's memories, one user at a time, in a single process."""
+        async with self._pool.acquire() as lock_conn:
+            if not await lock_conn.fetchval("SELECT pg_try_advisory_lock(hashtext('memory_consolidation'))"):
+                return
+            try:
+                user_ids = [row['user_id'] for row in await lock_conn.fetch(
+                    "SELECT DISTINCT user_id FROM user_memories WHERE user_id IS NOT NULL"
+                )]
+                removed = 0
+                for user_id in user_ids:
+                    try:
+                        removed += await consolidate_user_memories(self._pool, user_id)
+                    except Exception as e:
+                        self.failures += 1
+                        logger.warning(f"Failed to consolidate memories for {user_id}: {e}")
+                    self.users_swept += 1
+                self.merged_by_sweep += removed
+                self.sweeps += 1
+                logger.info(f"Memory consolidation sweep merged {removed} duplicates across {len(user_ids)} users.")
+            finally:
+                await lock_conn.execute("SELECT pg_advisory_unlock(hashtext('memory_consolidation'))")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "threshold": MEMORY_DEDUP_THRESHOLD,
+            "sweep_enabled": MEMORY_DEDUP_SWEEP_ENABLED,
+            "merged_on_write": self.merged_on_write,
+            "merged_by_sweep": self.merged_by_sweep,
+            "sweeps": self.sweeps,
+            "users_swept": self.users_swept,
+            "failures": self.failures
+        }
+
+memory_consolidator = MemoryConsolidator()
+register_metrics_source("memory_consolidation", memory_consolidator.stats)
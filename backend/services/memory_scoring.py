@@ -0,0 +1,103 @@
+import json
+import numpy as np
+from typing import Any, List, Optional, Sequence, Tuple
+
+# all-MiniLM-L6-v2 output size, matches the VECTOR(384) schema
+EMBEDDING_DIMENSION = 384
+
+# Byte length of a binary embedding -> element type it was written with
+BINARY_DTYPES_BY_SIZE = {
+    EMBEDDING_DIMENSION * 4: np.float32,
+    EMBEDDING_DIMENSION * 2: np.float16,
+}
+
+# Score given to rows whose stored embedding cannot be decoded, so they can
+# still surface behind real matches instead of disappearing silently.
+UNDECODABLE_SIMILARITY = 0.1
+
+def decode_embedding(value: Any) -> Optional[np.ndarray]:
+    """Decode one stored embedding (BYTEA, JSON/pgvector text or a sequence) into a vector."""
+    if value is None:
+        return None
+    try:
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            # Binary rows are raw float32 or float16; the element size follows from the length
+            dtype = BINARY_DTYPES_BY_SIZE.get(len(value))
+            if dtype is None:
+                return None
+            return np.frombuffer(value, dtype=dtype)
+        if isinstance(value, str):
+            # JSON lists and pgvector's text output share the "[x, y, ...]" form
+            vector = np.asarray(json.loads(value), dtype=np.float32)
+        else:
+            vector = np.asarray(value, dtype=np.float32)
+    except (ValueError, TypeError):
+        return None
+    if vector.ndim != 1 or vector.shape[0] != EMBEDDING_DIMENSION:
+        return None
+    return vector
+
+def encode_embedding_binary(embedding: Any, dtype: str = "float32") -> bytes:
+    """Serialize an embedding for a BYTEA column (see decode_embedding)."""
+    return np.asarray(embedding, dtype=dtype).reshape(-1).tobytes()
+
+def build_embedding_matrix(values: Sequence[Any]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Decode stored embeddings into one contiguous float32 matrix.
+
+    Binary rows are viewed with np.frombuffer, so the only copy is the write
+    into the matrix (which also widens float16 rows to float32).
+
+    Returns the (n, EMBEDDING_DIMENSION) matrix and a boolean mask of rows that
+    decoded successfully; undecodable rows are left as zeros.
+    """
+    matrix = np.zeros((len(values), EMBEDDING_DIMENSION), dtype=np.float32)
+    valid = np.zeros(len(values), dtype=bool)
+    for row, value in enumerate(values):
+        vector = decode_embedding(value)
+        if vector is not None:
+            matrix[row] = vector
+            valid[row] = True
+    return matrix, valid
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """L2-normalize each row in place; all-zero rows are left untouched."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return matrix
+
+def normalize_vector(vector: np.ndarray) -> np.ndarray:
+    """Return a float32 unit-length copy of a single embedding."""
+    vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+def top_k_similarities(
+    normalized_matrix: np.ndarray,
+    normalized_query: np.ndarray,
+    k: int,
+    valid: Optional[np.ndarray] = None
+) -> List[Tuple[int, float]]:
+    """
+    Rank rows of a normalized matrix by cosine similarity to a normalized query.
+
+    Uses a single matrix-vector product and argpartition, so only the k best
+    rows are sorted. Returns (row_index, similarity) pairs, best first.
+    """
+    row_count = normalized_matrix.shape[0]
+    if row_count == 0 or k <= 0:
+        return []
+
+    similarities = normalized_matrix @ normalized_query
+    if valid is not None:
+        similarities[~valid] = UNDECODABLE_SIMILARITY
+
+    k = min(k, row_count)
+    if k < row_count:
+        candidates = np.argpartition(-similarities, k - 1)[:k]
+    else:
+        candidates = np.arange(row_count)
+    # Ties keep row order; the memory cache appends rows as they are stored, so its ties come out oldest-first
+    ordered = candidates[np.lexsort((candidates, -similarities[candidates]))]
+    return [(int(row), float(similarities[row])) for row in ordered]
@@ -0,0 +1,47 @@
+from collections import deque
+from typing import Any, Callable, Deque, Dict
+from .config import logger
+
+# --- Metrics Registry ---
+# Subsystems register a zero-argument collector; /metrics calls them on demand.
+_metrics_sources: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+def register_metrics_source(name: str, collector: Callable[[], Dict[str, Any]]) -> None:
+    """Register (or replace) the collector that reports metrics under `name`."""
+    _metrics_sources[name] = collector
+
+def collect_metrics() -> Dict[str, Any]:
+    """Snapshot every registered metrics source; a failing collector only affects its own entry."""
+    snapshot = {}
+    for name, collector in _metrics_sources.items():
+        try:
+            snapshot[name] = collector()
+        except Exception as e:
+            logger.warning(f"Metrics collector '{name}' failed: {e}")
+            snapshot[name] = {"error": str(e)}
+    return snapshot
+
+class LatencySummary:
+    """Rolling window of latencies (seconds) summarized as count/avg/p50/p95/max in ms."""
+
+    def __init__(self, window: int = 1000):
+        self._samples: Deque[float] = deque(maxlen=window)
+        self.count = 0
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+        self.count += 1
+
+    def stats(self) -> Dict[str, Any]:
+        if not self._samples:
+            return {"count": self.count}
+        ordered = sorted(self._samples)
+        def percentile(fraction: float) -> float:
+            return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000, 1)
+        return {
+            "count": self.count,
+            "avg_ms": round(sum(ordered) / len(ordered) * 1000, 1),
+            "p50_ms": percentile(0.5),
+            "p95_ms": percentile(0.95),
+            "max_ms": round(ordered[-1] * 1000, 1)
+        }
@@ -1,4 +1,106 @@
-from typing import List, Dict, Any
+from functools import lru_cache
+from typing import List, Dict, Any, Optional
+from .config import (
+    logger,
+    embedding_model,
+    PROMPT_TOKEN_BUDGET,
+    PROMPT_MESSAGE_MAX_TOKENS,
+    PROMPT_MAX_MEMORIES,
+    PROMPT_MAX_HISTORY_MESSAGES,
+    PROMPT_MIN_SECTION_TOKENS
+)
+from .metrics import register_metrics_source
+
+# 1. The AI's persona and core instructions
+SYSTEM_INSTRUCTION = """You are Clario, an empathetic and supportive AI companion. Your goal is to be a great listener.
+
+**Your Core Rules:**
+1.  **Be Present:** Respond ONLY to the user's most recent message.
+2.  **Use Your Memory:** You have access to long-term memories. Use them to show you remember details from past conversations.
+3.  **Don't State the Obvious:** If the user just told you something, don't say "I remember you mentioned..." or "You just said...". Instead, use the information to ask a follow-up question.
+4.  **Be Natural and Brief:** Keep your tone calm and your responses short (1-3 sentences)."""
+
+MEMORY_HEADER = "\n--- LONG-TERM MEMORIES ---\nHere are things you remember from previous conversations:\n"
+HISTORY_HEADER = "\n--- CURRENT CONVERSATION HISTORY ---\n"
+TASK_TEMPLATE = """
+--- TASK ---
+Respond to the user's latest message based on the context above.
+User's message: "{user_query}"
+"""
+TRUNCATION_MARKER = "…"
+
+# --- Token Counting ---
+# The MiniLM tokenizer is already loaded for embeddings; its counts are close to,
+# not equal to, the LLM's own, which is enough to keep prompts bounded.
+def count_tokens(text: str) -> int:
+    """Number of tokens in `text` under the local embedding tokenizer."""
+    if not text:
+        return 0
+    return len(embedding_model.tokenizer(text, add_special_tokens=False, verbose=False)["input_ids"])
+
+@lru_cache(maxsize=32)
+def _fixed_tokens(text: str) -> int:
+    """Token count of the constant parts of the prompt, counted once."""
+    return count_tokens(text)
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """`text` cut to at most `max_tokens` tokens (including a trailing marker when cut)."""
+    if max_tokens <= 0:
+        return ""
+    encoded = embedding_model.tokenizer(
+        text, add_special_tokens=False, return_offsets_mapping=True, verbose=False
+    )
+    offsets = encoded["offset_mapping"]
+    if len(offsets) <= max_tokens:
+        return text
+    keep = max_tokens - _fixed_tokens(TRUNCATION_MARKER)
+    if keep <= 0:
+        return ""
+    return text[:offsets[keep - 1][1]].rstrip() + TRUNCATION_MARKER
+
+# --- Prompt Budget ---
+_prompt_stats = {"prompts": 0, "total_tokens": 0, "max_tokens": 0, "truncated_sections": 0, "dropped_sections": 0}
+
+def _budget_stats() -> Dict[str, Any]:
+    prompts = _prompt_stats["prompts"]
+    return {
+        **_prompt_stats,
+        "budget": PROMPT_TOKEN_BUDGET,
+        "avg_tokens": round(_prompt_stats["total_tokens"] / prompts, 1) if prompts else 0.0
+    }
+
+register_metrics_source("prompt_budget", _budget_stats)
+
+class _TokenBudget:
+    """Tokens left for the prompt; sections are admitted whole, truncated, or dropped."""
+
+    def __init__(self, tokens: int):
+        self.remaining = tokens
+        self.truncated = 0
+        self.dropped = 0
+
+    def fit(self, text: str, overhead: int = 0, limit: Optional[int] = None, required: bool = False) -> Optional[str]:
+        """
+        Admit `text` (plus `overhead` tokens of surrounding labels), truncated to
+        what is left, or to `limit`, if it does not fit. None when it is dropped;
+        a `required` section is kept to at least PROMPT_MIN_SECTION_TOKENS.
+        """
+        available = self.remaining - overhead
+        if required:
+            available = max(available, PROMPT_MIN_SECTION_TOKENS)
+        if limit is not None:
+            available = min(available, limit)
+        tokens = count_tokens(text)
+        if tokens <= available:
+            self.remaining -= tokens + overhead
+            return text
+        if available < PROMPT_MIN_SECTION_TOKENS:
+            self.dropped += 1
+            return None
+        text = truncate_to_tokens(text, available)
+        self.remaining -= count_tokens(text) + overhead
+        self.truncated += 1
+        return text
 
 def construct_enhanced_prompt(
     user_query: str,
@@ -10,48 +112,74 @@ def construct_enhanced_prompt(
 ) -> str:
     """
     Constructs a robust prompt that distinguishes between memory and current context.
+
+    The prompt is kept within PROMPT_TOKEN_BUDGET: the instructions always go in,
+    then the current message, then memories by relevance, then the most recent
+    history; whatever does not fit is truncated or left out.
     """
+    budget = _TokenBudget(PROMPT_TOKEN_BUDGET - _fixed_tokens(SYSTEM_INSTRUCTION) - _fixed_tokens(TASK_TEMPLATE))
 
-    # 1. Define the AI's persona and core instructions
-    system_instruction = """You are Clario, an empathetic and supportive AI companion. Your goal is to be a great listener.
+    # 2. The current message
+    prompt_query = budget.fit(user_query, limit=PROMPT_MESSAGE_MAX_TOKENS, required=True)
 
-**Your Core Rules:**
-1.  **Be Present:** Respond ONLY to the user's most recent message.
-2.  **Use Your Memory:** You have access to long-term memories. Use them to show you remember details from past conversations.
-3.  **Don't State the Obvious:** If the user just told you something, don't say "I remember you mentioned..." or "You just said...". Instead, use the information to ask a follow-up question.
-4.  **Be Natural and Brief:** Keep your tone calm and your responses short (1-3 sentences)."""
-
-    # 2. Build the context from long-term memories
+    # 3. Long-term memories, most relevant first
     # We exclude memories created from the immediate past few messages to avoid this loop.
-    memory_context = ""
+    memory_lines = []
+    memories_offered = 0
     if has_memories and relevant_memories:
-        memory_context = "\n--- LONG-TERM MEMORIES ---\n"
-        memory_context += "Here are things you remember from previous conversations:\n"
-        for memory in relevant_memories[:5]:
-            # This check is crucial: it prevents the AI from "remembering" what was just said.
-            if user_query.lower() not in memory['metadata'].get('source_message', '').lower():
-                 memory_context += f"- {memory['content']}\n"
-    
-    # If no relevant long-term memories are found after filtering, clear the context.
-    if len(memory_context.splitlines()) < 3:
-        memory_context = ""
-
-
-    # 3. Build the context from the current conversation
-    conversation_context = ""
-    if chat_history:
-        conversation_context = "\n--- CURRENT CONVERSATION HISTORY ---\n"
-        for msg in chat_history[-4:]:
+        ranked = sorted(
+            relevant_memories,
+            key=lambda memory: memory.get('relevance_score', 0.0),
+            reverse=True
+        )[:PROMPT_MAX_MEMORIES]
+        # This check is crucial: it prevents the AI from "remembering" what was just said.
+        ranked = [
+            memory for memory in ranked
+            if user_query.lower() not in memory['metadata'].get('source_message', '').lower()
+        ]
+        memories_offered = len(ranked)
+        if ranked:
+            budget.remaining -= _fixed_tokens(MEMORY_HEADER)
+            for memory in ranked:
+                content = budget.fit(memory['content'], overhead=_fixed_tokens("- "))
+                if content is not None:
+                    memory_lines.append(f"- {content}\n")
+            if not memory_lines:
+                budget.remaining += _fixed_tokens(MEMORY_HEADER)
+
+    # If no relevant long-term memories are found after filtering, leave the section out.
+    memory_context = MEMORY_HEADER + "".join(memory_lines) if memory_lines else ""
+
+    # 4. The current conversation, newest first so older turns are the ones dropped
+    history_lines = []
+    recent_history = chat_history[-PROMPT_MAX_HISTORY_MESSAGES:] if chat_history else []
+    if recent_history:
+        budget.remaining -= _fixed_tokens(HISTORY_HEADER)
+        for msg in reversed(recent_history):
             role_label = "User" if msg.role == "user" else "Clario (You)"
-            conversation_context += f"{role_label}: {msg.content}\n"
+            content = budget.fit(msg.content, overhead=_fixed_tokens(f"{role_label}: "))
+            if content is None:
+                break
+            history_lines.append(f"{role_label}: {content}\n")
+        if not history_lines:
+            budget.remaining += _fixed_tokens(HISTORY_HEADER)
+    conversation_context = HISTORY_HEADER + "".join(reversed(history_lines)) if history_lines else ""
 
-    # 4. Assemble the final prompt
-    final_prompt = f"""{system_instruction}
+    # 5. Assemble the final prompt
+    final_prompt = f"""{SYSTEM_INSTRUCTION}
 {memory_context}
-{conversation_context}
---- TASK ---
-Respond to the user's latest message based on the context above.
-User's message: "{user_query}"
-"""
+{conversation_context}""" + TASK_TEMPLATE.format(user_query=prompt_query)
+
+    prompt_tokens = count_tokens(final_prompt)
+    _prompt_stats["prompts"] += 1
+    _prompt_stats["total_tokens"] += prompt_tokens
+    _prompt_stats["max_tokens"] = max(_prompt_stats["max_tokens"], prompt_tokens)
+    _prompt_stats["truncated_sections"] += budget.truncated
+    _prompt_stats["dropped_sections"] += budget.dropped
+    logger.info(
+        f"Prompt: {prompt_tokens} tokens (budget {PROMPT_TOKEN_BUDGET}); "
+        f"memories {len(memory_lines)}/{memories_offered}, history {len(history_lines)}/{len(recent_history)}, "
+        f"{budget.truncated} truncated"
+    )
 
-    return final_prompt
\ No newline at end of file
+    return final_prompt
@@ -0,0 +1,234 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+from .config import (
+    logger,
+    LLM_PROVIDER_ORDER,
+    LLM_BREAKER_WINDOW_SECONDS,
+    LLM_BREAKER_MIN_REQUESTS,
+    LLM_BREAKER_ERROR_RATE,
+    LLM_BREAKER_CONSECUTIVE_FAILURES,
+    LLM_BREAKER_COOLDOWN_SECONDS,
+    LLM_BREAKER_MAX_COOLDOWN_SECONDS,
+    LLM_HEDGING_ENABLED,
+    LLM_HEDGE_PERCENTILE,
+    LLM_HEDGE_DEFAULT_DELAY_SECONDS,
+    LLM_HEDGE_MIN_DELAY_SECONDS,
+    LLM_HEDGE_BUDGET_PER_MINUTE
+)
+from .metrics import register_metrics_source
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+# Errors that say something about the provider's health: count against its
+# breaker and move on to the next provider instead of retrying it
+RATE_LIMITED, SERVER_ERROR, TIMEOUT = "rate_limited", "server_error", "timeout"
+# A request the provider rejected (bad prompt, auth); not retried, not held against it
+CLIENT_ERROR = "client_error"
+# Anything unrecognized: counted, and retried on the same provider
+OTHER_ERROR = "other"
+SWITCH_PROVIDER_ERRORS = (RATE_LIMITED, SERVER_ERROR, TIMEOUT, CLIENT_ERROR)
+
+def classify_error(error: BaseException) -> str:
+    """Classify a provider exception by type and status code (google.api_core and openai errors)."""
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError)):
+        return TIMEOUT
+    status = getattr(error, "status_code", None)
+    if status is None:
+        # google.api_core exceptions carry the HTTP status as `code`
+        status = getattr(error, "code", None)
+    if isinstance(status, int):
+        if status == 429:
+            return RATE_LIMITED
+        if status in (408, 504):
+            return TIMEOUT
+        if status >= 500:
+            return SERVER_ERROR
+        if status >= 400:
+            return CLIENT_ERROR
+    name = type(error).__name__
+    if "RateLimit" in name or "ResourceExhausted" in name or "TooManyRequests" in name:
+        return RATE_LIMITED
+    if "Timeout" in name or "DeadlineExceeded" in name:
+        return TIMEOUT
+    if "Connection" in name or "ServiceUnavailable" in name or "InternalServerError" in name:
+        return SERVER_ERROR
+    return OTHER_ERROR
+
+class CircuitBreaker:
+    """Rolling error rate and latency for one provider, with closed/open/half-open states."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state = CLOSED
+        # (time, succeeded, latency seconds) for calls inside the window
+        self._window: Deque[Tuple[float, bool, float]] = deque()
+        self._consecutive_failures = 0
+        self._cooldown = LLM_BREAKER_COOLDOWN_SECONDS
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.opened = 0
+        self.errors: Dict[str, int] = {}
+
+    def _trim(self, now: float):
+        while self._window and self._window[0][0] < now - LLM_BREAKER_WINDOW_SECONDS:
+            self._window.popleft()
+
+    def available(self) -> bool:
+        """Whether a call may go to this provider now (a half-open breaker admits one probe)."""
+        if self.state == OPEN and time.monotonic() - self._opened_at >= self._cooldown:
+            self.state = HALF_OPEN
+            logger.info(f"Circuit breaker for {self.name} half-open; probing.")
+        if self.state == HALF_OPEN:
+            return not self._probe_in_flight
+        return self.state == CLOSED
+
+    def acquire(self) -> bool:
+        """Claim a call slot; for a half-open breaker this is the single probe."""
+        if not self.available():
+            return False
+        if self.state == HALF_OPEN:
+            self._probe_in_flight = True
+        return True
+
+    def record_success(self, latency: float):
+        now = time.monotonic()
+        self._window.append((now, True, latency))
+        self._trim(now)
+        self._consecutive_failures = 0
+        if self.state != CLOSED:
+            logger.info(f"Circuit breaker for {self.name} closed.")
+            self._window.clear()
+            self._window.append((now, True, latency))
+        self.state = CLOSED
+        self._cooldown = LLM_BREAKER_COOLDOWN_SECONDS
+        self._probe_in_flight = False
+
+    def record_failure(self, error_class: str, latency: float):
+        self.errors[error_class] = self.errors.get(error_class, 0) + 1
+        self._probe_in_flight = False
+        if error_class == CLIENT_ERROR:
+            return
+        now = time.monotonic()
+        self._window.append((now, False, latency))
+        self._trim(now)
+        self._consecutive_failures += 1
+        if self.state == HALF_OPEN:
+            self._cooldown = min(self._cooldown * 2, LLM_BREAKER_MAX_COOLDOWN_SECONDS)
+            self._open(f"probe failed ({error_class})")
+        elif self.state == CLOSED:
+            if self._consecutive_failures >= LLM_BREAKER_CONSECUTIVE_FAILURES:
+                self._open(f"{self._consecutive_failures} consecutive failures")
+            elif len(self._window) >= LLM_BREAKER_MIN_REQUESTS and self.error_rate() >= LLM_BREAKER_ERROR_RATE:
+                self._open(f"error rate {self.error_rate():.0%}")
+
+    def release(self):
+        """Give back a probe slot that ended without an outcome (e.g. cancelled)."""
+        self._probe_in_flight = False
+
+    def _open(self, reason: str):
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self.opened += 1
+        logger.warning(f"Circuit breaker for {self.name} opened: {reason}; retry in {self._cooldown:.0f}s.")
+
+    def error_rate(self) -> float:
+        self._trim(time.monotonic())
+        if not self._window:
+            return 0.0
+        return sum(1 for _, ok, _ in self._window if not ok) / len(self._window)
+
+    def latency_percentile(self, fraction: float) -> Optional[float]:
+        """Latency (seconds) of successful calls in the window at `fraction`, if there are any."""
+        self._trim(time.monotonic())
+        latencies = sorted(latency for _, ok, latency in self._window if ok)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))]
+
+    def stats(self) -> Dict[str, Any]:
+        self.available()
+        p50, p95 = self.latency_percentile(0.5), self.latency_percentile(0.95)
+        return {
+            "state": self.state,
+            "window_requests": len(self._window),
+            "error_rate": round(self.error_rate(), 4),
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "consecutive_failures": self._consecutive_failures,
+            "cooldown_seconds": self._cooldown,
+            "opened": self.opened,
+            "errors": dict(self.errors)
+        }
+
+class ProviderRouter:
+    """Orders providers by preference, skipping those whose breaker is open."""
+
+    def __init__(self, order: List[str]):
+        self.order = order
+        self.breakers: Dict[str, CircuitBreaker] = {name: CircuitBreaker(name) for name in order}
+        self.no_provider_available = 0
+
+    def candidates(self, configured: Callable[[str], bool]) -> List[str]:
+        """Providers to try, in order; empty when every configured provider's breaker is open."""
+        available = [name for name in self.order if configured(name) and self.breakers[name].available()]
+        if not available:
+            self.no_provider_available += 1
+        return available
+
+    def breaker(self, name: str) -> CircuitBreaker:
+        return self.breakers[name]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "order": self.order,
+            "no_provider_available": self.no_provider_available,
+            "providers": {name: breaker.stats() for name, breaker in self.breakers.items()}
+        }
+
+provider_router = ProviderRouter(LLM_PROVIDER_ORDER)
+register_metrics_source("llm_router", provider_router.stats)
+
+class HedgePolicy:
+    """When to send a hedged request, and a per-minute token bucket capping how many."""
+
+    def __init__(self, enabled: bool, per_minute: float):
+        self.enabled = enabled
+        self.capacity = per_minute
+        self._tokens = per_minute
+        self._refilled_at = time.monotonic()
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.budget_exhausted = 0
+
+    def delay(self, breaker: CircuitBreaker) -> float:
+        """How long to wait on the primary before hedging: its recent latency percentile."""
+        latency = breaker.latency_percentile(LLM_HEDGE_PERCENTILE)
+        if latency is None:
+            return LLM_HEDGE_DEFAULT_DELAY_SECONDS
+        return max(latency, LLM_HEDGE_MIN_DELAY_SECONDS)
+
+    def try_spend(self) -> bool:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._refilled_at) * self.capacity / 60)
+        self._refilled_at = now
+        if self._tokens < 1:
+            self.budget_exhausted += 1
+            return False
+        self._tokens -= 1
+        self.hedges += 1
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "budget_exhausted": self.budget_exhausted,
+            "budget_per_minute": self.capacity,
+            "budget_remaining": round(self._tokens, 2)
+        }
+
+hedge_policy = HedgePolicy(LLM_HEDGING_ENABLED, LLM_HEDGE_BUDGET_PER_MINUTE)
+register_metrics_source("llm_hedging", hedge_policy.stats)
@@ -0,0 +1,154 @@
+import httpx
+import os
+import google.generativeai as genai
+from contextlib import asynccontextmanager
+from openai import AsyncOpenAI
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+from .config import (
+    logger,
+    openai_client,
+    LLM_HTTP_MAX_CONNECTIONS,
+    LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    LLM_HTTP_KEEPALIVE_EXPIRY_SECONDS,
+    LLM_HTTP_TIMEOUT_SECONDS
+)
+from .metrics import register_metrics_source
+
+safety_settings = [
+    {
+        "category": "HARM_CATEGORY_HARASSMENT",
+        "threshold": "BLOCK_NONE"
+    },
+    {
+        "category": "HARM_CATEGORY_HATE_SPEECH",
+        "threshold": "BLOCK_NONE"
+    },
+    {
+        "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
+        "threshold": "BLOCK_NONE"
+    },
+    {
+        "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
+        "threshold": "BLOCK_NONE"
+    }
+]
+
+# Generation settings per kind of call; models are cached per (name, profile)
+GENERATION_PROFILES: Dict[str, Dict[str, Any]] = {
+    # Chat replies
+    "chat": {
+        "generation_config": genai.types.GenerationConfig(temperature=0.7, max_output_tokens=500, top_p=0.8, top_k=40),
+        "safety_settings": safety_settings
+    },
+    # Structured extraction
+    "json": {
+        "generation_config": genai.types.GenerationConfig(temperature=0.3, max_output_tokens=1000, top_p=0.8),
+        "safety_settings": safety_settings
+    },
+    # Titles and health probes use the model defaults
+    "default": {}
+}
+
+class ProviderRegistry:
+    """
+    Long-lived LLM provider clients, created once in core/lifespan.
+
+    Gemini models are built once per (model, profile) and share the SDK's
+    client, so calls reuse its channel instead of rebuilding model and config
+    objects. OpenAI calls go through one AsyncOpenAI client on a keep-alive
+    httpx connection pool. `track` counts in-flight calls for /metrics.
+    """
+
+    def __init__(self):
+        self._gemini_models: Dict[Tuple[str, str], genai.GenerativeModel] = {}
+        self._http_client: Optional[httpx.AsyncClient] = None
+        self._openai: Optional[AsyncOpenAI] = None
+        self.in_flight: Dict[str, int] = {"gemini": 0, "openai": 0}
+        self.max_in_flight: Dict[str, int] = {"gemini": 0, "openai": 0}
+        self.requests: Dict[str, int] = {"gemini": 0, "openai": 0}
+
+    @property
+    def started(self) -> bool:
+        return self._http_client is not None
+
+    def start(self):
+        if self.started:
+            return
+        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+        self._http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=LLM_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=LLM_HTTP_KEEPALIVE_EXPIRY_SECONDS
+            ),
+            timeout=LLM_HTTP_TIMEOUT_SECONDS
+        )
+        if os.getenv("OPENAI_API_KEY"):
+            self._openai = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=self._http_client)
+        logger.info(
+            f"LLM providers started (OpenAI pool: {LLM_HTTP_MAX_CONNECTIONS} connections, "
+            f"{LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS} kept alive)."
+        )
+
+    async def stop(self):
+        if not self.started:
+            return
+        if self._openai is not None:
+            await self._openai.close()
+            self._openai = None
+        await self._http_client.aclose()
+        self._http_client = None
+        self._gemini_models.clear()
+
+    def gemini_model(self, name: str, profile: str = "default") -> genai.GenerativeModel:
+        model = self._gemini_models.get((name, profile))
+        if model is None:
+            model = genai.GenerativeModel(name, **GENERATION_PROFILES[profile])
+            self._gemini_models[(name, profile)] = model
+        return model
+
+    @property
+    def openai(self) -> Optional[AsyncOpenAI]:
+        """The pooled client once started; the module-level client before that (scripts, tests)."""
+        return self._openai if self.started else openai_client
+
+    @asynccontextmanager
+    async def track(self, provider: str) -> AsyncIterator[None]:
+        """Count one call (including a whole stream) against `provider`."""
+        self.requests[provider] += 1
+        self.in_flight[provider] += 1
+        self.max_in_flight[provider] = max(self.max_in_flight[provider], self.in_flight[provider])
+        try:
+            yield
+        finally:
+            self.in_flight[provider] -= 1
+
+    def _http_pool_stats(self) -> Dict[str, Any]:
+        # httpx does not expose pool state publicly; read httpcore's pool when it is there
+        pool = getattr(getattr(self._http_client, "_transport", None), "_pool", None)
+        connections = list(getattr(pool, "connections", []) or [])
+        return {
+            "connections": len(connections),
+            "idle_connections": sum(1 for connection in connections if connection.is_idle()),
+            "max_connections": LLM_HTTP_MAX_CONNECTIONS,
+            "max_keepalive_connections": LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {
+            provider: {
+                "requests": self.requests[provider],
+                "in_flight": self.in_flight[provider],
+                "max_in_flight": self.max_in_flight[provider]
+            }
+            for provider in self.requests
+        }
+        stats["gemini"]["models"] = len(self._gemini_models)
+        stats["openai"]["configured"] = self.openai is not None
+        if self.started:
+            stats["openai"]["http_pool"] = self._http_pool_stats()
+        stats["started"] = self.started
+        return stats
+
+providers = ProviderRegistry()
+register_metrics_source("llm_providers", providers.stats)
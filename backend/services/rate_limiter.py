@@ -0,0 +1,180 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from typing import Any, Dict, Optional, Tuple
+from .config import (
+    logger,
+    GEMINI_RPM_LIMIT,
+    GEMINI_TPM_LIMIT,
+    OPENAI_RPM_LIMIT,
+    OPENAI_TPM_LIMIT,
+    LLM_RATE_LIMIT_MAX_WAIT_SECONDS,
+    LLM_RATE_LIMIT_MAX_QUEUE
+)
+from .metrics import LatencySummary, register_metrics_source
+
+# The user an LLM call is made for; set once per chat turn and inherited by the
+# tasks it starts, so queued calls can be served round-robin across users
+llm_user: ContextVar[Optional[str]] = ContextVar("llm_user", default=None)
+
+# Requests and tokens per minute, per provider; each model gets its own buckets
+PROVIDER_LIMITS: Dict[str, Tuple[int, int]] = {
+    "gemini": (GEMINI_RPM_LIMIT, GEMINI_TPM_LIMIT),
+    "openai": (OPENAI_RPM_LIMIT, OPENAI_TPM_LIMIT)
+}
+
+class RateLimitExceeded(Exception):
+    """A call could not be admitted: the wait queue was full or the wait timed out."""
+
+def estimate_tokens(prompt: str, max_output_tokens: int) -> int:
+    """Tokens a call may use against TPM: ~4 characters per prompt token plus the output cap."""
+    return len(prompt) // 4 + max_output_tokens
+
+class TokenBucket:
+    """Refills continuously up to `per_minute`; a call takes from it when there is enough."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = per_minute
+        self.available = float(per_minute)
+        self._refilled_at = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self._refilled_at) * self.capacity / 60)
+        self._refilled_at = now
+
+    def wait_time(self, amount: int) -> float:
+        """Seconds until `amount` is available (0 if it is now)."""
+        self.refill()
+        missing = min(amount, self.capacity) - self.available
+        return max(0.0, missing * 60 / self.capacity)
+
+    def take(self, amount: int):
+        self.refill()
+        self.available -= min(amount, self.capacity)
+
+class RateLimiter:
+    """
+    RPM and TPM buckets for one provider and model. A call that fits goes
+    straight through; otherwise it waits in its user's queue, and a single
+    dispatcher serves the head of each user's queue in turn as the buckets
+    refill, so one busy user cannot starve the others.
+    """
+
+    def __init__(self, name: str, rpm: int, tpm: int):
+        self.name = name
+        self._request_bucket = TokenBucket(rpm) if rpm > 0 else None
+        self._token_bucket = TokenBucket(tpm) if tpm > 0 else None
+        # user -> waiting (future, tokens), in round-robin order
+        self._queues: "OrderedDict[str, deque[Tuple[asyncio.Future, int]]]" = OrderedDict()
+        self._dispatcher: Optional[asyncio.Task] = None
+        self.queue_wait = LatencySummary()
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = {"queue_full": 0, "timeout": 0}
+
+    def _wait_time(self, tokens: int) -> float:
+        wait = self._request_bucket.wait_time(1) if self._request_bucket else 0.0
+        if self._token_bucket:
+            wait = max(wait, self._token_bucket.wait_time(tokens))
+        return wait
+
+    def _take(self, tokens: int):
+        if self._request_bucket:
+            self._request_bucket.take(1)
+        if self._token_bucket:
+            self._token_bucket.take(tokens)
+        self.admitted += 1
+
+    def waiting(self) -> int:
+        return sum(1 for queue in self._queues.values() for future, _ in queue if not future.done())
+
+    async def acquire(self, tokens: int):
+        """Wait for room for one call of `tokens`; raises RateLimitExceeded instead of waiting forever."""
+        if not self._queues and self._wait_time(tokens) == 0:
+            self._take(tokens)
+            self.queue_wait.record(0.0)
+            return
+        if self.waiting() >= LLM_RATE_LIMIT_MAX_QUEUE:
+            self.rejected["queue_full"] += 1
+            raise RateLimitExceeded(f"{self.name}: {LLM_RATE_LIMIT_MAX_QUEUE} calls already waiting")
+
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(llm_user.get() or "anonymous", deque()).append((future, tokens))
+        self.queued += 1
+        if self._dispatcher is None:
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        started = time.perf_counter()
+        try:
+            await asyncio.wait({future}, timeout=LLM_RATE_LIMIT_MAX_WAIT_SECONDS)
+        finally:
+            # Timed out or cancelled: the dispatcher skips the cancelled entry
+            if not future.done():
+                future.cancel()
+        self.queue_wait.record(time.perf_counter() - started)
+        if future.cancelled():
+            self.rejected["timeout"] += 1
+            raise RateLimitExceeded(f"{self.name}: no capacity within {LLM_RATE_LIMIT_MAX_WAIT_SECONDS:.0f}s")
+
+    async def _dispatch(self):
+        try:
+            while self._queues:
+                user, queue = next(iter(self._queues.items()))
+                future, tokens = queue[0]
+                if not future.cancelled():
+                    delay = self._wait_time(tokens)
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                        continue
+                    self._take(tokens)
+                    future.set_result(None)
+                queue.popleft()
+                # This user goes to the back of the rotation
+                del self._queues[user]
+                if queue:
+                    self._queues[user] = queue
+        except Exception as e:
+            logger.error(f"Rate limiter dispatcher for {self.name} failed: {e}")
+        finally:
+            self._dispatcher = None
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "waiting": self.waiting(),
+            "waiting_users": sum(1 for queue in self._queues.values() if any(not future.done() for future, _ in queue)),
+            "rejected": dict(self.rejected),
+            "queue_wait": self.queue_wait.stats()
+        }
+        if self._request_bucket:
+            self._request_bucket.refill()
+            stats["rpm_limit"] = self._request_bucket.capacity
+            stats["requests_available"] = round(self._request_bucket.available, 1)
+        if self._token_bucket:
+            self._token_bucket.refill()
+            stats["tpm_limit"] = self._token_bucket.capacity
+            stats["tokens_available"] = round(self._token_bucket.available)
+        return stats
+
+class RateLimiterRegistry:
+    """One RateLimiter per (provider, model), created on first use."""
+
+    def __init__(self, limits: Dict[str, Tuple[int, int]]):
+        self.limits = limits
+        self._limiters: Dict[Tuple[str, str], RateLimiter] = {}
+
+    def get(self, provider: str, model: str) -> RateLimiter:
+        limiter = self._limiters.get((provider, model))
+        if limiter is None:
+            rpm, tpm = self.limits.get(provider, (0, 0))
+            limiter = RateLimiter(f"{provider}/{model}", rpm, tpm)
+            self._limiters[(provider, model)] = limiter
+        return limiter
+
+    def stats(self) -> Dict[str, Any]:
+        return {limiter.name: limiter.stats() for limiter in self._limiters.values()}
+
+rate_limiters = RateLimiterRegistry(PROVIDER_LIMITS)
+register_metrics_source("llm_rate_limits", rate_limiters.stats)
@@ -22,7 +22,8 @@ from .config import (
     sentiment_tokenizer, 
     sentiment_model, 
     device, 
-    openai_client
+    openai_client,
+    GEMINI_MODEL_NAME
 )
 
 from .sentiment_analysis import (
@@ -30,9 +31,18 @@ from .sentiment_analysis import (
     _load_sentiment_model
 )
 
+from .providers import (
+    providers
+)
+
+from .rate_limiter import (
+    llm_user
+)
+
 from .ai_model_utils import (
     call_ai_model_with_fallback,
-    call_ai_for_json_with_fallback
+    call_ai_for_json_with_fallback,
+    stream_ai_model_with_fallback
 )
 
 from .fallback_utils import (
@@ -41,6 +51,12 @@ from .fallback_utils import (
     create_fallback_structure
 )
 
+from .text_scanner import (
+    scan_text,
+    DRAMATIC_PHRASES,
+    CHAT_FALLBACK_EMOTIONS
+)
+
 from .information_extraction import (
     extract_user_information,
     extract_people_from_text_enhanced
@@ -49,9 +65,22 @@ from .information_extraction import (
 from .vector_memory import (
     store_user_memory_vector,
     get_user_memories_vector,
+    get_user_memories_hybrid,
     update_user_context_vector
 )
 
+from .memory_cache import (
+    memory_cache
+)
+
+from .metrics import (
+    collect_metrics
+)
+
+from .write_behind import (
+    write_behind
+)
+
 from .prompt_utils import (
     construct_enhanced_prompt
 )
@@ -65,15 +94,26 @@ __all__ = [
     'get_sentiment',
     '_load_sentiment_model',
     'embedding_model',
+    'providers',
+    'llm_user',
+    'GEMINI_MODEL_NAME',
     'call_ai_model_with_fallback',
     'call_ai_for_json_with_fallback',
+    'stream_ai_model_with_fallback',
     'generate_contextual_fallback',
     'create_pattern_based_fallback',
+    'scan_text',
+    'DRAMATIC_PHRASES',
+    'CHAT_FALLBACK_EMOTIONS',
     'extract_user_information',
     'extract_people_from_text_enhanced',
     'store_user_memory_vector',
     'get_user_memories_vector',
+    'get_user_memories_hybrid',
     'update_user_context_vector',
+    'memory_cache',
+    'collect_metrics',
+    'write_behind',
     'construct_enhanced_prompt',
     'create_fallback_structure',
     'check_ai_services_health'
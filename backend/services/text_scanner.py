@@ -0,0 +1,127 @@
+import re
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Pattern, Sequence, Set, Tuple
+
+# --- Shared Vocabulary ---
+# Everything the extraction, fallback and post-processing code looks for, compiled
+# once into a single scanner instead of per call site.
+
+# Overly dramatic phrases stripped (or toned down) by chat.utils.post_process_response
+DRAMATIC_PHRASES = (
+    "let's grab coffee", "let's brainstorm", "that's absolutely", "i totally understand",
+    "that sounds incredibly", "wow, that's really", "oh my goodness", "that's so tough",
+    "i can only imagine", "that must be so hard"
+)
+
+# Keywords behind the canned fallback replies and the pattern-based extraction fallback
+CONTEXTUAL_FALLBACK_EMOTIONS = ("sad", "angry", "frustrated", "upset", "low", "down")
+CHAT_FALLBACK_EMOTIONS = ("sad", "angry", "frustrated", "upset", "worried")
+PATTERN_FALLBACK_EMOTIONS = ("sad", "angry", "frustrated", "upset", "happy", "excited", "worried", "anxious", "low", "down")
+RELATIONSHIP_WORDS = ("friend", "best friend", "buddy", "colleague", "family")
+CONFLICT_WORDS = ("fight", "argument", "conflict", "problem", "issue")
+FALLBACK_KEYWORDS = (
+    "apologize", "friend", "best friend", "fight", "argument", "best", "close",
+    "relationship", "work", "job"
+)
+
+# Regex rules used by extract_user_information; a rule name may cover several patterns
+_EMOTION = r'(sad|happy|angry|frustrated|excited|anxious|worried|stressed)'
+EXTRACTION_RULES = (
+    ("meaningful", r'\b(?:friend|best friend|buddy|colleague|coworker|boss|manager|brother|sister|mom|dad|mother|father'
+                   r'|love|hate|like|dislike|prefer|enjoy|feel|emotion'
+                   r'|work|job|school|university|college'
+                   r'|today|yesterday|tomorrow|next week|last week)\b'),
+    ("relationship:friend", r'my\s+(friend|best friend|buddy)\s+(\w+)'),
+    # \b only skips start positions that could never be the leftmost match
+    ("relationship:friend", r'\b(\w+)\s+is\s+my\s+(friend|buddy)'),
+    ("relationship:colleague", r'my\s+(colleague|coworker|boss)\s+(\w+)'),
+    ("relationship:family", r'my\s+(brother|sister|mom|dad)\s*(\w*)'),
+    ("emotion", r'feel\s+' + _EMOTION),
+    ("emotion", _EMOTION + r'\s+about'),
+    ("emotion", r'i\s+am\s+' + _EMOTION),
+)
+
+class RuleMatch(NamedTuple):
+    rule: str
+    groups: Tuple[str, ...]
+    start: int
+    end: int
+
+class TextScanner:
+    """Keyword set and regex rules, compiled once at import and shared by every caller."""
+
+    def __init__(self, keywords: Iterable[str], rules: Sequence[Tuple[str, str]]):
+        self.keywords = tuple(sorted(set(keywords)))
+        self.vocabulary: FrozenSet[str] = frozenset(self.keywords)
+        # One alternation, longest first, tried at every position: the match at each
+        # start is the longest keyword there, and every shorter keyword inside it is
+        # credited through `contains`, so overlapping keywords are all found
+        alternation = "|".join(re.escape(term) for term in sorted(self.keywords, key=len, reverse=True))
+        self.pattern: Pattern = re.compile(f"(?=({alternation}))")
+        self.contains: Dict[str, FrozenSet[str]] = {
+            term: frozenset(other for other in self.keywords if other in term) for term in self.keywords
+        }
+        self.rules: Dict[str, List[Pattern]] = {}
+        for name, pattern in rules:
+            self.rules.setdefault(name, []).append(re.compile(pattern))
+
+    def scan(self, text: str) -> "TextScan":
+        return TextScan(self, text.lower())
+
+class TextScan:
+    """
+    One text as seen by the scanner. Keyword presence is computed up front;
+    each rule runs at most once, the first time a caller asks for it.
+    """
+
+    __slots__ = ("scanner", "text", "terms", "_matches")
+
+    def __init__(self, scanner: TextScanner, text: str):
+        self.scanner = scanner
+        self.text = text
+        # A single pass of the combined pattern over the text
+        found: Set[str] = set()
+        for longest in {match.group(1) for match in scanner.pattern.finditer(text)}:
+            found |= scanner.contains[longest]
+        self.terms: FrozenSet[str] = frozenset(found)
+        self._matches: Dict[str, Tuple[RuleMatch, ...]] = {}
+
+    def _known(self, term: str) -> str:
+        if term not in self.scanner.vocabulary:
+            raise KeyError(f"'{term}' is not in the text scanner vocabulary")
+        return term
+
+    def has(self, *terms: str) -> bool:
+        """True if any of `terms` occurs as a substring (same as `term in text`); KeyError for unknown terms."""
+        return any(self._known(term) in self.terms for term in terms)
+
+    def first(self, terms: Sequence[str]) -> Optional[str]:
+        """The first of `terms`, in the given order, that occurs; KeyError for unknown terms."""
+        return next((term for term in terms if self._known(term) in self.terms), None)
+
+    def matches(self, rule: str) -> Tuple[RuleMatch, ...]:
+        """Non-overlapping matches of each of the rule's patterns (pattern order, then text order)."""
+        if rule not in self._matches:
+            self._matches[rule] = tuple(
+                RuleMatch(rule, tuple(group or "" for group in found.groups()), found.start(), found.end())
+                for pattern in self.scanner.rules[rule]
+                for found in pattern.finditer(self.text)
+            )
+        return self._matches[rule]
+
+    def matches_any(self, rule: str) -> bool:
+        """Whether any of the rule's patterns matches; stops at the first hit."""
+        if rule in self._matches:
+            return bool(self._matches[rule])
+        return any(pattern.search(self.text) for pattern in self.scanner.rules[rule])
+
+text_scanner = TextScanner(
+    DRAMATIC_PHRASES + CONTEXTUAL_FALLBACK_EMOTIONS + CHAT_FALLBACK_EMOTIONS + PATTERN_FALLBACK_EMOTIONS
+    + RELATIONSHIP_WORDS + CONFLICT_WORDS + FALLBACK_KEYWORDS,
+    EXTRACTION_RULES
+)
+
+@lru_cache(maxsize=512)
+def scan_text(text: str) -> TextScan:
+    """Scan `text`; the several callers that look at the same text in one turn share the result."""
+    return text_scanner.scan(text)
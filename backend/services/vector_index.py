@@ -0,0 +1,380 @@
+import asyncio
+import asyncpg
+import json
+import math
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+from .config import (
+    logger,
+    VECTOR_INDEX_MIN_ROWS,
+    VECTOR_INDEX_HNSW_MAX_ROWS,
+    VECTOR_INDEX_HNSW_M,
+    VECTOR_INDEX_HNSW_EF_CONSTRUCTION,
+    VECTOR_INDEX_REBUILD_GROWTH,
+    VECTOR_INDEX_MAX_DEAD_FRACTION,
+    VECTOR_INDEX_CHECK_INTERVAL_SECONDS,
+    VECTOR_SEARCH_RECALL_TARGET,
+    VECTOR_SEARCH_LATENCY_TARGET_MS
+)
+from .embedding_storage import EMBEDDING_TABLES, PGVECTOR_COLUMN_TYPE, fetch_embedding_column_type
+from .metrics import register_metrics_source
+
+# Recall tiers: (approximate recall, ivfflat probes as a multiple of sqrt(lists), hnsw.ef_search)
+_RECALL_TIERS = (
+    (0.80, 1, 40),
+    (0.90, 2, 64),
+    (0.95, 4, 100),
+    (0.99, 8, 200),
+)
+
+# Exponential moving average weight for per-table search latency
+_LATENCY_SMOOTHING = 0.2
+
+def choose_index_plan(row_count: int) -> Optional[Dict[str, Any]]:
+    """Pick the ANN index for a table of `row_count` rows (None: exact scan is cheaper)."""
+    if row_count < VECTOR_INDEX_MIN_ROWS:
+        return None
+    if row_count <= VECTOR_INDEX_HNSW_MAX_ROWS:
+        return {"method": "hnsw", "m": VECTOR_INDEX_HNSW_M, "ef_construction": VECTOR_INDEX_HNSW_EF_CONSTRUCTION}
+    # pgvector's guidance for large tables: lists ~ sqrt(rows)
+    return {"method": "ivfflat", "lists": max(100, int(math.sqrt(row_count)))}
+
+def _index_name(table: str) -> str:
+    return f"idx_{table}_embedding"
+
+def _index_ddl(table: str, name: str, plan: Dict[str, Any]) -> str:
+    if plan["method"] == "hnsw":
+        options = f"m = {plan['m']}, ef_construction = {plan['ef_construction']}"
+    else:
+        options = f"lists = {plan['lists']}"
+    return (
+        f"CREATE INDEX CONCURRENTLY {name} ON {table} "
+        f"USING {plan['method']} (embedding vector_cosine_ops) WITH ({options})"
+    )
+
+class VectorIndexManager:
+    """
+    Owns the ANN indexes on the pgvector embedding columns.
+
+    A background check picks HNSW or IVFFlat from the row count and rebuilds
+    (or reindexes) concurrently when the table drifts away from what the index
+    was built for. Searches ask it for per-query probes / ef_search settings,
+    which step down a recall tier while the latency target is being missed.
+    """
+
+    def __init__(self):
+        self._pool: Optional[asyncpg.Pool] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._admin_tasks: Set[asyncio.Task] = set()
+        self._methods: Dict[str, Dict[str, Any]] = {}
+        self._target_tier = next(
+            (tier for tier, (recall, _, _) in enumerate(_RECALL_TIERS) if recall >= VECTOR_SEARCH_RECALL_TARGET),
+            len(_RECALL_TIERS) - 1
+        )
+        self._tiers: Dict[str, int] = {}
+        self._latency_ms: Dict[str, float] = {}
+        self._rebuilding: Dict[str, str] = {}
+        self._last_errors: Dict[str, str] = {}
+        self._iterative_scan = False
+        self._pgvector_version: Optional[str] = None
+        self.checks = 0
+        self.rebuilds = 0
+        self.reindexes = 0
+        self.failures = 0
+
+    def start(self, pool: asyncpg.Pool):
+        """Run an initial check in the background, then re-check periodically."""
+        if self._worker is not None and not self._worker.done():
+            return
+        self._pool = pool
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+    async def _run(self):
+        while True:
+            await self.check()
+            await asyncio.sleep(VECTOR_INDEX_CHECK_INTERVAL_SECONDS)
+
+    async def check(self, force_table: Optional[str] = None):
+        """Bring every pgvector embedding index in line with its plan; `force_table` always rebuilds."""
+        self.checks += 1
+        for table in EMBEDDING_TABLES:
+            try:
+                await self._check_table(table, force=table == force_table)
+            except Exception as e:
+                self.failures += 1
+                self._last_errors[table] = str(e)
+                logger.error(f"Vector index check for {table} failed: {e}", exc_info=True)
+
+    async def _check_table(self, table: str, force: bool = False):
+        async with self._pool.acquire() as conn:
+            if await fetch_embedding_column_type(conn, table) != PGVECTOR_COLUMN_TYPE:
+                self._methods.pop(table, None)
+                return
+            await self._detect_iterative_scan(conn)
+
+            index = await self._fetch_index(conn, table)
+            live_rows, dead_rows = await self._fetch_row_counts(conn, table)
+            state = await conn.fetchrow(
+                "SELECT index_name, build_rows FROM vector_index_state WHERE table_name = $1", table
+            )
+            plan, no_plan_reason = self._choose_plan(live_rows)
+            action, reason = self._plan_action(plan, no_plan_reason, index, state, live_rows, dead_rows)
+            if force and plan is not None and action is None:
+                action, reason = "rebuild", "requested by admin"
+
+            if action is None:
+                self._remember_index(table, index)
+                return
+
+            # One rebuild per table across every app process
+            lock_key = f"vector_index:{table}"
+            if not await conn.fetchval("SELECT pg_try_advisory_lock(hashtext($1))", lock_key):
+                return
+            try:
+                self._rebuilding[table] = reason
+                logger.info(f"Vector index on {table}: {action} ({reason})")
+                if action == "drop":
+                    await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {index['index_name']}")
+                    await conn.execute("DELETE FROM vector_index_state WHERE table_name = $1", table)
+                    index = None
+                elif action == "reindex":
+                    await conn.execute(f"REINDEX INDEX CONCURRENTLY {index['index_name']}")
+                    self.reindexes += 1
+                else:
+                    await self._rebuild(conn, table, plan, index)
+                    self.rebuilds += 1
+                if action != "drop":
+                    await conn.execute(
+                        """INSERT INTO vector_index_state (table_name, index_name, method, params, build_rows, built_at)
+                           VALUES ($1, $2, $3, $4, $5, $6)
+                           ON CONFLICT (table_name) DO UPDATE SET
+                               index_name = EXCLUDED.index_name, method = EXCLUDED.method,
+                               params = EXCLUDED.params, build_rows = EXCLUDED.build_rows,
+                               built_at = EXCLUDED.built_at""",
+                        table, _index_name(table), plan["method"], json.dumps(plan), live_rows, datetime.utcnow()
+                    )
+                    index = await self._fetch_index(conn, table)
+                self._last_errors.pop(table, None)
+            finally:
+                self._rebuilding.pop(table, None)
+                await conn.execute("SELECT pg_advisory_unlock(hashtext($1))", lock_key)
+            self._remember_index(table, index)
+
+    def _choose_plan(self, live_rows: int) -> Tuple[Optional[Dict[str, Any]], str]:
+        """The index plan for the table, or None and why no index should exist."""
+        plan = choose_index_plan(live_rows)
+        if plan is None:
+            return None, f"{live_rows} rows is below {VECTOR_INDEX_MIN_ROWS}; exact scan is cheaper"
+        if not self._iterative_scan:
+            # Every search filters by user_id; without iterative scans the index
+            # filters after the scan and per-user queries come back short
+            return None, f"pgvector {self._pgvector_version} has no iterative index scans; per-user searches stay exact"
+        return plan, ""
+
+    def _plan_action(
+        self,
+        plan: Optional[Dict[str, Any]],
+        no_plan_reason: str,
+        index: Optional[asyncpg.Record],
+        state: Optional[asyncpg.Record],
+        live_rows: int,
+        dead_rows: int
+    ) -> Tuple[Optional[str], str]:
+        """Decide between nothing, drop, reindex and rebuild for one table."""
+        if plan is None:
+            if index is not None:
+                return "drop", no_plan_reason
+            return None, ""
+        if index is None:
+            return "rebuild", "no index"
+        if not index['valid']:
+            return "rebuild", "index is invalid"
+        if index['method'] != plan["method"]:
+            return "rebuild", f"{live_rows} rows calls for {plan['method']}"
+        if state is None or state['index_name'] != index['index_name'] or not state['build_rows']:
+            return "rebuild", "index was not built by the index manager"
+        if plan["method"] == "ivfflat":
+            growth = live_rows / state['build_rows']
+            if growth >= VECTOR_INDEX_REBUILD_GROWTH or growth <= 1 / VECTOR_INDEX_REBUILD_GROWTH:
+                return "rebuild", f"row count changed {growth:.1f}x since the lists were trained"
+        elif live_rows + dead_rows and dead_rows / (live_rows + dead_rows) >= VECTOR_INDEX_MAX_DEAD_FRACTION:
+            return "reindex", f"{dead_rows} dead tuples in the graph"
+        return None, ""
+
+    async def _rebuild(
+        self,
+        conn: asyncpg.Connection,
+        table: str,
+        plan: Dict[str, Any],
+        index: Optional[asyncpg.Record]
+    ):
+        """Build the new index next to the old one, then swap; reads never block."""
+        name = _index_name(table)
+        staging = f"{name}_new"
+        # A failed CONCURRENTLY build leaves an invalid index behind
+        await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {staging}")
+        await conn.execute(_index_ddl(table, staging, plan))
+        if index is not None:
+            await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {index['index_name']}")
+        await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+        await conn.execute(f"ALTER INDEX {staging} RENAME TO {name}")
+
+    async def _fetch_index(self, conn: asyncpg.Connection, table: str) -> Optional[asyncpg.Record]:
+        return await conn.fetchrow(
+            """SELECT c.relname AS index_name, am.amname AS method, i.indisvalid AS valid,
+                      pg_relation_size(c.oid) AS size_bytes, c.reloptions AS options
+               FROM pg_index i
+               JOIN pg_class c ON c.oid = i.indexrelid
+               JOIN pg_am am ON am.oid = c.relam
+               WHERE i.indrelid = $1::regclass AND am.amname IN ('hnsw', 'ivfflat')
+               AND c.relname NOT LIKE '%\\_new'
+               ORDER BY i.indisvalid DESC
+               LIMIT 1""",
+            table
+        )
+
+    async def _fetch_row_counts(self, conn: asyncpg.Connection, table: str) -> Tuple[int, int]:
+        row = await conn.fetchrow(
+            "SELECT n_live_tup, n_dead_tup FROM pg_stat_user_tables WHERE relname = $1", table
+        )
+        if row is None:
+            return 0, 0
+        return int(row['n_live_tup']), int(row['n_dead_tup'])
+
+    async def _detect_iterative_scan(self, conn: asyncpg.Connection):
+        # pgvector 0.8 can keep scanning until filtered queries (user_id, metadata) fill their LIMIT
+        version = await conn.fetchval("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+        try:
+            major, minor = (int(part) for part in (version or "0.0").split(".")[:2])
+        except ValueError:
+            major, minor = 0, 0
+        iterative_scan = (major, minor) >= (0, 8)
+        if version != self._pgvector_version:
+            if iterative_scan:
+                logger.info(f"pgvector {version} supports iterative index scans; ANN indexes enabled.")
+            else:
+                logger.warning(
+                    f"pgvector {version} has no iterative index scans; no ANN index is built and "
+                    f"per-user vector searches use exact ordering."
+                )
+        self._pgvector_version = version
+        self._iterative_scan = iterative_scan
+
+    @property
+    def iterative_scan(self) -> bool:
+        """Whether ANN indexes can serve per-user filtered searches without losing rows."""
+        return self._iterative_scan
+
+    def _remember_index(self, table: str, index: Optional[asyncpg.Record]):
+        if index is None or not index['valid']:
+            self._methods.pop(table, None)
+            return
+        options = dict(option.split("=", 1) for option in (index['options'] or []))
+        self._methods[table] = {"method": index['method'], "lists": int(options.get("lists", 100))}
+
+    def search_settings(self, table: str, limit: int) -> List[str]:
+        """SET LOCAL statements tuning the next ANN scan on `table` (empty without an index)."""
+        index = self._methods.get(table)
+        if index is None:
+            return []
+        _, probe_multiplier, ef_search = _RECALL_TIERS[self._tiers.get(table, self._target_tier)]
+        if index["method"] == "hnsw":
+            settings = [f"SET LOCAL hnsw.ef_search = {max(ef_search, limit)}"]
+            if self._iterative_scan:
+                settings.append("SET LOCAL hnsw.iterative_scan = strict_order")
+        else:
+            lists = index["lists"]
+            probes = min(lists, max(1, math.ceil(math.sqrt(lists) * probe_multiplier)))
+            settings = [f"SET LOCAL ivfflat.probes = {probes}"]
+            if self._iterative_scan:
+                settings.append("SET LOCAL ivfflat.iterative_scan = relaxed_order")
+        return settings
+
+    async def apply_search_settings(self, conn: asyncpg.Connection, table: str, limit: int):
+        """Apply search_settings inside the caller's transaction."""
+        for statement in self.search_settings(table, limit):
+            await conn.execute(statement)
+
+    def record_search_latency(self, table: str, seconds: float):
+        """Feed a search latency back; trade recall for latency while over target, and back."""
+        if table not in self._methods:
+            return
+        elapsed_ms = seconds * 1000
+        previous = self._latency_ms.get(table, elapsed_ms)
+        average = previous + _LATENCY_SMOOTHING * (elapsed_ms - previous)
+        self._latency_ms[table] = average
+        tier = self._tiers.get(table, self._target_tier)
+        if average > VECTOR_SEARCH_LATENCY_TARGET_MS and tier > 0:
+            self._tiers[table] = tier - 1
+            self._latency_ms[table] = VECTOR_SEARCH_LATENCY_TARGET_MS
+        elif average < VECTOR_SEARCH_LATENCY_TARGET_MS / 2 and tier < self._target_tier:
+            self._tiers[table] = tier + 1
+            self._latency_ms[table] = VECTOR_SEARCH_LATENCY_TARGET_MS / 2
+
+    def schedule_rebuild(self, table: str):
+        """Rebuild one table's index in the background (admin endpoint)."""
+        task = asyncio.create_task(self.check(force_table=table))
+        self._admin_tasks.add(task)
+        task.add_done_callback(self._admin_tasks.discard)
+
+    async def health(self) -> Dict[str, Any]:
+        """Per-table index state for the admin endpoint."""
+        tables = {}
+        async with self._pool.acquire() as conn:
+            for table in EMBEDDING_TABLES:
+                column_type = await fetch_embedding_column_type(conn, table)
+                entry: Dict[str, Any] = {"embedding_column": column_type}
+                if column_type == PGVECTOR_COLUMN_TYPE:
+                    index = await self._fetch_index(conn, table)
+                    live_rows, dead_rows = await self._fetch_row_counts(conn, table)
+                    state = await conn.fetchrow(
+                        "SELECT index_name, method, params, build_rows, built_at FROM vector_index_state WHERE table_name = $1",
+                        table
+                    )
+                    plan, no_plan_reason = self._choose_plan(live_rows)
+                    action, reason = self._plan_action(plan, no_plan_reason, index, state, live_rows, dead_rows)
+                    entry.update({
+                        "live_rows": live_rows,
+                        "dead_rows": dead_rows,
+                        "index": dict(index) if index else None,
+                        "planned_method": plan["method"] if plan else None,
+                        "built_with": json.loads(state['params']) if state and state['params'] else None,
+                        "build_rows": state['build_rows'] if state else None,
+                        "built_at": state['built_at'] if state else None,
+                        "pending_action": action,
+                        "pending_reason": reason or None,
+                        "search_settings": self.search_settings(table, 10),
+                    })
+                entry.update({
+                    "rebuilding": self._rebuilding.get(table),
+                    "last_error": self._last_errors.get(table),
+                })
+                tables[table] = entry
+        return {"tables": tables, **self.stats()}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "checks": self.checks,
+            "rebuilds": self.rebuilds,
+            "reindexes": self.reindexes,
+            "failures": self.failures,
+            "iterative_scan": self._iterative_scan,
+            "pgvector_version": self._pgvector_version,
+            "recall_target": _RECALL_TIERS[self._target_tier][0],
+            "recall_tiers": {table: _RECALL_TIERS[tier][0] for table, tier in self._tiers.items()},
+            "search_latency_ms": {table: round(ms, 2) for table, ms in self._latency_ms.items()},
+            "rebuilding": dict(self._rebuilding)
+        }
+
+vector_index_manager = VectorIndexManager()
+register_metrics_source("vector_index", vector_index_manager.stats)
@@ -1,11 +1,42 @@
+import asyncio
 import asyncpg
 import json
+import time
 import uuid
 import numpy as np
 from datetime import datetime
-from typing import List, Dict, Any, Optional
-from sklearn.metrics.pairwise import cosine_similarity
-from .config import logger, embedding_model
+from typing import List, Dict, Any, Optional, Sequence, Set, Tuple
+from .config import (
+    logger,
+    INTERACTION_RING_SIZE,
+    MEMORY_DEDUP_THRESHOLD,
+    MEMORY_CACHE_TTL_SECONDS,
+    MEMORY_CACHE_WARMUP_MAX_ROWS
+)
+from .embeddings import embed_text, embed_texts
+from .embedding_storage import (
+    PGVECTOR_COLUMN_TYPE, encode_embedding_for_column, get_embedding_column_type
+)
+from .memory_cache import UserMemorySet, memory_cache
+from .memory_consolidation import (
+    UNCONSOLIDATED_TYPES, find_duplicate_groups, memory_consolidator, merge_memory_metadata
+)
+from .memory_scoring import normalize_rows
+from .vector_index import vector_index_manager
+
+# Reciprocal rank fusion constant (the usual k = 60) and how many candidates
+# each side of a hybrid query contributes per requested result
+HYBRID_RRF_K = 60
+HYBRID_CANDIDATE_MULTIPLIER = 4
+
+# Namespace for the deterministic ids of interaction ring slots
+INTERACTION_RING_NAMESPACE = uuid.UUID("eb8ea467-e3c7-4f66-afb9-b43221812bd6")
+
+# Users whose memory set is being loaded into the cache in the background
+_warming_users: Set[str] = set()
+# Users over MEMORY_CACHE_WARMUP_MAX_ROWS -> when to count their rows again (monotonic)
+_warmup_skipped_until: Dict[str, float] = {}
+_background_tasks: Set[asyncio.Task] = set()
 
 async def store_user_memory_vector(
     pool: asyncpg.Pool, 
@@ -37,70 +68,305 @@ async def store_user_memory_vector(
         if not info_to_store:
             return
         
-        # Store each piece of information with vector embedding
+        # Embed every item of this turn in one batched forward pass
+        embeddings = await embed_texts([info['content'] for info in info_to_store])
+        
+        conversation_uuid = uuid.UUID(conversation_id) if conversation_id else None
+        created_at = datetime.utcnow()
+        memories = []
+        for info, embedding in zip(info_to_store, embeddings):
+            # Create metadata
+            metadata = {
+                'type': info['type'],
+                'priority': info['priority'],
+                'conversation_id': conversation_id,
+                'key_entities': extracted_info.get('key_entities', []),
+                'information_type': extracted_info.get('information_type', 'other'),
+                'source_message': info['source_message'][:200],
+                'temp_id': str(uuid.uuid4())
+            }
+            
+            # Extract person name if it's a relationship
+            if info['type'] == 'people':
+                words = info['content'].split()
+                if words:
+                    potential_name = words[0]
+                    if potential_name.istitle():
+                        metadata['person_name'] = potential_name
+            
+            memories.append((uuid.uuid4(), info['content'], embedding, metadata))
+        
+        # Collapse near-duplicates within this turn before looking at stored memories
+        batch_matrix = normalize_rows(np.array(embeddings, dtype=np.float32))
+        absorbed = set()
+        for kept, duplicates in find_duplicate_groups(batch_matrix, [m[3]['type'] for m in memories]):
+            for duplicate in duplicates:
+                memories[kept][3].update(merge_memory_metadata(memories[kept][3], memories[duplicate][3]))
+            absorbed.update(duplicates)
+        memory_consolidator.merged_on_write += len(absorbed)
+        memories = [memory for index, memory in enumerate(memories) if index not in absorbed]
+        
         async with pool.acquire() as conn:
-            for info in info_to_store:
-                try:
-                    # Create embedding for the content
-                    embedding = embedding_model.encode(info['content'])
-                    
-                    # Create metadata
-                    metadata = {
-                        'type': info['type'],
-                        'priority': info['priority'],
-                        'conversation_id': conversation_id,
-                        'key_entities': extracted_info.get('key_entities', []),
-                        'information_type': extracted_info.get('information_type', 'other'),
-                        'source_message': info['source_message'][:200],
-                        'temp_id': str(uuid.uuid4())
-                    }
-                    
-                    # Extract person name if it's a relationship
-                    if info['type'] == 'people':
-                        words = info['content'].split()
-                        if words:
-                            potential_name = words[0]
-                            if potential_name.istitle():
-                                metadata['person_name'] = potential_name
-                    
-                    # Check if we have vector support
-                    try:
-                        await conn.execute(
-                            """INSERT INTO user_memories 
-                            (id, user_id, conversation_id, content, embedding, metadata, created_at, updated_at) 
-                            VALUES ($1, $2, $3, $4, $5, $6, $7, $7)""",
-                            uuid.uuid4(),
-                            user_id,
-                            uuid.UUID(conversation_id) if conversation_id else None,
-                            info['content'],
-                            embedding.tolist(),  # Try as vector first
-                            json.dumps(metadata),
-                            datetime.utcnow()
-                        )
-                    except Exception as vector_error:
-                        # Fallback to text storage
-                        await conn.execute(
-                            """INSERT INTO user_memories 
-                            (id, user_id, conversation_id, content, embedding, metadata, created_at, updated_at) 
-                            VALUES ($1, $2, $3, $4, $5, $6, $7, $7)""",
-                            uuid.uuid4(),
-                            user_id,
-                            uuid.UUID(conversation_id) if conversation_id else None,
-                            info['content'],
-                            json.dumps(embedding.tolist()),  # Store as JSON string
-                            json.dumps(metadata),
-                            datetime.utcnow()
-                        )
-                    
-                    logger.info(f"Stored vector memory: {info['type']} - {info['content'][:50]}")
-                    
-                except Exception as e:
-                    logger.error(f"Error storing individual memory: {e}")
-                    continue
+            column_type = await get_embedding_column_type(conn)
+            existing = await _find_existing_duplicates(conn, user_id, memories, column_type)
+            
+            inserts, updates = [], []
+            for index, (memory_id, content, embedding, metadata) in enumerate(memories):
+                if index in existing:
+                    existing_id, existing_metadata = existing[index]
+                    updates.append((existing_id, merge_memory_metadata(existing_metadata, metadata)))
+                else:
+                    inserts.append((memory_id, content, embedding, metadata))
+            
+            # Write the whole batch in one transaction
+            async with conn.transaction():
+                if inserts:
+                    await conn.executemany(
+                        """INSERT INTO user_memories 
+                        (id, user_id, conversation_id, content, embedding, metadata, created_at, updated_at) 
+                        VALUES ($1, $2, $3, $4, $5, $6, $7, $7)""",
+                        [
+                            (
+                                memory_id,
+                                user_id,
+                                conversation_uuid,
+                                content,
+                                encode_embedding_for_column(embedding, column_type),
+                                json.dumps(metadata),
+                                created_at
+                            )
+                            for memory_id, content, embedding, metadata in inserts
+                        ]
+                    )
+                if updates:
+                    # A repeated fact refreshes the stored memory instead of adding a row
+                    await conn.executemany(
+                        "UPDATE user_memories SET metadata = $2, updated_at = $3 WHERE id = $1",
+                        [(memory_id, json.dumps(metadata), created_at) for memory_id, metadata in updates]
+                    )
+        
+        for memory_id, content, embedding, metadata in inserts:
+            memory_cache.append(user_id, memory_id, embedding, content, metadata, created_at)
+        for memory_id, metadata in updates:
+            memory_cache.update(user_id, memory_id, metadata, created_at)
+        memory_consolidator.merged_on_write += len(updates)
+        logger.info(
+            f"Stored {len(inserts)} vector memories: {[m[3]['type'] for m in inserts]}, "
+            f"consolidated {len(updates)} into existing memories"
+        )
                 
     except Exception as e:
         logger.error(f"Error storing user memory: {e}")
 
+async def _find_existing_duplicates(
+    conn: asyncpg.Connection,
+    user_id: str,
+    memories: List[Tuple[uuid.UUID, str, np.ndarray, Dict[str, Any]]],
+    column_type: str
+) -> Dict[int, Tuple[Any, Dict[str, Any]]]:
+    """Map each new memory's index to the stored memory of the same type it duplicates."""
+    candidates = [
+        index for index, memory in enumerate(memories)
+        if memory[3]['type'] not in UNCONSOLIDATED_TYPES
+    ]
+    if not candidates:
+        return {}
+    
+    memory_set = memory_cache.get(user_id)
+    if memory_set is None and column_type == PGVECTOR_COLUMN_TYPE:
+        # Nearest stored memory per new item, all in one round trip
+        async with conn.transaction():
+            await _apply_vector_search_settings(conn, 1)
+            matches = await conn.fetch(
+                """SELECT q.position, m.id, m.metadata
+                   FROM unnest($2::int[], $3::text[], $4::text[]) AS q(position, query_embedding, memory_type)
+                   CROSS JOIN LATERAL (
+                       SELECT id, metadata, 1 - (embedding <=> q.query_embedding::vector) AS similarity
+                       FROM user_memories
+                       WHERE user_id = $1 AND metadata->>'type' = q.memory_type AND embedding IS NOT NULL
+                       ORDER BY embedding <=> q.query_embedding::vector
+                       LIMIT 1
+                   ) m
+                   WHERE m.similarity >= $5""",
+                user_id,
+                candidates,
+                [json.dumps(memories[index][2].tolist()) for index in candidates],
+                [memories[index][3]['type'] for index in candidates],
+                MEMORY_DEDUP_THRESHOLD
+            )
+        return {
+            match['position']: (match['id'], json.loads(match['metadata']) if match['metadata'] else {})
+            for match in matches
+        }
+    
+    if memory_set is None:
+        # The fallback schema scores in Python; loading also warms the cache
+        memory_set = await _load_user_memory_set(conn, user_id)
+    duplicates = {}
+    for index in candidates:
+        _, _, embedding, metadata = memories[index]
+        ranked = memory_set.search(embedding, 1, {'type': metadata['type']})
+        if ranked and ranked[0][1] >= MEMORY_DEDUP_THRESHOLD:
+            row = ranked[0][0]
+            duplicates[index] = (memory_set.ids[row], dict(memory_set.metadata[row]))
+    return duplicates
+
+def _metadata_filter_clause(
+    filter_metadata: Optional[Dict[str, Any]],
+    param_index: int
+) -> Tuple[str, List[str]]:
+    """Turn a metadata filter into a `metadata @> $n::jsonb` predicate served by the GIN index."""
+    if not filter_metadata:
+        return "", []
+    return f" AND metadata @> ${param_index}::jsonb", [json.dumps(filter_metadata)]
+
+async def _apply_vector_search_settings(conn: asyncpg.Connection, limit: int):
+    """Tune the next per-user ANN scan (inside the caller's transaction)."""
+    if not vector_index_manager.iterative_scan:
+        # Without iterative scans (pgvector < 0.8, or not yet detected) an ANN index
+        # filters by user_id after the scan and returns short; order exactly instead
+        await conn.execute("SET LOCAL enable_indexscan = off")
+    await vector_index_manager.apply_search_settings(conn, "user_memories", limit)
+
+async def _search_memories_pgvector(
+    conn: asyncpg.Connection,
+    user_id: str,
+    query_embedding: np.ndarray,
+    limit: int,
+    filter_metadata: Optional[Dict[str, Any]] = None
+) -> List[Tuple[asyncpg.Record, float]]:
+    """Let pgvector rank memories so only the top-k rows leave the database."""
+    filter_clause, filter_args = _metadata_filter_clause(filter_metadata, 4)
+    # SET LOCAL needs a transaction; probes / ef_search come from the index manager
+    async with conn.transaction():
+        await _apply_vector_search_settings(conn, limit)
+        started = time.perf_counter()
+        memories = await conn.fetch(
+            f"""SELECT content, metadata, created_at, updated_at,
+                      1 - (embedding <=> $2::vector) AS similarity
+               FROM user_memories
+               WHERE user_id = $1 AND embedding IS NOT NULL{filter_clause}
+               ORDER BY embedding <=> $2::vector
+               LIMIT $3""",
+            user_id, json.dumps(query_embedding.tolist()), limit, *filter_args
+        )
+    vector_index_manager.record_search_latency("user_memories", time.perf_counter() - started)
+    scored_memories = [(memory, float(memory['similarity'])) for memory in memories]
+    # Relaxed-order iterative IVFFlat scans may return rows slightly out of order
+    scored_memories.sort(key=lambda pair: pair[1], reverse=True)
+    return scored_memories
+
+async def _load_user_memory_set(conn: asyncpg.Connection, user_id: str) -> UserMemorySet:
+    """Read all of a user's memories and offer the decoded set to the memory cache."""
+    column_type = await get_embedding_column_type(conn)
+    # pgvector's text output is the same "[x, y, ...]" form the JSON decoder reads
+    embedding_column = "embedding::text" if column_type == PGVECTOR_COLUMN_TYPE else "embedding"
+    token = memory_cache.begin_load(user_id)
+    rows = await conn.fetch(
+        f"""SELECT id, content, {embedding_column} AS embedding, metadata, created_at, updated_at 
+           FROM user_memories 
+           WHERE user_id = $1 
+           ORDER BY updated_at DESC""",
+        user_id
+    )
+    memory_set = UserMemorySet.from_rows(rows)
+    memory_cache.finish_load(user_id, token, memory_set)
+    return memory_set
+
+async def _warm_memory_cache(pool: asyncpg.Pool, user_id: str):
+    try:
+        async with pool.acquire() as conn:
+            # Counted before loading: a full load of a large set is the transfer pgvector search avoids
+            row_count = await conn.fetchval("SELECT COUNT(*) FROM user_memories WHERE user_id = $1", user_id)
+            if row_count > MEMORY_CACHE_WARMUP_MAX_ROWS:
+                _warmup_skipped_until[user_id] = time.monotonic() + MEMORY_CACHE_TTL_SECONDS
+                logger.info(
+                    f"Not warming memory cache for {user_id}: {row_count} memories "
+                    f"(cap {MEMORY_CACHE_WARMUP_MAX_ROWS}); pgvector keeps serving searches."
+                )
+                return
+            await _load_user_memory_set(conn, user_id)
+    except Exception as e:
+        logger.warning(f"Failed to warm memory cache for {user_id}: {e}")
+    finally:
+        _warming_users.discard(user_id)
+
+def _schedule_cache_warmup(pool: asyncpg.Pool, user_id: str):
+    """
+    Load the user's set in the background so their next turn is served from
+    memory, unless it is over MEMORY_CACHE_WARMUP_MAX_ROWS (re-checked once per TTL).
+    """
+    if user_id in _warming_users:
+        return
+    skipped_until = _warmup_skipped_until.get(user_id)
+    if skipped_until is not None:
+        if time.monotonic() < skipped_until:
+            return
+        del _warmup_skipped_until[user_id]
+    _warming_users.add(user_id)
+    task = asyncio.create_task(_warm_memory_cache(pool, user_id))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+async def _search_memories_in_database(
+    conn: asyncpg.Connection,
+    user_id: str,
+    query_embedding: Optional[np.ndarray],
+    limit: int,
+    filter_metadata: Optional[Dict[str, Any]] = None
+) -> List[Dict[str, Any]]:
+    """Answer a query with pgvector (or a recent-first scan) when the user's set is not cached."""
+    if query_embedding is None:
+        # Return recent memories if no query
+        filter_clause, filter_args = _metadata_filter_clause(filter_metadata, 3)
+        memories = await conn.fetch(
+            f"""SELECT content, metadata, created_at, updated_at 
+               FROM user_memories 
+               WHERE user_id = $1{filter_clause} 
+               ORDER BY updated_at DESC 
+               LIMIT $2""",
+            user_id, limit, *filter_args
+        )
+        scored_memories = [(memory, 0.0) for memory in memories]
+    else:
+        # Vector similarity search, filtered in SQL
+        scored_memories = await _search_memories_pgvector(
+            conn, user_id, query_embedding, limit, filter_metadata
+        )
+    
+    return _format_memories(scored_memories)
+
+def _format_memories(scored_memories: List[Tuple[asyncpg.Record, float]]) -> List[Dict[str, Any]]:
+    """Turn (record, score) pairs into get_user_memories_vector result dicts."""
+    result_memories = []
+    for memory, similarity in scored_memories:
+        try:
+            metadata = json.loads(memory['metadata']) if memory['metadata'] else {}
+            result_memories.append({
+                'content': memory['content'],
+                'metadata': metadata,
+                'created_at': memory['created_at'],
+                'updated_at': memory.get('updated_at', memory['created_at']),
+                'relevance_score': similarity
+            })
+        except Exception as e:
+            logger.warning(f"Error formatting memory: {e}")
+            continue
+    return result_memories
+
+def _search_memory_set(
+    memory_set: UserMemorySet,
+    query_embedding: Optional[np.ndarray],
+    limit: int,
+    filter_metadata: Optional[Dict[str, Any]] = None
+) -> List[Dict[str, Any]]:
+    """Answer a query entirely from a decoded (usually cached) memory set."""
+    if query_embedding is None:
+        ranked = memory_set.recent(limit, filter_metadata)
+    else:
+        ranked = memory_set.search(query_embedding, limit, filter_metadata)
+    return [memory_set.to_memory(row, similarity) for row, similarity in ranked]
+
 async def get_user_memories_vector(
     pool: asyncpg.Pool, 
     user_id: str, 
@@ -110,122 +376,189 @@ async def get_user_memories_vector(
 ) -> List[Dict[str, Any]]:
     """Retrieve user memories using vector similarity search with proper fallbacks."""
     try:
-        async with pool.acquire() as conn:
-            # Check if user has any memories
-            try:
-                memory_count = await conn.fetchval(
-                    "SELECT COUNT(*) FROM user_memories WHERE user_id = $1",
-                    user_id
-                )
-            except Exception as table_error:
-                logger.error(f"user_memories table access error: {table_error}")
-                return []
-            
-            if memory_count == 0:
-                return []
+        # Repeated queries (fixed endpoint strings, common messages) hit the embedding cache
+        query_embedding = await embed_text(query) if query.strip() else None
+        
+        memory_set = memory_cache.get(user_id)
+        if memory_set is None:
+            async with pool.acquire() as conn:
+                column_type = await get_embedding_column_type(conn)
+                if column_type == PGVECTOR_COLUMN_TYPE:
+                    result_memories = await _search_memories_in_database(
+                        conn, user_id, query_embedding, limit, filter_metadata
+                    )
+                    _schedule_cache_warmup(pool, user_id)
+                else:
+                    # The fallback schema has to read every row to score anyway
+                    memory_set = await _load_user_memory_set(conn, user_id)
+        
+        if memory_set is not None:
+            result_memories = _search_memory_set(memory_set, query_embedding, limit, filter_metadata)
+        
+        logger.info(f"Retrieved {len(result_memories)} memories for query: {query[:50]}")
+        return result_memories
             
-            if not query.strip():
-                # Return recent memories if no query
-                memories = await conn.fetch(
-                    """SELECT content, metadata, created_at, updated_at 
-                       FROM user_memories 
-                       WHERE user_id = $1 
-                       ORDER BY updated_at DESC 
-                       LIMIT $2""",
-                    user_id, limit
+    except Exception as e:
+        logger.error(f"Error retrieving vector memories: {e}")
+        return []
+
+def _reciprocal_rank_fusion(*rankings: Sequence[Any]) -> Dict[Any, float]:
+    """Fuse ranked id lists: each list contributes 1 / (k + rank) per id."""
+    scores: Dict[Any, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (HYBRID_RRF_K + rank)
+    return scores
+
+async def _search_memories_hybrid_pgvector(
+    conn: asyncpg.Connection,
+    user_id: str,
+    query: str,
+    query_embedding: np.ndarray,
+    limit: int,
+    filter_metadata: Optional[Dict[str, Any]],
+    require_text_match: bool
+) -> List[Tuple[asyncpg.Record, float]]:
+    """Full-text and vector candidates fused by reciprocal rank in one statement."""
+    filter_clause, filter_args = _metadata_filter_clause(filter_metadata, 7)
+    text_filter = "WHERE l.id IS NOT NULL" if require_text_match else ""
+    async with conn.transaction():
+        await _apply_vector_search_settings(conn, limit * HYBRID_CANDIDATE_MULTIPLIER)
+        return [(memory, float(memory['score'])) for memory in await conn.fetch(
+            f"""WITH semantic AS (
+                    -- Rank inside the LIMIT so the ANN index serves the ORDER BY
+                    SELECT id, ROW_NUMBER() OVER (ORDER BY distance) AS rank
+                    FROM (
+                        SELECT id, embedding <=> $2::vector AS distance
+                        FROM user_memories
+                        WHERE user_id = $1 AND embedding IS NOT NULL{filter_clause}
+                        ORDER BY embedding <=> $2::vector
+                        LIMIT $4
+                    ) nearest
+                ),
+                lexical AS (
+                    SELECT id, ROW_NUMBER() OVER (ORDER BY text_rank DESC) AS rank
+                    FROM (
+                        SELECT id, ts_rank_cd(content_tsv, query) AS text_rank
+                        FROM user_memories, plainto_tsquery('simple', $3) AS query
+                        WHERE user_id = $1 AND content_tsv @@ query{filter_clause}
+                        ORDER BY text_rank DESC
+                        LIMIT $4
+                    ) matches
                 )
+                SELECT m.content, m.metadata, m.created_at, m.updated_at,
+                       COALESCE(1.0 / ($5 + s.rank), 0) + COALESCE(1.0 / ($5 + l.rank), 0) AS score
+                FROM semantic s
+                FULL OUTER JOIN lexical l ON l.id = s.id
+                JOIN user_memories m ON m.id = COALESCE(s.id, l.id)
+                {text_filter}
+                ORDER BY score DESC, m.updated_at DESC
+                LIMIT $6""",
+            user_id, json.dumps(query_embedding.tolist()), query,
+            limit * HYBRID_CANDIDATE_MULTIPLIER, HYBRID_RRF_K, limit, *filter_args
+        )]
+
+async def _search_memories_hybrid_fallback(
+    conn: asyncpg.Connection,
+    user_id: str,
+    query: str,
+    query_embedding: np.ndarray,
+    limit: int,
+    filter_metadata: Optional[Dict[str, Any]],
+    require_text_match: bool
+) -> List[Dict[str, Any]]:
+    """Full-text candidates from SQL fused with the in-memory vector ranking (BYTEA schema)."""
+    candidates = limit * HYBRID_CANDIDATE_MULTIPLIER
+    filter_clause, filter_args = _metadata_filter_clause(filter_metadata, 4)
+    lexical = await conn.fetch(
+        f"""SELECT id
+            FROM user_memories, plainto_tsquery('simple', $2) AS query
+            WHERE user_id = $1 AND content_tsv @@ query{filter_clause}
+            ORDER BY ts_rank_cd(content_tsv, query) DESC
+            LIMIT $3""",
+        user_id, query, candidates, *filter_args
+    )
+    memory_set = memory_cache.get(user_id)
+    if memory_set is None:
+        # An empty set is falsy but still a cache hit; only a missing entry loads
+        memory_set = await _load_user_memory_set(conn, user_id)
+    semantic = [
+        memory_set.ids[row] for row, _ in memory_set.search(query_embedding, candidates, filter_metadata)
+    ]
+    lexical_ids = [row['id'] for row in lexical]
+    scores = _reciprocal_rank_fusion(semantic, lexical_ids)
+    if require_text_match:
+        scores = {memory_id: scores[memory_id] for memory_id in lexical_ids}
+
+    rows_by_id = {memory_id: row for row, memory_id in enumerate(memory_set.ids)}
+    ranked = sorted(
+        (memory_id for memory_id in scores if memory_id in rows_by_id),
+        key=lambda memory_id: (scores[memory_id], memory_set.updated_at[rows_by_id[memory_id]]),
+        reverse=True
+    )
+    return [memory_set.to_memory(rows_by_id[memory_id], scores[memory_id]) for memory_id in ranked[:limit]]
+
+async def get_user_memories_hybrid(
+    pool: asyncpg.Pool,
+    user_id: str,
+    query: str,
+    limit: int = 10,
+    filter_metadata: Optional[Dict[str, Any]] = None,
+    require_text_match: bool = False
+) -> List[Dict[str, Any]]:
+    """
+    Retrieve memories by full-text and vector similarity, merged with reciprocal rank fusion.
+
+    Exact names and keywords hit the content_tsv GIN index; `require_text_match`
+    keeps only rows the full-text query matched, ranked by both signals.
+    """
+    if not query.strip():
+        return await get_user_memories_vector(pool, user_id, query, limit, filter_metadata)
+    try:
+        query_embedding = await embed_text(query)
+        async with pool.acquire() as conn:
+            column_type = await get_embedding_column_type(conn)
+            if column_type == PGVECTOR_COLUMN_TYPE:
+                result_memories = _format_memories(await _search_memories_hybrid_pgvector(
+                    conn, user_id, query, query_embedding, limit, filter_metadata, require_text_match
+                ))
             else:
-                # Vector similarity search
-                query_embedding = embedding_model.encode(query)
-                
-                # Get all user memories with embeddings
-                all_memories = await conn.fetch(
-                    """SELECT content, embedding, metadata, created_at, updated_at 
-                       FROM user_memories 
-                       WHERE user_id = $1 
-                       ORDER BY updated_at DESC""",
-                    user_id
+                result_memories = await _search_memories_hybrid_fallback(
+                    conn, user_id, query, query_embedding, limit, filter_metadata, require_text_match
                 )
-                
-                if not all_memories:
-                    return []
-                
-                # Calculate similarities
-                memory_similarities = []
-                for memory in all_memories:
-                    try:
-                        # Handle both vector and JSON string embeddings
-                        embedding_data = memory['embedding']
-                        if isinstance(embedding_data, str):
-                            memory_embedding = np.array(json.loads(embedding_data))
-                        else:
-                            memory_embedding = np.array(embedding_data)
-                        
-                        similarity = cosine_similarity(
-                            query_embedding.reshape(1, -1), 
-                            memory_embedding.reshape(1, -1)
-                        )[0][0]
-                        
-                        # Apply metadata filters if provided
-                        if filter_metadata:
-                            memory_metadata = json.loads(memory['metadata']) if memory['metadata'] else {}
-                            if not all(memory_metadata.get(k) == v for k, v in filter_metadata.items()):
-                                continue
-                        
-                        memory_similarities.append({
-                            'memory': memory,
-                            'similarity': similarity
-                        })
-                    except Exception as e:
-                        logger.warning(f"Error calculating similarity for memory: {e}")
-                        # Include memory with low similarity as fallback
-                        memory_similarities.append({
-                            'memory': memory,
-                            'similarity': 0.1
-                        })
-                        continue
-                
-                # Sort by similarity and take top results
-                memory_similarities.sort(key=lambda x: x['similarity'], reverse=True)
-                memories = [item['memory'] for item in memory_similarities[:limit]]
-            
-            # Format results
-            result_memories = []
-            for memory in memories:
-                try:
-                    metadata = json.loads(memory['metadata']) if memory['metadata'] else {}
-                    result_memories.append({
-                        'content': memory['content'],
-                        'metadata': metadata,
-                        'created_at': memory['created_at'],
-                        'updated_at': memory.get('updated_at', memory['created_at']),
-                        'relevance_score': getattr(memory, 'similarity', 0.0)
-                    })
-                except Exception as e:
-                    logger.warning(f"Error formatting memory: {e}")
-                    continue
-            
-            logger.info(f"Retrieved {len(result_memories)} memories for query: {query[:50]}")
-            return result_memories
+        
+        logger.info(f"Retrieved {len(result_memories)} hybrid memories for query: {query[:50]}")
+        return result_memories
             
     except Exception as e:
-        logger.error(f"Error retrieving vector memories: {e}")
+        logger.error(f"Error retrieving hybrid memories: {e}")
         return []
 
+def interaction_slot_id(user_id: str, slot: int) -> uuid.UUID:
+    """Stable user_memories id of one slot in a user's interaction ring."""
+    return uuid.uuid5(INTERACTION_RING_NAMESPACE, f"{user_id}/{slot}")
+
 async def update_user_context_vector(
     pool: asyncpg.Pool,
     user_id: str,
     user_message: str,
     ai_response: str,
-    conversation_id: str = None
+    conversation_id: str = None,
+    raise_errors: bool = False,
+    interaction_id: Optional[str] = None
 ):
-    """Update user context with the latest interaction using proper error handling."""
+    """
+    Update user context with the latest interaction (errors are logged unless `raise_errors`).
+
+    With `interaction_id`, running it again for the same interaction is a no-op,
+    as long as that interaction is still in the ring.
+    """
     try:
         # Create interaction summary
         interaction_content = f"User said: {user_message[:100]} | AI responded about: {ai_response[:50]}"
         
         # Create embedding for the interaction
-        embedding = embedding_model.encode(interaction_content)
+        embedding = await embed_text(interaction_content)
         
         # Create metadata for the interaction
         metadata = {
@@ -236,48 +569,75 @@ async def update_user_context_vector(
             'ai_response_length': len(ai_response),
             'temp_id': str(uuid.uuid4())
         }
+        if interaction_id:
+            metadata['interaction_id'] = interaction_id
+        
+        created_at = datetime.utcnow()
         
         async with pool.acquire() as conn:
-            try:
-                # Try vector storage first
-                await conn.execute(
-                    """INSERT INTO user_memories 
-                    (id, user_id, conversation_id, content, embedding, metadata, created_at, updated_at) 
-                    VALUES ($1, $2, $3, $4, $5, $6, $7, $7)""",
-                    uuid.uuid4(),
-                    user_id,
-                    uuid.UUID(conversation_id) if conversation_id else None,
-                    interaction_content,
-                    embedding.tolist(),
-                    json.dumps(metadata),
-                    datetime.utcnow()
+            column_type = await get_embedding_column_type(conn)
+            async with conn.transaction():
+                # Lock the user's ring head (creating it before the first write), so a
+                # replay of this job cannot pass the check below at the same time
+                created = await conn.fetchval(
+                    """INSERT INTO interaction_ring (user_id, position) VALUES ($1, -1)
+                       ON CONFLICT (user_id) DO NOTHING
+                       RETURNING TRUE""",
+                    user_id
                 )
-            except Exception as vector_error:
-                # Fallback to JSON string storage
-                await conn.execute(
+                await conn.execute("SELECT 1 FROM interaction_ring WHERE user_id = $1 FOR UPDATE", user_id)
+                if interaction_id and await conn.fetchval(
+                    """SELECT EXISTS (
+                           SELECT 1 FROM user_memories
+                           WHERE user_id = $1 AND metadata->>'type' = 'interaction'
+                             AND metadata->>'interaction_id' = $2
+                       )""",
+                    user_id, interaction_id
+                ):
+                    logger.info(f"Interaction {interaction_id} already recorded for user {user_id}; skipping.")
+                    return
+                # Advance the ring head; the slot decides which row is overwritten
+                position = await conn.fetchval(
+                    "UPDATE interaction_ring SET position = position + 1 WHERE user_id = $1 RETURNING position",
+                    user_id
+                )
+                memory_id = interaction_slot_id(user_id, position % INTERACTION_RING_SIZE)
+                replaced = await conn.fetchval(
                     """INSERT INTO user_memories 
                     (id, user_id, conversation_id, content, embedding, metadata, created_at, updated_at) 
-                    VALUES ($1, $2, $3, $4, $5, $6, $7, $7)""",
-                    uuid.uuid4(),
+                    VALUES ($1, $2, $3, $4, $5, $6, $7, $7)
+                    ON CONFLICT (id) DO UPDATE SET
+                        conversation_id = EXCLUDED.conversation_id,
+                        content = EXCLUDED.content,
+                        embedding = EXCLUDED.embedding,
+                        metadata = EXCLUDED.metadata,
+                        created_at = EXCLUDED.created_at,
+                        updated_at = EXCLUDED.updated_at
+                    RETURNING xmax <> 0""",
+                    memory_id,
                     user_id,
                     uuid.UUID(conversation_id) if conversation_id else None,
                     interaction_content,
-                    json.dumps(embedding.tolist()),
+                    encode_embedding_for_column(embedding, column_type),
                     json.dumps(metadata),
-                    datetime.utcnow()
+                    created_at
                 )
-            
-            # Clean up old interaction memories (keep only last 20)
-            await conn.execute(
-                """DELETE FROM user_memories 
-                WHERE user_id = $1 AND metadata->>'type' = 'interaction' 
-                AND id NOT IN (
-                    SELECT id FROM user_memories 
-                    WHERE user_id = $1 AND metadata->>'type' = 'interaction' 
-                    ORDER BY created_at DESC LIMIT 20
-                )""",
-                user_id
-            )
+                
+                legacy = []
+                if created:
+                    # First ring write for this user: drop interactions stored before the ring existed
+                    legacy = await conn.fetch(
+                        """DELETE FROM user_memories 
+                        WHERE user_id = $1 AND metadata->>'type' = 'interaction' AND id <> $2
+                        RETURNING id""",
+                        user_id, memory_id
+                    )
+        
+        if replaced or legacy:
+            memory_cache.remove(user_id, [memory_id] + [row['id'] for row in legacy])
+        memory_cache.append(user_id, memory_id, embedding, interaction_content, metadata, created_at)
             
     except Exception as e:
-        logger.error(f"Error updating user context: {e}")
\ No newline at end of file
+        logger.error(f"Error updating user context: {e}")
+        if raise_errors:
+            raise
\ No newline at end of file
@@ -0,0 +1,232 @@
+import asyncio
+import asyncpg
+import json
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+from .config import (
+    logger,
+    WRITE_BEHIND_CONCURRENCY,
+    WRITE_BEHIND_QUEUE_MAX_DEPTH,
+    WRITE_BEHIND_MAX_ATTEMPTS,
+    WRITE_BEHIND_RETRY_BASE_SECONDS,
+    WRITE_BEHIND_LEASE_SECONDS,
+    WRITE_BEHIND_POLL_INTERVAL_SECONDS,
+    WRITE_BEHIND_DRAIN_TIMEOUT_SECONDS
+)
+from .metrics import register_metrics_source
+
+JobHandler = Callable[[asyncpg.Pool, Dict[str, Any]], Awaitable[None]]
+
+class WriteBehindQueue:
+    """
+    Runs work that does not shape a response after the response is sent.
+
+    Every job is written to the chat_outbox table before it is queued, so a
+    crash loses nothing: rows whose lease expires are claimed again by the
+    poller (FOR UPDATE SKIP LOCKED, so several processes can share the
+    outbox). A bounded pool of workers runs handlers; failures are retried
+    with exponential backoff and left in the outbox after the last attempt.
+    Handlers must be idempotent.
+    """
+
+    def __init__(self, concurrency: int, max_queue_depth: int, max_attempts: int):
+        self.concurrency = concurrency
+        self.max_queue_depth = max_queue_depth
+        self.max_attempts = max_attempts
+        self._handlers: Dict[str, JobHandler] = {}
+        self._pool: Optional[asyncpg.Pool] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._poller: Optional[asyncio.Task] = None
+        # Job id -> enqueue time (epoch seconds) for every job queued or running here
+        self._pending: Dict[uuid.UUID, float] = {}
+        self.enqueued = 0
+        self.completed = 0
+        self.retries = 0
+        self.dead_lettered = 0
+        self.recovered = 0
+        self.last_lag_seconds = 0.0
+        self.max_lag_seconds = 0.0
+
+    def register_handler(self, kind: str, handler: JobHandler):
+        self._handlers[kind] = handler
+
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+
+    def start(self, pool: asyncpg.Pool):
+        if self.running:
+            return
+        self._pool = pool
+        self._queue = asyncio.Queue(maxsize=self.max_queue_depth)
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self.concurrency)]
+        self._poller = asyncio.create_task(self._poll())
+        logger.info(f"Write-behind queue started with {self.concurrency} workers.")
+
+    async def stop(self, timeout: float = WRITE_BEHIND_DRAIN_TIMEOUT_SECONDS):
+        """Stop claiming new rows, let queued jobs finish (up to `timeout`), then stop the workers."""
+        if not self.running:
+            return
+        self._poller.cancel()
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+            logger.info("Write-behind queue drained.")
+        except asyncio.TimeoutError:
+            logger.warning(
+                f"Write-behind drain timed out; {len(self._pending)} jobs stay in the outbox for the next start."
+            )
+        for task in self._workers + [self._poller]:
+            task.cancel()
+        await asyncio.gather(*self._workers, self._poller, return_exceptions=True)
+        self._workers = []
+        self._poller = None
+
+    async def enqueue(self, pool: asyncpg.Pool, jobs: Sequence[Tuple[str, Dict[str, Any]]]):
+        """Durably record jobs and queue them; runs them inline when the queue is not started."""
+        if not self.running:
+            for kind, payload in jobs:
+                await self._handlers[kind](pool, payload)
+            return
+
+        enqueued_at = time.time()
+        created_at = datetime.utcnow()
+        records = [(uuid.uuid4(), kind, payload) for kind, payload in jobs]
+        # Jobs this process runs right away are leased so the poller leaves them alone;
+        # when the in-memory queue is full they are left for the poller instead
+        leased = self._queue.qsize() + len(records) <= self.max_queue_depth
+        available_at = created_at + timedelta(seconds=WRITE_BEHIND_LEASE_SECONDS) if leased else created_at
+        async with pool.acquire() as conn:
+            await conn.executemany(
+                """INSERT INTO chat_outbox (id, kind, payload, attempts, available_at, created_at)
+                   VALUES ($1, $2, $3, 0, $4, $5)""",
+                [(job_id, kind, json.dumps(payload), available_at, created_at) for job_id, kind, payload in records]
+            )
+        self.enqueued += len(records)
+        if leased:
+            # The queue may have filled up during the INSERT; what no longer fits
+            # stays in the outbox for the poller rather than failing the turn
+            await self._queue_jobs([(job_id, kind, payload, 0, enqueued_at) for job_id, kind, payload in records])
+
+    async def _queue_jobs(self, jobs: List[Tuple[uuid.UUID, str, Dict[str, Any], int, float]]):
+        """Queue leased jobs (id, kind, payload, attempts, enqueue time); release the leases of those that do not fit."""
+        overflow = []
+        for job_id, kind, payload, attempts, enqueued_at in jobs:
+            if self._queue.full():
+                overflow.append(job_id)
+                continue
+            self._pending[job_id] = enqueued_at
+            self._queue.put_nowait((job_id, kind, payload, attempts))
+        if not overflow:
+            return
+        logger.warning(f"Write-behind queue full; {len(overflow)} jobs left in the outbox for the poller.")
+        try:
+            async with self._pool.acquire() as conn:
+                await conn.execute(
+                    "UPDATE chat_outbox SET available_at = $2 WHERE id = ANY($1::uuid[])",
+                    overflow, datetime.utcnow()
+                )
+        except Exception as e:
+            # The rows are still durable; the poller claims them once their lease expires
+            logger.warning(f"Failed to release write-behind leases: {e}")
+
+    async def _work(self):
+        while True:
+            job_id, kind, payload, attempts = await self._queue.get()
+            try:
+                await self._run_job(job_id, kind, payload, attempts)
+            except Exception as e:
+                logger.error(f"Write-behind bookkeeping for job {job_id} failed: {e}")
+            finally:
+                self._pending.pop(job_id, None)
+                self._queue.task_done()
+
+    async def _run_job(self, job_id: uuid.UUID, kind: str, payload: Dict[str, Any], attempts: int):
+        try:
+            handler = self._handlers.get(kind)
+            if handler is None:
+                raise RuntimeError(f"No write-behind handler registered for '{kind}'")
+            await handler(self._pool, payload)
+        except Exception as e:
+            attempts += 1
+            if attempts >= self.max_attempts:
+                self.dead_lettered += 1
+                logger.error(f"Write-behind job {kind} {job_id} failed permanently after {attempts} attempts: {e}")
+            else:
+                self.retries += 1
+                logger.warning(f"Write-behind job {kind} {job_id} failed (attempt {attempts}), will retry: {e}")
+            retry_at = datetime.utcnow() + timedelta(seconds=WRITE_BEHIND_RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+            async with self._pool.acquire() as conn:
+                await conn.execute(
+                    "UPDATE chat_outbox SET attempts = $2, available_at = $3, last_error = $4 WHERE id = $1",
+                    job_id, attempts, retry_at, str(e)[:500]
+                )
+            return
+
+        self.completed += 1
+        lag = time.time() - self._pending.get(job_id, time.time())
+        self.last_lag_seconds = lag
+        self.max_lag_seconds = max(self.max_lag_seconds, lag)
+        async with self._pool.acquire() as conn:
+            await conn.execute("DELETE FROM chat_outbox WHERE id = $1", job_id)
+
+    async def _poll(self):
+        """Claim due outbox rows: retries, overflow and jobs orphaned by a crash."""
+        while True:
+            try:
+                await self._claim_due_jobs()
+            except Exception as e:
+                logger.warning(f"Write-behind outbox poll failed: {e}")
+            await asyncio.sleep(WRITE_BEHIND_POLL_INTERVAL_SECONDS)
+
+    async def _claim_due_jobs(self):
+        capacity = self.max_queue_depth - self._queue.qsize()
+        if capacity <= 0:
+            return
+        now = datetime.utcnow()
+        async with self._pool.acquire() as conn:
+            rows = await conn.fetch(
+                """UPDATE chat_outbox SET available_at = $1
+                   WHERE id IN (
+                       SELECT id FROM chat_outbox
+                       WHERE available_at <= $2 AND attempts < $3
+                       ORDER BY created_at
+                       LIMIT $4
+                       FOR UPDATE SKIP LOCKED
+                   )
+                   RETURNING id, kind, payload, attempts, created_at""",
+                now + timedelta(seconds=WRITE_BEHIND_LEASE_SECONDS), now, self.max_attempts, capacity
+            )
+        for row in rows:
+            if row['attempts'] == 0:
+                self.recovered += 1
+        # Capacity was checked before the claim; enqueue() may have filled the queue since
+        await self._queue_jobs([
+            (row['id'], row['kind'], json.loads(row['payload']), row['attempts'], row['created_at'].timestamp())
+            for row in rows
+        ])
+
+    def stats(self) -> Dict[str, Any]:
+        oldest = min(self._pending.values(), default=None)
+        return {
+            "running": self.running,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "pending": len(self._pending),
+            "lag_seconds": round(time.time() - oldest, 3) if oldest is not None else 0.0,
+            "last_lag_seconds": round(self.last_lag_seconds, 3),
+            "max_lag_seconds": round(self.max_lag_seconds, 3),
+            "enqueued": self.enqueued,
+            "completed": self.completed,
+            "retries": self.retries,
+            "dead_lettered": self.dead_lettered,
+            "recovered": self.recovered
+        }
+
+write_behind = WriteBehindQueue(
+    concurrency=WRITE_BEHIND_CONCURRENCY,
+    max_queue_depth=WRITE_BEHIND_QUEUE_MAX_DEPTH,
+    max_attempts=WRITE_BEHIND_MAX_ATTEMPTS
+)
+register_metrics_source("write_behind", write_behind.stats)
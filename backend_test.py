@@ -237,6 +237,30 @@ class CalmiAPITester:
             self.log_result("Send Chat Message", False, f"Exception: {str(e)}")
         return False
 
+    def test_send_chat_message_unknown_conversation(self):
+        """Test POST /api/chat/send with a conversation id that does not exist"""
+        # Make sure we have authentication
+        if not self.auth_token:
+            self.log_result("Send Chat To Unknown Conversation", False, "No authentication token available")
+            return False
+            
+        try:
+            payload = {
+                "message": "Are you still there? I wanted to continue our talk.",
+                "conversation_id": str(uuid.uuid4())
+            }
+            response = requests.post(f"{self.base_url}/chat/send", 
+                                   json=payload, headers=self.headers, timeout=30)
+            
+            if response.status_code == 404:
+                self.log_result("Send Chat To Unknown Conversation", True, "Correctly returned 404")
+                return True
+            else:
+                self.log_result("Send Chat To Unknown Conversation", False, f"Expected 404, got {response.status_code}", response)
+        except Exception as e:
+            self.log_result("Send Chat To Unknown Conversation", False, f"Exception: {str(e)}")
+        return False
+
     def test_get_conversations(self):
         """Test GET /api/chat/conversations"""
         # Make sure we have authentication
@@ -289,6 +313,26 @@ class CalmiAPITester:
             self.log_result("Get Conversation History", False, f"Exception: {str(e)}")
         return False
 
+    def test_get_conversation_title_malformed_id(self):
+        """Test GET /api/chat/conversations/{id}/title with an id that is not a UUID"""
+        # Make sure we have authentication
+        if not self.auth_token:
+            self.log_result("Get Title For Malformed Conversation ID", False, "No authentication token available")
+            return False
+            
+        try:
+            response = requests.get(f"{self.base_url}/chat/conversations/not-a-uuid/title", 
+                                  headers=self.headers, timeout=10)
+            
+            if response.status_code == 404:
+                self.log_result("Get Title For Malformed Conversation ID", True, "Correctly returned 404")
+                return True
+            else:
+                self.log_result("Get Title For Malformed Conversation ID", False, f"Expected 404, got {response.status_code}", response)
+        except Exception as e:
+            self.log_result("Get Title For Malformed Conversation ID", False, f"Exception: {str(e)}")
+        return False
+
     def test_status_endpoints(self):
         """Test POST /api/status and GET /api/status"""
         # Test POST /api/status
@@ -398,8 +442,10 @@ class CalmiAPITester:
         print("💬 TESTING CHAT FUNCTIONALITY")
         print("-" * 30)
         self.test_send_chat_message()
+        self.test_send_chat_message_unknown_conversation()
         self.test_get_conversations()
         self.test_get_conversation_history()
+        self.test_get_conversation_title_malformed_id()
 
         # Status endpoints tests
         print("📊 TESTING STATUS ENDPOINTS")
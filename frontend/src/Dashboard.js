@@ -123,6 +123,24 @@ const Dashboard = () => {
         }
     };
 
+    // New conversations start with a placeholder title; pick up the generated one when it lands
+    const pollConversationTitle = async (conversationId, token, attempts = 5) => {
+        for (let attempt = 0; attempt < attempts; attempt++) {
+            await new Promise(resolve => setTimeout(resolve, 2000));
+            try {
+                const response = await fetch(`${API}/chat/conversations/${conversationId}/title`, { headers: { 'Authorization': `Bearer ${token}` } });
+                if (!response.ok) return;
+                const data = await response.json();
+                if (!data.provisional) {
+                    setConversations(prev => prev.map(conv => conv.id === conversationId ? { ...conv, title: data.title, title_provisional: false } : conv));
+                    return;
+                }
+            } catch (error) {
+                return;
+            }
+        }
+    };
+
     const handleSendMessage = async () => {
         if (!inputMessage.trim()) return;
         const token = getToken();
@@ -152,6 +170,7 @@ const Dashboard = () => {
                 const convResponse = await fetch(`${API}/chat/conversations`, { headers: { 'Authorization': `Bearer ${token}` } });
                 const convData = await convResponse.json();
                 setConversations(convData);
+                pollConversationTitle(data.conversation_id, token);
             }
         } catch (error) {
             console.error("Error sending message:", error);